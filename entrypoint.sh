@@ -9,7 +9,7 @@ echo ""
 
 if [ $# -eq 0 ]; then
     echo "Processing the Death on Shishapangma article..."
-    python process_text.py
+    python tts_cli.py single
     echo ""
     echo "Audio files generated in /workspace/output/"
     ls -la /workspace/output/
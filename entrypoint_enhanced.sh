@@ -33,7 +33,7 @@ echo "Starting enhanced text-to-speech processing..."
 cd /workspace
 
 if [ -f "process_text_enhanced.py" ]; then
-    python process_text_enhanced.py
+    python tts_cli.py enhanced
 else
     echo "Enhanced script not found, using standard script..."
     python process_text.py
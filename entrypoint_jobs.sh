@@ -0,0 +1,14 @@
+#!/bin/bash
+set -e
+
+JOBS_FILE="${1:-/workspace/jobs.jsonl}"
+
+echo "Starting Chatterbox TTS batch jobs from $JOBS_FILE..."
+if [ ! -f "$JOBS_FILE" ]; then
+    echo "Jobs file not found: $JOBS_FILE"
+    exit 1
+fi
+
+python3 /workspace/process_jobs.py "$JOBS_FILE"
+
+echo "Batch complete! Check /workspace/output/jobs/ for results."
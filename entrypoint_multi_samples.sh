@@ -14,6 +14,6 @@ echo "Found audio samples:"
 ls -la /workspace/audio_samples/
 
 echo "Starting processing with multiple audio samples..."
-python3 /workspace/process_text_multi_samples.py
+python3 /workspace/tts_cli.py multi ${TTS_DRY_RUN:+--dry-run} || exit 1
 
 echo "Processing complete! Check /workspace/output/ for results organized by sample name."
\ No newline at end of file
@@ -0,0 +1,7 @@
+#!/bin/bash
+set -e
+
+echo "Starting Chatterbox TTS HTTP service..."
+mkdir -p /workspace/output
+
+python3 /workspace/tts_server.py
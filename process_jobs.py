@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import torch
+import torchaudio as ta
+
+from tts_config import (
+    SEED, TTS_PARAMS, VOICE_CACHE, get_audio_samples, prepare_reference_audio,
+)
+from tts_text import clean_text_for_tts
+from tts_output import StreamingWavWriter
+from tts_models import load_model
+from tts_metrics import RunMetrics
+
+DEFAULT_JOBS_FILE = "/workspace/jobs.jsonl"
+JOBS_OUTPUT_DIR = "/workspace/output/jobs"
+
+
+def iter_jobs(jobs_file):
+    """Yield (line number, job dict) from a JSONL file one line at a time"""
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_no}: invalid JSON ({e})")
+
+
+def resolve_voice(voice):
+    """Return the sample path for a voice given as a path or an audio_samples file stem"""
+    if not voice:
+        return None
+    if os.path.exists(voice):
+        return voice
+    for sample_path in get_audio_samples():
+        if Path(sample_path).stem == voice:
+            return sample_path
+    raise ValueError(f"voice not found: {voice}")
+
+
+def job_output_dir(name):
+    """Output directory of a job; the name must be a single path component inside JOBS_OUTPUT_DIR"""
+    if not isinstance(name, str) or not re.fullmatch(r'[\w.-]+', name) or name in ('.', '..'):
+        raise ValueError(f"invalid output name {name!r}: use letters, digits, '_', '-' and '.'")
+    root = Path(JOBS_OUTPUT_DIR).resolve()
+    job_dir = (root / name).resolve()
+    if job_dir.parent != root:
+        raise ValueError(f"output name {name!r} points outside {JOBS_OUTPUT_DIR}")
+    return job_dir
+
+
+def load_job(job, line_no):
+    """Validate a job and return (name, sentences, voice path, params)"""
+    name = job.get('output_name') or job.get('name') or f"job_{line_no:04d}"
+    job_output_dir(name)
+    if 'text' in job:
+        text = job['text']
+    elif 'text_file' in job:
+        with open(job['text_file'], 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        raise ValueError("job needs 'text' or 'text_file'")
+    params = dict(TTS_PARAMS)
+    for key, value in (job.get('params') or {}).items():
+        if key not in TTS_PARAMS:
+            raise ValueError(f"unknown parameter: {key}")
+        params[key] = float(value)
+    return name, clean_text_for_tts(text), resolve_voice(job.get('voice')), params
+
+
+def job_fingerprint(sentences, voice_path, params):
+    payload = json.dumps({'sentences': sentences, 'voice': voice_path, 'params': params, 'seed': SEED},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def read_manifest(manifest_path, fingerprint):
+    """Return {sentence index: entry} for sentences already checkpointed for this exact job"""
+    done = {}
+    if not manifest_path.exists():
+        return done
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # a torn final line from a crash; everything before it is valid
+            if entry.get('event') == 'start' and entry.get('fingerprint') != fingerprint:
+                return {}  # the job changed since the manifest was written
+            if entry.get('event') == 'sentence':
+                done[entry['index']] = entry
+    return done
+
+
+def append_manifest(manifest_path, entry):
+    """Append one checkpoint line and make sure it reaches the disk"""
+    with open(manifest_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def run_job(get_model, name, sentences, voice_path, params):
+    """Generate one job, resuming from its manifest; returns True when the article is complete"""
+    job_dir = job_output_dir(name)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = job_dir / 'manifest.jsonl'
+    fingerprint = job_fingerprint(sentences, voice_path, params)
+
+    done = read_manifest(manifest_path, fingerprint)
+    done = {i: e for i, e in done.items() if (job_dir / e['file']).exists()}
+    if not done:
+        manifest_path.unlink(missing_ok=True)
+        append_manifest(manifest_path, {'event': 'start', 'fingerprint': fingerprint,
+                                        'sentences': len(sentences), 'voice': voice_path})
+    print(f"Job {name}: {len(sentences)} sentences, {len(done)} already done")
+
+    remaining = [i for i in range(len(sentences)) if i not in done]
+    if remaining:
+        model = get_model()
+        reference_audio = prepare_reference_audio(voice_path) if voice_path else None
+        VOICE_CACHE.apply(model, reference_audio, params['exaggeration'])
+        metrics = getattr(model, 'metrics', None)
+        if metrics is not None:
+            metrics.voice = Path(voice_path).stem if voice_path else 'default'
+            metrics.params = dict(params, job=name)
+        for i in remaining:
+            print(f"[{name}] Processing sentence {i+1}/{len(sentences)}: {sentences[i][:60]}...")
+            try:
+                if SEED is not None:
+                    torch.manual_seed(SEED)
+                wav = model.generate(sentences[i], **params)
+                file_name = f'sentence_{i+1:03d}.wav'
+                tmp_path = job_dir / f'.{file_name}.tmp'
+                write_start = time.perf_counter()
+                ta.save(str(tmp_path), wav, model.sr, format='wav')
+                os.replace(tmp_path, job_dir / file_name)
+                if metrics is not None:
+                    metrics.record_write(job_dir / file_name, time.perf_counter() - write_start)
+                append_manifest(manifest_path, {'event': 'sentence', 'index': i, 'file': file_name,
+                                                'duration': wav.shape[-1] / model.sr})
+                done[i] = {'file': file_name}
+            except Exception as e:
+                print(f"[{name}] Error processing sentence {i+1}: {e}")
+
+    if len(done) < len(sentences):
+        print(f"Job {name}: {len(done)}/{len(sentences)} sentences done; rerun to retry the rest")
+        return False
+
+    complete_output_path = job_dir / 'complete_article.wav'
+    complete_writer = None
+    for i in range(len(sentences)):
+        wav, sr = ta.load(str(job_dir / done[i]['file']))
+        if complete_writer is None:
+            complete_writer = StreamingWavWriter(complete_output_path, sr)
+        complete_writer.append(wav, index=i, text=sentences[i])
+    complete_writer.close()
+    complete_writer.write_index()
+    append_manifest(manifest_path, {'event': 'complete', 'file': Path(complete_writer.path).name,
+                                    'duration': complete_writer.duration})
+    print(f"Job {name}: complete audio saved to {complete_writer.path} ({complete_writer.duration:.1f}s)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run TTS jobs from a JSONL file, resuming from checkpoints.")
+    parser.add_argument('jobs_file', nargs='?', default=DEFAULT_JOBS_FILE,
+                        help="JSONL with one job per line: text or text_file, voice, params, output_name")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.jobs_file):
+        print(f"Jobs file not found: {args.jobs_file}")
+        return
+
+    model_holder = {}
+
+    def get_model():
+        # Loaded on first use, so a fully resumed batch never pays the model load
+        if 'model' not in model_holder:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            print(f"Loading Chatterbox TTS model on {device}...")
+            model_holder['model'] = load_model(device)
+            model_holder['metrics'] = RunMetrics('jobs')
+            model_holder['metrics'].attach(model_holder['model'])
+        return model_holder['model']
+
+    completed = failed = 0
+    for line_no, job in iter_jobs(args.jobs_file):
+        try:
+            name, sentences, voice_path, params = load_job(job, line_no)
+            if not sentences:
+                print(f"Job on line {line_no} has no speakable text; skipping")
+                failed += 1
+                continue
+            if run_job(get_model, name, sentences, voice_path, params):
+                completed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"Job on line {line_no} failed: {e}")
+            failed += 1
+
+    print(f"\nBatch finished: {completed} jobs complete, {failed} incomplete or failed")
+    if model_holder.get('model') is not None and model_holder['model'].guard is not None:
+        print(model_holder['model'].guard.report())
+    if model_holder.get('metrics') is not None:
+        model_holder['metrics'].finish(jobs_complete=completed, jobs_failed=failed)
+
+
+if __name__ == "__main__":
+    main()
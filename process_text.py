@@ -1,73 +1,76 @@
-import torchaudio as ta
-from chatterbox.tts import ChatterboxTTS
 import torch
 import os
-import re
+from tts_text import clean_text_for_tts, limit_sentences
+from tts_batching import generate_batched, BATCH_SIZE
+from tts_output import StreamingWavWriter, AsyncAudioWriter, SENTENCE_FILES
+from tts_models import load_model
+from tts_metrics import RunMetrics
 
-def clean_text_for_tts(text):
-    """Clean and prepare text for TTS processing"""
-    # Remove markdown headers
-    text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
-    
-    # Remove extra whitespace and newlines
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Split into sentences for better processing
-    sentences = re.split(r'[.!?]+', text)
-    
-    # Clean and filter sentences
-    cleaned_sentences = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence and len(sentence) > 10:  # Skip very short fragments
-            cleaned_sentences.append(sentence + '.')
+def process_long_text(sentences=None):
+    """Synthesize the article; ``sentences`` may be passed in already segmented (see tts_cli)"""
+    if sentences is None:
+        # Read the input text
+        with open('/workspace/text_input.txt', 'r', encoding='utf-8') as f:
+            full_text = f.read()
+        
+        print(f"Processing text of {len(full_text)} characters...")
+        
+        # Clean and split the text
+        sentences = clean_text_for_tts(full_text)
+        print(f"Split into {len(sentences)} sentences")
     
-    return cleaned_sentences
-
-def process_long_text():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
     
-    # Load the model
+    # Load the model once the input is known to be usable
     print("Loading Chatterbox TTS model...")
-    model = ChatterboxTTS.from_pretrained(device=device)
-    
-    # Read the input text
-    with open('/workspace/text_input.txt', 'r', encoding='utf-8') as f:
-        full_text = f.read()
+    model = load_model(device)
+    guard = model.guard
+    metrics = RunMetrics('process_text')
+    metrics.attach(model)
     
-    print(f"Processing text of {len(full_text)} characters...")
+    # Process each sentence, streaming it into the complete article as it is generated
+    complete_output_path = '/workspace/output/complete_article.wav'
+    complete_writer = StreamingWavWriter(complete_output_path, model.sr)
     
-    # Clean and split the text
-    sentences = clean_text_for_tts(full_text)
-    print(f"Split into {len(sentences)} sentences")
+    selected = limit_sentences(sentences)
+    print(f"Generating {len(selected)} sentences (batch size {BATCH_SIZE})...")
     
-    # Process each sentence
-    all_audio = []
-    
-    for i, sentence in enumerate(sentences[:25]):  # Process first 25 sentences
-        print(f"Processing sentence {i+1}/{min(25, len(sentences))}: {sentence[:60]}...")
+    # Sentence files are saved on background threads while the next sentence generates
+    with AsyncAudioWriter(metrics=metrics) as sentence_writer:
+        for i, wav in generate_batched(model, selected, BATCH_SIZE):
+            print(f"Processing sentence {i+1}/{len(selected)}: {selected[i][:60]}...")
+            if isinstance(wav, Exception):
+                print(f"Error processing sentence {i+1}: {wav}")
+                continue
         
-        try:
-            wav = model.generate(sentence)
-            all_audio.append(wav)
+            try:
+                complete_writer.append(wav, index=i, text=selected[i])
             
-            # Save individual sentence
-            output_path = f'/workspace/output/sentence_{i+1:03d}.wav'
-            ta.save(output_path, wav, model.sr)
+                # Save individual sentence (optional; the offset index locates it in the article)
+                if SENTENCE_FILES:
+                    output_path = f'/workspace/output/sentence_{i+1:03d}.wav'
+                    sentence_writer.submit(output_path, wav, model.sr)
             
-        except Exception as e:
-            print(f"Error processing sentence {i+1}: {e}")
-            continue
+            except Exception as e:
+                print(f"Error processing sentence {i+1}: {e}")
+                continue
+    
+    for failed_path, error in sentence_writer.errors:
+        print(f"Failed to write {failed_path}: {error}")
     
-    # Concatenate all audio
-    if all_audio:
-        print("Concatenating all audio segments...")
-        combined_audio = torch.cat(all_audio, dim=-1)
-        ta.save('/workspace/output/complete_article.wav', combined_audio, model.sr)
-        print(f"Complete audio saved to /workspace/output/complete_article.wav")
-        print(f"Duration: approximately {combined_audio.shape[-1] / model.sr:.1f} seconds")
+    # Finalize the complete article (patches the WAV header or flushes the encoder)
+    complete_writer.close()
+    if complete_writer.segments:
+        print(f"Complete audio saved to {complete_writer.path}")
+        print(f"Sentence offsets saved to {complete_writer.write_index()}")
+        print(f"Duration: approximately {complete_writer.duration:.1f} seconds")
+    else:
+        os.remove(complete_writer.path)
     
+    if guard is not None:
+        print(guard.report())
+    metrics.finish(sentences=complete_writer.segments, audio_s=complete_writer.duration)
     print("Text processing complete!")
     print("Generated files:")
     import subprocess
@@ -1,148 +1,109 @@
-import torchaudio as ta
-from chatterbox.tts import ChatterboxTTS
 import torch
 import os
-import re
-import librosa
-import numpy as np
+from tts_text import clean_text_for_tts, limit_sentences
+from tts_config import TTS_PARAMS, VOICE_CACHE, prepare_reference_audio
+from tts_output import StreamingWavWriter, AsyncAudioWriter, SENTENCE_FILES
+from tts_cli import find_reference
+from tts_models import load_model
+from tts_metrics import RunMetrics
 
-def clean_text_for_tts(text):
-    """Clean and prepare text for TTS processing"""
-    # Remove markdown headers
-    text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
-    
-    # Remove extra whitespace and newlines
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Split into sentences for better processing
-    sentences = re.split(r'[.!?]+', text)
-    
-    # Clean and filter sentences
-    cleaned_sentences = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence and len(sentence) > 10:  # Skip very short fragments
-            cleaned_sentences.append(sentence + '.')
-    
-    return cleaned_sentences
+def process_long_text_enhanced(sentences=None, reference_path=None):
+    """Synthesize the article in a cloned voice.
 
-def prepare_reference_audio(audio_path, target_sr=24000, max_duration=10.0):
-    """Prepare reference audio for voice cloning"""
-    if not os.path.exists(audio_path):
-        print(f"Reference audio file not found: {audio_path}")
-        return None
-    
-    print(f"Processing reference audio: {audio_path}")
-    
-    # Load audio
-    audio, sr = librosa.load(audio_path, sr=None)
-    
-    # Trim silence from beginning and end
-    audio_trimmed, _ = librosa.effects.trim(audio, top_db=20)
-    
-    # Limit duration to max_duration seconds for better voice cloning
-    max_samples = int(max_duration * sr)
-    if len(audio_trimmed) > max_samples:
-        audio_trimmed = audio_trimmed[:max_samples]
-    
-    # Resample to target sample rate if needed
-    if sr != target_sr:
-        audio_trimmed = librosa.resample(audio_trimmed, orig_sr=sr, target_sr=target_sr)
-    
-    # Convert to tensor and save processed version
-    processed_path = "/workspace/reference_processed.wav"
-    ta.save(processed_path, torch.from_numpy(audio_trimmed).unsqueeze(0), target_sr)
-    
-    print(f"Reference audio processed and saved to: {processed_path}")
-    print(f"Duration: {len(audio_trimmed) / target_sr:.2f} seconds")
-    
-    return processed_path
-
-def process_long_text_enhanced():
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Using device: {device}")
-    
-    # Load the model
-    print("Loading Chatterbox TTS model...")
-    model = ChatterboxTTS.from_pretrained(device=device)
+    ``sentences`` and ``reference_path`` may be passed in already validated
+    (see tts_cli); otherwise the text file is read and the usual reference
+    file names are searched.
+    """
+    if sentences is None:
+        # Read the input text
+        with open('/workspace/text_input.txt', 'r', encoding='utf-8') as f:
+            full_text = f.read()
+        
+        print(f"Processing text of {len(full_text)} characters...")
+        
+        # Clean and split the text
+        sentences = clean_text_for_tts(full_text)
+        print(f"Split into {len(sentences)} sentences")
+        reference_path = find_reference()
     
     # Check for reference audio
-    reference_audio_path = None
-    possible_ref_paths = [
-        "/workspace/reference.wav",
-        "/workspace/reference.mp3", 
-        "/workspace/reference.m4a",
-        "/workspace/reference_audio.wav",
-        "/workspace/voice_sample.wav"
-    ]
-    
-    for path in possible_ref_paths:
-        if os.path.exists(path):
-            reference_audio_path = prepare_reference_audio(path)
-            break
-    
-    if reference_audio_path:
-        print(f"Using reference audio for voice cloning: {reference_audio_path}")
+    reference_audio = None
+    reference_source = None
+    if reference_path:
+        reference_audio = prepare_reference_audio(reference_path)
+        reference_source = reference_path
+    
+    if reference_audio is not None:
+        print(f"Using reference audio for voice cloning: {reference_source}")
     else:
         print("No reference audio found. Using default voice.")
         print("To use voice cloning, place your reference audio file as 'reference.wav' in the workspace.")
     
-    # Read the input text
-    with open('/workspace/text_input.txt', 'r', encoding='utf-8') as f:
-        full_text = f.read()
-    
-    print(f"Processing text of {len(full_text)} characters...")
-    
-    # Clean and split the text
-    sentences = clean_text_for_tts(full_text)
-    print(f"Split into {len(sentences)} sentences")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Using device: {device}")
     
-    # Enhanced TTS parameters for more realistic speech
-    tts_params = {
-        'repetition_penalty': 1.1,  # Reduce repetitive patterns
-        'min_p': 0.02,             # Lower for more natural variation
-        'top_p': 0.95,             # Slightly reduce for consistency
-        'temperature': 0.7,        # Lower for more stable speech
-        'exaggeration': 0.3,       # Lower for more natural prosody
-        'cfg_weight': 0.7,         # Higher for better quality
-        'audio_prompt_path': reference_audio_path  # Voice cloning
-    }
+    # Load the model once the input is known to be usable
+    print("Loading Chatterbox TTS model...")
+    model = load_model(device)
+    guard = model.guard
+    metrics = RunMetrics('process_text_enhanced')
+    metrics.attach(model)
     
     print("TTS Parameters:")
-    for key, value in tts_params.items():
+    for key, value in TTS_PARAMS.items():
         if value is not None:
             print(f"  {key}: {value}")
-    
-    # Process each sentence
-    all_audio = []
+    if reference_source:
+        print(f"  reference: {reference_source}")  # Voice cloning
+    
+    # Build the voice conditioning once instead of on every generate() call
+    VOICE_CACHE.apply(model, reference_audio, TTS_PARAMS['exaggeration'])
+    generation_params = dict(TTS_PARAMS)
+    metrics.voice = os.path.basename(reference_source) if reference_source else 'default'
+    metrics.params = generation_params
+    
+    # Process each sentence, streaming it into the complete article as it is generated
+    complete_output_path = '/workspace/output/enhanced_complete_article.wav'
+    complete_writer = StreamingWavWriter(complete_output_path, model.sr)
     successful_generations = 0
     
-    for i, sentence in enumerate(sentences[:25]):  # Process first 25 sentences
-        print(f"Processing sentence {i+1}/{min(25, len(sentences))}: {sentence[:60]}...")
+    # Sentence files are saved on background threads while the next sentence generates
+    with AsyncAudioWriter(metrics=metrics) as sentence_writer:
+        selected = limit_sentences(sentences)
+        for i, sentence in enumerate(selected):
+            print(f"Processing sentence {i+1}/{len(selected)}: {sentence[:60]}...")
         
-        try:
-            # Generate with enhanced parameters
-            wav = model.generate(sentence, **tts_params)
-            all_audio.append(wav)
-            successful_generations += 1
+            try:
+                # Generate with enhanced parameters
+                wav = model.generate(sentence, **generation_params)
+                complete_writer.append(wav, index=i, text=sentence)
+                successful_generations += 1
             
-            # Save individual sentence
-            output_path = f'/workspace/output/enhanced_sentence_{i+1:03d}.wav'
-            ta.save(output_path, wav, model.sr)
+                # Save individual sentence (optional; the offset index locates it in the article)
+                if SENTENCE_FILES:
+                    output_path = f'/workspace/output/enhanced_sentence_{i+1:03d}.wav'
+                    sentence_writer.submit(output_path, wav, model.sr)
             
-        except Exception as e:
-            print(f"Error processing sentence {i+1}: {e}")
-            continue
-    
-    # Concatenate all audio
-    if all_audio:
-        print("Concatenating all audio segments...")
-        combined_audio = torch.cat(all_audio, dim=-1)
-        ta.save('/workspace/output/enhanced_complete_article.wav', combined_audio, model.sr)
-        print(f"Enhanced complete audio saved to /workspace/output/enhanced_complete_article.wav")
-        print(f"Duration: approximately {combined_audio.shape[-1] / model.sr:.1f} seconds")
+            except Exception as e:
+                print(f"Error processing sentence {i+1}: {e}")
+                continue
+    
+    for failed_path, error in sentence_writer.errors:
+        print(f"Failed to write {failed_path}: {error}")
+    
+    # Finalize the complete article (patches the WAV header or flushes the encoder)
+    complete_writer.close()
+    if complete_writer.segments:
+        print(f"Enhanced complete audio saved to {complete_writer.path}")
+        print(f"Sentence offsets saved to {complete_writer.write_index()}")
+        print(f"Duration: approximately {complete_writer.duration:.1f} seconds")
         print(f"Successfully processed {successful_generations} sentences")
+    else:
+        os.remove(complete_writer.path)
     
+    if guard is not None:
+        print(guard.report())
+    metrics.finish(sentences=successful_generations, audio_s=complete_writer.duration)
     print("Enhanced text processing complete!")
     print("Generated files:")
     import subprocess
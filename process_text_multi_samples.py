@@ -1,159 +1,225 @@
 import torchaudio as ta
-from chatterbox.tts import ChatterboxTTS
 import torch
 import os
-import re
-import librosa
-import numpy as np
+from tts_text import clean_text_for_tts, limit_sentences
 from pathlib import Path
+from tts_voice_cache import hash_audio
+from tts_config import SEED, TTS_PARAMS, VOICE_CACHE, get_audio_samples, prepare_reference_audio
+from tts_audio_cache import SentenceAudioCache
+from tts_batching import generate_batched, BATCH_SIZE
+from tts_workers import run_worker_pool, WORKERS
+from tts_output import StreamingWavWriter, AsyncAudioWriter, OUTPUT_FORMAT, SENTENCE_FILES
+from tts_models import load_model
+from tts_metrics import RunMetrics
+from tts_frontend import open_frontend
+from tts_archive import ARCHIVE_ENABLED, ArchiveStore, archive_run
 
-def clean_text_for_tts(text):
-    """Clean and prepare text for TTS processing"""
-    # Remove markdown headers
-    text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
-    
-    # Remove extra whitespace and newlines
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Split into sentences for better processing
-    sentences = re.split(r'[.!?]+', text)
-    
-    # Clean and filter sentences
-    cleaned_sentences = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence and len(sentence) > 10:  # Skip very short fragments
-            cleaned_sentences.append(sentence + '.')
-    
-    return cleaned_sentences
-
-def prepare_reference_audio(audio_path, target_sr=24000, max_duration=10.0):
-    """Prepare reference audio for voice cloning"""
-    if not os.path.exists(audio_path):
-        print(f"Reference audio file not found: {audio_path}")
-        return None
-    
-    print(f"Processing reference audio: {audio_path}")
-    
-    # Load audio
-    audio, sr = librosa.load(audio_path, sr=None)
-    
-    # Trim silence from beginning and end
-    audio_trimmed, _ = librosa.effects.trim(audio, top_db=20)
-    
-    # Limit duration to max_duration seconds for better voice cloning
-    max_samples = int(max_duration * sr)
-    if len(audio_trimmed) > max_samples:
-        audio_trimmed = audio_trimmed[:max_samples]
-    
-    # Resample to target sample rate if needed
-    if sr != target_sr:
-        audio_trimmed = librosa.resample(audio_trimmed, orig_sr=sr, target_sr=target_sr)
-    
-    # Convert to tensor and save processed version
-    processed_path = f"/workspace/reference_processed_{Path(audio_path).stem}.wav"
-    ta.save(processed_path, torch.from_numpy(audio_trimmed).unsqueeze(0), target_sr)
-    
-    print(f"Reference audio processed and saved to: {processed_path}")
-    print(f"Duration: {len(audio_trimmed) / target_sr:.2f} seconds")
-    
-    return processed_path
-
-def get_audio_samples():
-    """Get all audio files from the audio_samples directory"""
-    audio_samples_dir = "/workspace/audio_samples"
-    if not os.path.exists(audio_samples_dir):
-        print(f"Audio samples directory not found: {audio_samples_dir}")
-        return []
-    
-    # Common audio file extensions
-    audio_extensions = {'.wav', '.mp3', '.flac', '.m4a', '.ogg', '.aiff'}
-    
-    audio_files = []
-    for file_path in Path(audio_samples_dir).iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in audio_extensions:
-            audio_files.append(str(file_path))
-    
-    return sorted(audio_files)
-
-def process_with_audio_sample(model, sentences, sample_path, sample_name):
+def process_with_audio_sample(model, sentences, sample_path, sample_name, sentence_cache=None):
     """Process text with a specific audio sample as reference"""
     print(f"\n{'='*60}")
     print(f"Processing with audio sample: {sample_name}")
     print(f"{'='*60}")
     
     # Prepare the reference audio
-    reference_audio_path = prepare_reference_audio(sample_path)
-    if not reference_audio_path:
+    reference_audio = prepare_reference_audio(sample_path)
+    if reference_audio is None:
         print(f"Failed to process reference audio: {sample_path}")
         return False
     
-    # Enhanced TTS parameters for more realistic speech
-    tts_params = {
-        'repetition_penalty': 1.1,  # Reduce repetitive patterns
-        'min_p': 0.02,             # Lower for more natural variation
-        'top_p': 0.95,             # Slightly reduce for consistency
-        'temperature': 0.7,        # Lower for more stable speech
-        'exaggeration': 0.3,       # Lower for more natural prosody
-        'cfg_weight': 0.7,         # Higher for better quality
-        'audio_prompt_path': reference_audio_path  # Voice cloning
-    }
+    tts_params = dict(TTS_PARAMS, reference=sample_path)  # Voice cloning
     
     print("TTS Parameters:")
     for key, value in tts_params.items():
         if value is not None:
             print(f"  {key}: {value}")
     
+    # Build the voice conditioning once instead of on every generate() call
+    VOICE_CACHE.apply(model, reference_audio, tts_params['exaggeration'])
+    generation_params = dict(TTS_PARAMS)
+    ref_hash = hash_audio(reference_audio)
+    metrics = getattr(model, 'metrics', None)
+    if metrics is not None:
+        metrics.voice = sample_name
+        metrics.params = generation_params
+    
     # Create output directory for this sample
     output_dir = f"/workspace/output/{sample_name}"
     os.makedirs(output_dir, exist_ok=True)
     
-    # Process each sentence
-    all_audio = []
+    # Process each sentence, streaming it into the complete article as it is generated
+    complete_output_path = f'{output_dir}/complete_article.wav'
+    complete_writer = StreamingWavWriter(complete_output_path, model.sr)
     successful_generations = 0
     
-    for i, sentence in enumerate(sentences[:25]):  # Process first 25 sentences
-        print(f"Processing sentence {i+1}/{min(25, len(sentences))}: {sentence[:60]}...")
+    selected = limit_sentences(sentences)
+    print(f"Generating {len(selected)} sentences (batch size {BATCH_SIZE})...")
+    
+    # Sentence files are saved on background threads while the next sentence generates
+    with AsyncAudioWriter(metrics=metrics) as sentence_writer:
+        # Cached sentences are served first; the rest are generated in length-sorted batches
+        results = generate_batched(model, selected, BATCH_SIZE, cache=sentence_cache,
+                                   ref_hash=ref_hash, seed=SEED, **generation_params)
+        for i, wav in results:
+            print(f"Processing sentence {i+1}/{len(selected)}: {selected[i][:60]}...")
+            if isinstance(wav, Exception):
+                print(f"Error processing sentence {i+1}: {wav}")
+                continue
         
-        try:
-            # Generate with enhanced parameters
-            wav = model.generate(sentence, **tts_params)
-            all_audio.append(wav)
-            successful_generations += 1
+            try:
+                complete_writer.append(wav, index=i, text=selected[i])
+                successful_generations += 1
             
-            # Save individual sentence
-            output_path = f'{output_dir}/sentence_{i+1:03d}.wav'
-            ta.save(output_path, wav, model.sr)
+                # Save individual sentence (optional; the offset index locates it in the article)
+                if SENTENCE_FILES:
+                    output_path = f'{output_dir}/sentence_{i+1:03d}.wav'
+                    sentence_writer.submit(output_path, wav, model.sr)
             
-        except Exception as e:
-            print(f"Error processing sentence {i+1}: {e}")
-            continue
+            except Exception as e:
+                print(f"Error processing sentence {i+1}: {e}")
+                continue
     
-    # Concatenate all audio
-    if all_audio:
-        print("Concatenating all audio segments...")
-        combined_audio = torch.cat(all_audio, dim=-1)
-        complete_output_path = f'{output_dir}/complete_article.wav'
-        ta.save(complete_output_path, combined_audio, model.sr)
-        print(f"Complete audio saved to {complete_output_path}")
-        print(f"Duration: approximately {combined_audio.shape[-1] / model.sr:.1f} seconds")
+    for failed_path, error in sentence_writer.errors:
+        print(f"Failed to write {failed_path}: {error}")
+    
+    # Finalize the complete article (patches the WAV header or flushes the encoder)
+    complete_writer.close()
+    if complete_writer.segments:
+        print(f"Complete audio saved to {complete_writer.path}")
+        print(f"Sentence offsets saved to {complete_writer.write_index()}")
+        print(f"Duration: approximately {complete_writer.duration:.1f} seconds")
         print(f"Successfully processed {successful_generations} sentences")
         
-        # Clean up processed reference file
-        if os.path.exists(reference_audio_path):
-            os.remove(reference_audio_path)
-        
         return True
     else:
+        os.remove(complete_writer.path)
         print("No audio was successfully generated for this sample.")
         return False
 
-def process_text_with_multiple_samples():
+def link_sample_output(base_output_dir, sample_name, run_id):
+    """Create the run's per-sample directory and point /workspace/output/<sample_name> at it"""
+    # process_with_audio_sample writes to /workspace/output/<sample_name>, so that
+    # path is turned into a symlink to this run's directory to avoid collisions
+    # with older runs.
+    target_dir = f"{base_output_dir}/{sample_name}"
+    os.makedirs(target_dir, exist_ok=True)
+    legacy_path = f"/workspace/output/{sample_name}"
+    # If legacy path exists and is not symlink to target_dir, remove/rename
+    if os.path.exists(legacy_path) and not os.path.islink(legacy_path):
+        try:
+            # Move old directory out of the way
+            backup_dir = f"{legacy_path}_prev_{run_id}"
+            os.rename(legacy_path, backup_dir)
+        except Exception:
+            backup_dir = None
+        if backup_dir and ARCHIVE_ENABLED:
+            # Deduplicate the backup against earlier runs instead of keeping another full copy
+            try:
+                ArchiveStore().ingest(backup_dir, voices=[sample_name])
+            except OSError as e:
+                print(f"Warning: could not archive {backup_dir}: {e}")
+    try:
+        if os.path.islink(legacy_path) or os.path.exists(legacy_path):
+            os.unlink(legacy_path)
+        os.symlink(target_dir, legacy_path)
+    except Exception as e:
+        print(f"Warning: could not set symlink for {sample_name}: {e}")
+    return target_dir
+
+def process_samples_in_parallel(audio_samples, sentences, base_output_dir, run_id, device):
+    """Fan (voice, sentence) jobs for every sample out over a pool of worker processes"""
+    sample_names = []
+    jobs = []
+    selected = limit_sentences(sentences)
+    for sample_path in audio_samples:
+        sample_name = Path(sample_path).stem
+        reference_audio = prepare_reference_audio(sample_path)
+        if reference_audio is None:
+            print(f"Failed to process reference audio: {sample_path}")
+            continue
+        sample_names.append(sample_name)
+        output_dir = link_sample_output(base_output_dir, sample_name, run_id)
+        ref_hash = hash_audio(reference_audio)
+        # Workers prepare the reference themselves; only the sample path is sent to them
+        for i, sentence in enumerate(selected):
+            jobs.append((sample_name, sample_path, ref_hash, i, sentence,
+                         f'{output_dir}/sentence_{i+1:03d}.wav'))
+
+    outcomes = run_worker_pool(jobs, WORKERS, device, TTS_PARAMS, SEED)
+
+    # Stitch each voice's sentence files into its complete article, in order.
+    # Workers write WAV; those files are then re-encoded or dropped per the output settings.
+    successful_samples = 0
+    with AsyncAudioWriter() as sentence_writer:
+        for sample_name in sample_names:
+            output_dir = f"{base_output_dir}/{sample_name}"
+            complete_output_path = f'{output_dir}/complete_article.wav'
+            complete_writer = None
+            for i in range(len(selected)):
+                if outcomes.get((sample_name, i), 'missing') is None:
+                    sentence_path = f'{output_dir}/sentence_{i+1:03d}.wav'
+                    wav, sr = ta.load(sentence_path)
+                    if complete_writer is None:
+                        complete_writer = StreamingWavWriter(complete_output_path, sr)
+                    complete_writer.append(wav, index=i, text=selected[i])
+                    if not SENTENCE_FILES:
+                        os.remove(sentence_path)
+                    elif OUTPUT_FORMAT != 'wav':
+                        sentence_writer.submit(sentence_path, wav, sr)
+            if complete_writer is None:
+                print(f"{sample_name}: no audio was successfully generated.")
+                continue
+            complete_writer.close()
+            complete_writer.write_index()
+            print(f"{sample_name}: {complete_writer.segments}/{len(selected)} sentences, "
+                  f"{complete_writer.duration:.1f} seconds")
+            successful_samples += 1
+    for failed_path, error in sentence_writer.errors:
+        print(f"Failed to write {failed_path}: {error}")
+    if SENTENCE_FILES and OUTPUT_FORMAT != 'wav':
+        # The encoded copies replace the workers' intermediate WAV files
+        for sample_name in sample_names:
+            for wav_path in Path(f"{base_output_dir}/{sample_name}").glob('sentence_*.wav'):
+                wav_path.unlink()
+    return successful_samples
+
+def process_text_with_multiple_samples(sentences=None, audio_samples=None):
     """Main function to process text with multiple audio samples.
     Each run stores results in a unique timestamped directory: /workspace/output/run_<UTC_TS>/sample_name
     Also maintains /workspace/output/latest -> that run (symlink).
+    ``sentences`` and ``audio_samples`` may be passed in already validated (see tts_cli);
+    the model is loaded only after both are known to be usable.
     """
     import datetime
+
+    # Get all audio samples
+    if audio_samples is None:
+        audio_samples = get_audio_samples()
+    if not audio_samples:
+        print("No audio samples found in /workspace/audio_samples/")
+        print("Please add audio files to the audio_samples directory and try again.")
+        return
+
+    print(f"Found {len(audio_samples)} audio samples:")
+    for sample in audio_samples:
+        print(f"  - {Path(sample).name}")
+
+    if sentences is None:
+        # Read the input text
+        text_file = '/workspace/text_input.txt'
+        if not os.path.exists(text_file):
+            print(f"Text input file not found: {text_file}")
+            return
+
+        with open(text_file, 'r', encoding='utf-8') as f:
+            full_text = f.read()
+
+        print(f"Processing text of {len(full_text)} characters...")
+
+        # Clean and split the text
+        sentences = clean_text_for_tts(full_text)
+        print(f"Split into {len(sentences)} sentences")
+    sentences = limit_sentences(sentences)
+
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
 
@@ -173,73 +239,52 @@ def process_text_with_multiple_samples():
     except Exception as e:
         print(f"Could not update latest symlink: {e}")
 
-    # Load the model
-    print("Loading Chatterbox TTS model...")
-    model = ChatterboxTTS.from_pretrained(device=device)
-
-    # Get all audio samples
-    audio_samples = get_audio_samples()
-    if not audio_samples:
-        print("No audio samples found in /workspace/audio_samples/")
-        print("Please add audio files to the audio_samples directory and try again.")
-        return
-
-    print(f"Found {len(audio_samples)} audio samples:")
-    for sample in audio_samples:
-        print(f"  - {Path(sample).name}")
-
-    # Read the input text
-    text_file = '/workspace/text_input.txt'
-    if not os.path.exists(text_file):
-        print(f"Text input file not found: {text_file}")
-        return
-
-    with open(text_file, 'r', encoding='utf-8') as f:
-        full_text = f.read()
-
-    print(f"Processing text of {len(full_text)} characters...")
-
-    # Clean and split the text
-    sentences = clean_text_for_tts(full_text)
-    print(f"Split into {len(sentences)} sentences")
+    # Load the model (parallel workers load their own copies)
+    model = None
+    metrics = None
+    frontend = None
+    if WORKERS <= 1:
+        print("Loading Chatterbox TTS model...")
+        model = load_model(device)
+        metrics = RunMetrics('multi', run_id=run_id)
+        metrics.attach(model)
+        # Sentences are tokenized once here and reused for every voice during this run
+        frontend = open_frontend(model, sentences)
 
     # Process text with each audio sample
+    sentence_cache = None
     successful_samples = 0
-    for sample_path in audio_samples:
-        sample_name = Path(sample_path).stem
-        try:
-            # Patch process_with_audio_sample to accept base directory by temporarily overriding output_dir creation
-            # Simpler: replicate call with monkey patched global variable? We just set environment var.
-            # We'll adjust by temporarily changing working output inside function via env var.
-            # Instead, derive per-sample dir and create before call, then inside function will still use /workspace/output/<sample_name>
-            # To avoid collision with older runs, pre-create symlink path to new location.
-            target_dir = f"{base_output_dir}/{sample_name}"
-            os.makedirs(target_dir, exist_ok=True)
-            legacy_path = f"/workspace/output/{sample_name}"
-            # If legacy path exists and is not symlink to target_dir, remove/rename
-            if os.path.exists(legacy_path) and not os.path.islink(legacy_path):
-                try:
-                    # Move old directory out of the way
-                    backup_dir = f"{legacy_path}_prev_{run_id}"
-                    os.rename(legacy_path, backup_dir)
-                except Exception:
-                    pass
+    if WORKERS > 1:
+        successful_samples = process_samples_in_parallel(audio_samples, sentences, base_output_dir, run_id, device)
+    else:
+        sentence_cache = SentenceAudioCache()
+        for sample_path in audio_samples:
+            sample_name = Path(sample_path).stem
             try:
-                if os.path.islink(legacy_path) or os.path.exists(legacy_path):
-                    os.unlink(legacy_path)
-                os.symlink(target_dir, legacy_path)
+                link_sample_output(base_output_dir, sample_name, run_id)
+                if process_with_audio_sample(model, sentences, sample_path, sample_name, sentence_cache):
+                    successful_samples += 1
             except Exception as e:
-                print(f"Warning: could not set symlink for {sample_name}: {e}")
-            if process_with_audio_sample(model, sentences, sample_path, sample_name):
-                successful_samples += 1
-        except Exception as e:
-            print(f"Failed to process sample {sample_name}: {e}")
-            continue
+                print(f"Failed to process sample {sample_name}: {e}")
+                continue
 
     print(f"\n{'='*60}")
     print(f"PROCESSING COMPLETE")
     print(f"{'='*60}")
     print(f"Successfully processed {successful_samples}/{len(audio_samples)} audio samples")
+    if sentence_cache is not None:
+        print(sentence_cache.report())
+    if model is not None and model.guard is not None:
+        print(model.guard.report())
+    if frontend is not None:
+        frontend.close()
+        print(frontend.report())
+    if metrics is not None:
+        metrics.finish(samples=successful_samples, cache_hits=sentence_cache.hits, cache_misses=sentence_cache.misses)
+    if successful_samples:
+        archive_run(base_output_dir, f"run_{run_id}", sentences, [Path(p).stem for p in audio_samples],
+                    dict(TTS_PARAMS, seed=SEED, profile=os.environ.get('TTS_PROFILE', 'default'),
+                         format=OUTPUT_FORMAT))
     print(f"Run directory: {base_output_dir}")
     print("'latest' symlink points to most recent run.")
 
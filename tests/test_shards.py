@@ -0,0 +1,116 @@
+import multiprocessing as mp
+import os
+import time
+
+import pytest
+
+import tts_shards
+from tts_shards import ClaimLost, ShardJob
+
+SENTENCES = [f"Sentence number {i}." for i in range(23)]
+
+
+def make_job(tmp_path, shard_size=2):
+    return ShardJob.create('book', SENTENCES, None, {'temperature': 0.7}, seed=0,
+                           shard_size=shard_size, shards_dir=str(tmp_path))
+
+
+def fake_worker(job_dir, worker, start, results):
+    """The claim / heartbeat / commit cycle of render_shard, writing text instead of audio"""
+    job = ShardJob(job_dir)
+    start.wait()
+    committed = []
+    while True:
+        shard = job.claim(worker)
+        if shard is None:
+            break
+        path = job.shard_file(shard, worker)
+        with open(path, 'w') as f:
+            f.write(worker)
+        with open(os.path.splitext(path)[0] + '.index.json', 'w') as f:
+            f.write('{}')
+        job.heartbeat(shard, worker)
+        if job.commit(shard, worker, path, [], 0.0):
+            committed.append(shard)
+    results.put((worker, committed))
+
+
+def test_two_workers_render_every_shard_once(tmp_path):
+    job = make_job(tmp_path)
+    ctx = mp.get_context('fork')
+    start = ctx.Event()
+    results = ctx.Queue()
+    workers = [ctx.Process(target=fake_worker, args=(str(job.dir), f"w{n}", start, results)) for n in range(2)]
+    for p in workers:
+        p.start()
+    start.set()
+    committed = dict(results.get(timeout=30) for _ in workers)
+    for p in workers:
+        p.join(timeout=30)
+
+    shards = sorted(committed['w0'] + committed['w1'])
+    assert shards == list(range(job.shards))
+    assert job.status() == {'shards': job.shards, 'done': job.shards, 'claimed': 0,
+                            'pending': 0, 'merged': False}
+    for shard in range(job.shards):
+        done = tts_shards._read_json(job.dir / f"shard_{shard:04d}.done")
+        with open(job.dir / done['file']) as f:
+            worker = f.read()
+        assert shard in committed[worker]
+    assert not list(job.dir.glob('*.lock*'))
+
+
+def contend(job_dir, worker, start, results):
+    job = ShardJob(job_dir)
+    start.wait()
+    results.put((worker, job._acquire(job.dir / 'shard_0000.lock', worker)))
+
+
+def test_only_one_worker_takes_over_an_expired_claim(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_shards, 'SHARD_LEASE_S', 60)
+    job = make_job(tmp_path)
+    lock_path = job.dir / 'shard_0000.lock'
+    ctx = mp.get_context('fork')
+    for _ in range(5):
+        assert job._acquire(lock_path, 'dead')
+        os.utime(lock_path, (time.time() - 120, time.time() - 120))
+        start = ctx.Event()
+        results = ctx.Queue()
+        workers = [ctx.Process(target=contend, args=(str(job.dir), f"w{n}", start, results)) for n in range(4)]
+        for p in workers:
+            p.start()
+        start.set()
+        outcome = dict(results.get(timeout=30) for _ in workers)
+        for p in workers:
+            p.join(timeout=30)
+        winners = [w for w, won in outcome.items() if won]
+        assert len(winners) == 1
+        assert tts_shards._holder(lock_path) == winners[0]
+        assert not list(job.dir.glob('*.expired.*'))
+        lock_path.unlink()
+
+
+def test_fresh_claim_renamed_by_a_late_worker_is_put_back(tmp_path, monkeypatch):
+    job = make_job(tmp_path)
+    lock_path = job.dir / 'shard_0000.lock'
+    assert job._acquire(lock_path, 'a')
+    # 'b' saw the previous claim expire just before 'a' replaced it with this fresh one
+    checks = iter([True])
+    real_expired = tts_shards._expired
+    monkeypatch.setattr(tts_shards, '_expired', lambda path: next(checks, None) or real_expired(path))
+    assert not job._acquire(lock_path, 'b')
+    assert tts_shards._holder(lock_path) == 'a'
+    job.heartbeat(0, 'a')
+
+
+def test_heartbeat_fails_once_the_claim_is_taken_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_shards, 'SHARD_LEASE_S', 60)
+    job = make_job(tmp_path)
+    assert job.claim('a') == 0
+    lock_path = job.dir / 'shard_0000.lock'
+    os.utime(lock_path, (time.time() - 120, time.time() - 120))
+    assert job.claim('b') == 0
+    with pytest.raises(ClaimLost):
+        job.heartbeat(0, 'a')
+    job.release(0, 'a')
+    assert tts_shards._holder(lock_path) == 'b'
@@ -0,0 +1,75 @@
+from tts_text import (
+    chunk_text, iter_chunks, iter_sentences, limit_sentences, split_long_sentence, text_length,
+)
+
+
+def sentences(text):
+    return list(iter_sentences(text.splitlines()))
+
+
+def test_heading_without_blank_line_is_its_own_sentence():
+    text = "# Heading\nThe first paragraph starts here.\n## Second heading\nMore text"
+    assert sentences(text) == ['Heading.', 'The first paragraph starts here.', 'Second heading.', 'More text.']
+    assert chunk_text(text)[0].startswith('Heading. The first paragraph')
+
+
+def test_heading_ends_the_paragraph_before_it():
+    assert sentences("A dateline without a stop\n# Heading") == ['A dateline without a stop.', 'Heading.']
+
+
+def test_blank_line_ends_a_paragraph():
+    assert sentences("Kathmandu, May 3\n\nThe team left at 6 a.m. on Monday.") == [
+        'Kathmandu, May 3.', 'The team left at 6 a.m. on Monday.']
+
+
+def test_abbreviations_initials_and_numbers_do_not_end_a_sentence():
+    assert sentences("Dr. Smith met J. R. R. Tolkien at 3.5 km. It was 8,027 m high! Was it?") == [
+        'Dr. Smith met J. R. R. Tolkien at 3.5 km.', 'It was 8,027 m high!', 'Was it?']
+
+
+def test_quoted_ending_and_wrapped_lines():
+    assert sentences('He said "stop." Then he left.') == ['He said "stop."', 'Then he left.']
+    assert sentences("The end of a line\ncontinues here. Next one.") == [
+        'The end of a line continues here.', 'Next one.']
+
+
+def test_sentences_are_yielded_while_reading():
+    def lines():
+        yield "First sentence. Second"
+        raise AssertionError("read past the first complete sentence")
+
+    assert next(iter_sentences(lines())) == 'First sentence.'
+
+
+def test_long_sentence_is_split_at_clauses_within_the_limit():
+    parts = split_long_sentence('a, ' * 10 + 'end', max_length=10)
+    assert all(len(p) <= 10 for p in parts)
+    assert ' '.join(parts) == ('a, ' * 10 + 'end').strip()
+
+
+def test_chunks_are_packed_up_to_the_target():
+    assert chunk_text('One. Two. Three. Four.', target_length=10, max_length=20, min_length=0) == [
+        'One. Two.', 'Three.', 'Four.']
+
+
+def test_short_fragments_are_merged_not_dropped():
+    text = 'Short. A much longer sentence follows this one here.'
+    assert chunk_text(text, target_length=20, max_length=80, min_length=10) == [text]
+    assert chunk_text('A long enough sentence to stand alone. Tail.', target_length=20,
+                      max_length=80, min_length=10) == ['A long enough sentence to stand alone. Tail.']
+
+
+def test_no_chunk_exceeds_the_maximum():
+    text = ' '.join(f"Sentence {i} has a few words in it, like the others." for i in range(50))
+    chunks = list(iter_chunks(text.splitlines(), target_length=120, max_length=150, min_length=20))
+    assert all(len(c) <= 150 for c in chunks)
+    assert ' '.join(chunks) == text
+
+
+def test_token_length():
+    assert text_length('Hello, world!', unit='tokens') == 4
+
+
+def test_limit_sentences():
+    assert limit_sentences(['a', 'b', 'c'], 2) == ['a', 'b']
+    assert limit_sentences(['a', 'b', 'c'], 0) == ['a', 'b', 'c']
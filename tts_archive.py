@@ -0,0 +1,323 @@
+"""Content-addressed store for run audio, with a run index and retention.
+
+Every audio file of an archived run is hashed (sha256) and kept once under
+``<store>/objects/<aa>/<digest><suffix>``; the file in the run directory is
+replaced by a hardlink to that object, so identical sentences across runs,
+``_prev_`` backups and ``archives/`` take the space of one copy. Where a run
+lives on another filesystem the file becomes a symlink to the object instead.
+Objects are read-only: a run file must be replaced, never rewritten in place.
+
+``index.json`` records each run's directory, kind, text hash, voices,
+parameters, timestamps and file digests. ``prune`` deletes whole runs by
+retention policy (keep the newest N and/or everything younger than D days)
+and ``compact`` drops objects no indexed run refers to any more. Only
+``run_*`` directories under the output root are ever pruned; ``_prev_``
+backups are pruned on request (``--include-backups``) and anything else,
+such as ``archives/``, is deduplicated but never deleted.
+
+    python tts_archive.py ingest                  # every run_* and *_prev_* under output/, plus archives/
+    python tts_archive.py prune --keep-last 5 --keep-days 14
+    python tts_archive.py compact
+"""
+import argparse
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from tts_cli import AUDIO_EXTENSIONS
+
+ARCHIVE_ENABLED = os.environ.get('TTS_ARCHIVE', '1') != '0'
+# Kept on the output volume so run files can be hardlinked to objects
+ARCHIVE_DIR = os.environ.get('TTS_ARCHIVE_DIR', '/workspace/output/.archive')
+# Retention applied after every multi-sample run; unset keeps everything
+KEEP_RUNS = int(os.environ['TTS_ARCHIVE_KEEP_RUNS']) if os.environ.get('TTS_ARCHIVE_KEEP_RUNS') else None
+KEEP_DAYS = float(os.environ['TTS_ARCHIVE_KEEP_DAYS']) if os.environ.get('TTS_ARCHIVE_KEEP_DAYS') else None
+
+OUTPUT_ROOT = "/workspace/output"
+LEGACY_ARCHIVES_DIR = "/workspace/archives"
+
+
+def text_digest(sentences):
+    """sha256 of the synthesized text, one sentence per line"""
+    return hashlib.sha256('\n'.join(sentences).encode('utf-8')).hexdigest()
+
+
+def run_kind(run_dir, output_root=None):
+    """'run' for a run_* directory under the output root, 'backup' for a _prev_ backup, else 'kept'"""
+    run_dir = Path(run_dir)
+    if run_dir.resolve().parent == Path(output_root or OUTPUT_ROOT).resolve():
+        if run_dir.name.startswith('run_'):
+            return 'run'
+        if '_prev_' in run_dir.name:
+            return 'backup'
+    return 'kept'
+
+
+def _file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArchiveStore:
+    """Deduplicated audio objects plus the index of the runs that use them"""
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'objects'
+        self.index_path = self.root / 'index.json'
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store lock and yield the index; it is saved when the block succeeds"""
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.root / 'lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._load()
+            yield index
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_path, self.index_path)
+
+    def _load(self):
+        if not self.index_path.exists():
+            return {'runs': {}}
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def runs(self):
+        """Indexed runs, oldest first"""
+        return sorted(self._load()['runs'].values(), key=lambda r: r['created'])
+
+    def object_path(self, digest, suffix):
+        return self.objects_dir / digest[:2] / f"{digest}{suffix.lower()}"
+
+    def _store_file(self, path, stats):
+        """Move ``path``'s content into the store and leave a link to it in place; return its digest"""
+        digest = _file_digest(path)
+        obj = self.object_path(digest, path.suffix)
+        size = path.stat().st_size
+        if obj.exists():
+            if os.path.samefile(obj, path):
+                return digest  # archived before
+            stats['deduplicated'] += 1
+            stats['saved_bytes'] += size
+        else:
+            obj.parent.mkdir(exist_ok=True)
+            try:
+                os.link(path, obj)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copy2(path, obj)
+            os.chmod(obj, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            stats['stored'] += 1
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            os.link(obj, tmp_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            os.symlink(obj.resolve(), tmp_path)
+            stats['symlinked'] += 1
+        os.replace(tmp_path, path)
+        return digest
+
+    def ingest(self, run_dir, run_id=None, text_sha256=None, voices=None, params=None, created=None):
+        """Archive every audio file under ``run_dir`` and record the run; return ingest statistics"""
+        run_dir = Path(run_dir)
+        run_id = run_id or run_dir.name
+        stats = {'files': 0, 'stored': 0, 'deduplicated': 0, 'symlinked': 0, 'saved_bytes': 0}
+        with self._locked() as index:
+            files = {}
+            for path in sorted(run_dir.rglob('*')):
+                if path.suffix.lower() not in AUDIO_EXTENSIONS:
+                    continue
+                if path.is_symlink():
+                    # Left by an earlier ingest across filesystems; anything else is not ours to track
+                    target = Path(os.readlink(path))
+                    if target.parent.parent != self.objects_dir.resolve():
+                        continue
+                    digest = target.name.split('.')[0]
+                elif path.is_file():
+                    digest = self._store_file(path, stats)
+                else:
+                    continue
+                files[str(path.relative_to(run_dir))] = digest
+                stats['files'] += 1
+            previous = index['runs'].get(run_id, {})
+            if voices is None:
+                voices = previous.get('voices') or sorted({Path(f).parent.name for f in files if '/' in f}) \
+                    or [run_dir.name.split('_prev_')[0]]
+            index['runs'][run_id] = {
+                'run_id': run_id,
+                'path': str(run_dir.resolve()),
+                'kind': run_kind(run_dir),
+                'created': created or previous.get('created')
+                or datetime.fromtimestamp(run_dir.stat().st_mtime).isoformat(timespec='seconds'),
+                'archived': datetime.now().isoformat(timespec='seconds'),
+                'text_sha256': text_sha256 or previous.get('text_sha256'),
+                'voices': voices,
+                'params': params if params is not None else previous.get('params'),
+                'files': files,
+                'bytes': sum(self.object_path(d, Path(f).suffix).stat().st_size for f, d in files.items()),
+            }
+        return stats
+
+    def find_legacy_runs(self, output_root=OUTPUT_ROOT, archives_dir=LEGACY_ARCHIVES_DIR):
+        """Run directories and ``_prev_`` backups that are not in the index yet"""
+        indexed = {r['path'] for r in self.runs()}
+        candidates = []
+        for root, patterns in ((output_root, ('run_*', '*_prev_*')), (archives_dir, ('*',))):
+            if not os.path.isdir(root):
+                continue
+            for pattern in patterns:
+                candidates.extend(p for p in Path(root).glob(pattern) if p.is_dir() and not p.is_symlink())
+        return [p for p in sorted(set(candidates)) if str(p.resolve()) not in indexed]
+
+    @staticmethod
+    def select_expired(index, keep_last=None, keep_days=None, protect=(), kinds=('run',)):
+        """Runs of ``kinds`` outside every given policy; a run kept by either policy (or in ``protect``) survives"""
+        if keep_last is None and keep_days is None:
+            return []
+        runs = sorted((r for r in index['runs'].values()
+                       if r.get('kind', run_kind(r['path'])) in kinds), key=lambda r: r['created'])
+        keep = {r['run_id'] for r in runs if r['path'] in protect}
+        if keep_last is not None:
+            keep.update(r['run_id'] for r in runs[len(runs) - keep_last:] if keep_last > 0)
+        if keep_days is not None:
+            cutoff = time.time() - keep_days * 86400
+            keep.update(r['run_id'] for r in runs if datetime.fromisoformat(r['created']).timestamp() >= cutoff)
+        return [r for r in runs if r['run_id'] not in keep]
+
+    def prune(self, keep_last=None, keep_days=None, dry_run=False, kinds=('run',)):
+        """Delete expired runs of ``kinds`` (directory and index entry).
+
+        The run ``latest`` points at is always kept. The expired set is chosen
+        under the store lock, so a run ingested meanwhile is counted.
+        """
+        latest = os.path.join(OUTPUT_ROOT, 'latest')
+        protect = {os.path.realpath(latest)} if os.path.islink(latest) else set()
+        with self._locked() as index:
+            expired = self.select_expired(index, keep_last, keep_days, protect, kinds)
+            if dry_run:
+                return expired
+            for run in expired:
+                shutil.rmtree(run['path'], ignore_errors=True)
+                index['runs'].pop(run['run_id'], None)
+        return expired
+
+    def compact(self, dry_run=False):
+        """Forget runs whose directory is gone and delete objects no remaining run refers to"""
+        removed_runs, removed_objects, freed = [], 0, 0
+        with self._locked() as index:
+            for run_id, run in list(index['runs'].items()):
+                if not os.path.isdir(run['path']):
+                    removed_runs.append(run_id)
+                    if not dry_run:
+                        del index['runs'][run_id]
+            referenced = {digest for run_id, run in index['runs'].items() if run_id not in removed_runs
+                          for digest in run['files'].values()}
+            for obj in self.objects_dir.glob('*/*'):
+                if obj.name.startswith('.') or obj.name.split('.')[0] in referenced:
+                    continue
+                removed_objects += 1
+                freed += obj.stat().st_size
+                if not dry_run:
+                    obj.unlink()
+            if not dry_run:
+                for shard in self.objects_dir.iterdir():
+                    if shard.is_dir() and not any(shard.iterdir()):
+                        shard.rmdir()
+        return {'runs': removed_runs, 'objects': removed_objects, 'freed_bytes': freed}
+
+    def usage(self):
+        """(bytes the indexed runs would take as plain copies, bytes actually held by objects)"""
+        logical = sum(r['bytes'] for r in self.runs())
+        physical = sum(obj.stat().st_size for obj in self.objects_dir.glob('*/*')) if self.objects_dir.exists() else 0
+        return logical, physical
+
+
+def archive_run(run_dir, run_id, sentences, voices, params):
+    """Archive a finished run and apply the configured retention; errors are reported, not raised"""
+    if not ARCHIVE_ENABLED:
+        return
+    store = ArchiveStore()
+    try:
+        stats = store.ingest(run_dir, run_id, text_digest(sentences), voices, params)
+        print(f"Archived run {run_id}: {stats['files']} files, {stats['deduplicated']} already stored "
+              f"({stats['saved_bytes'] / 1024 ** 2:.1f} MB saved)")
+        expired = store.prune(KEEP_RUNS, KEEP_DAYS)
+        if expired:
+            result = store.compact()
+            print(f"Retention removed {len(expired)} runs and {result['objects']} objects "
+                  f"({result['freed_bytes'] / 1024 ** 2:.1f} MB)")
+    except OSError as e:
+        print(f"Could not archive run {run_id}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate, list and prune archived runs.")
+    parser.add_argument('--store', default=ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    ingest = sub.add_parser('ingest', help="archive run directories (default: all that are not indexed yet)")
+    ingest.add_argument('dirs', nargs='*')
+    sub.add_parser('list', help="show indexed runs and disk use")
+    prune = sub.add_parser('prune', help="delete runs outside the retention policy, then compact")
+    prune.add_argument('--keep-last', type=int, default=KEEP_RUNS, help="keep the newest N runs")
+    prune.add_argument('--keep-days', type=float, default=KEEP_DAYS, help="keep runs younger than D days")
+    prune.add_argument('--include-backups', action='store_true', help="also prune *_prev_* backups")
+    prune.add_argument('--dry-run', action='store_true')
+    compact = sub.add_parser('compact', help="delete objects no indexed run refers to")
+    compact.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    store = ArchiveStore(args.store)
+    if args.command == 'ingest':
+        dirs = [Path(d) for d in args.dirs] or store.find_legacy_runs()
+        for run_dir in dirs:
+            stats = store.ingest(run_dir)
+            print(f"{run_dir}: {stats['files']} files, {stats['stored']} new, {stats['deduplicated']} duplicates "
+                  f"({stats['saved_bytes'] / 1024 ** 2:.1f} MB saved)"
+                  + (f", {stats['symlinked']} symlinked across filesystems" if stats['symlinked'] else ''))
+    elif args.command == 'list':
+        for run in store.runs():
+            text = (run['text_sha256'] or '-')[:12]
+            print(f"{run['created']}  {run['run_id']:<40} {run.get('kind', run_kind(run['path'])):<6} "
+                  f"{len(run['files']):>4} files  "
+                  f"{run['bytes'] / 1024 ** 2:>7.1f} MB  text {text}  {', '.join(run['voices'])}")
+    elif args.command == 'prune':
+        kinds = ('run', 'backup') if args.include_backups else ('run',)
+        expired = store.prune(args.keep_last, args.keep_days, args.dry_run, kinds)
+        for run in expired:
+            print(f"{'Would delete' if args.dry_run else 'Deleted'} {run['run_id']} ({run['path']})")
+        if not expired:
+            print("Nothing to prune" + ('' if args.keep_last is not None or args.keep_days is not None
+                                       else " (no --keep-last or --keep-days given)"))
+    if args.command in ('prune', 'compact', 'ingest') and not getattr(args, 'dry_run', False):
+        result = store.compact()
+        if result['runs'] or result['objects']:
+            print(f"Compacted: forgot {len(result['runs'])} missing runs, removed {result['objects']} objects "
+                  f"({result['freed_bytes'] / 1024 ** 2:.1f} MB)")
+    elif args.command == 'compact':
+        result = store.compact(dry_run=True)
+        print(f"Would forget {len(result['runs'])} missing runs and remove {result['objects']} objects "
+              f"({result['freed_bytes'] / 1024 ** 2:.1f} MB)")
+    logical, physical = store.usage()
+    print(f"Archive: {len(store.runs())} runs, {logical / 1024 ** 2:.1f} MB of run audio "
+          f"held in {physical / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+from importlib import metadata
+from pathlib import Path
+
+import torch
+
+DEFAULT_CACHE_DIR = "/workspace/output/.cache/sentences"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Variant assumed for keys built without a model: the default profile at full precision
+DEFAULT_VARIANT = {'profile': 'default', 'dtype': 'float32'}
+
+
+def model_version():
+    """Return the installed chatterbox-tts version used in cache keys"""
+    try:
+        return metadata.version('chatterbox-tts')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def model_variant(model):
+    """Inference profile and dtype a model was loaded with; both change the generated audio"""
+    return {'profile': getattr(model, 'profile', DEFAULT_VARIANT['profile']),
+            'dtype': getattr(model, 'dtype', DEFAULT_VARIANT['dtype'])}
+
+
+def normalize_sentence(text):
+    """Normalize sentence text so whitespace-only edits still hit the cache"""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class SentenceAudioCache:
+    """On-disk, content-addressed cache of generated sentence waveforms.
+
+    Entries are keyed by the normalized sentence, the reference audio hash,
+    the generation parameters, the model version, the model variant (see
+    ``model_variant``) and the seed. The cache is
+    capped at ``max_bytes``; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, version=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.version = version or model_version()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = sum(p.stat().st_size for p in self.cache_dir.glob('*/*.pt'))
+
+    def key(self, sentence, ref_hash, params, seed=None, variant=None):
+        params = {k: v for k, v in params.items() if k != 'audio_prompt_path'}
+        payload = json.dumps({
+            'text': normalize_sentence(sentence),
+            'ref': ref_hash,
+            'params': params,
+            'model': self.version,
+            'variant': variant or DEFAULT_VARIANT,
+            'seed': seed,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.pt"
+
+    def get(self, key):
+        """Return the cached waveform for ``key`` or None on a miss"""
+        path = self._path(key)
+        if path.exists():
+            try:
+                wav = torch.load(path, map_location='cpu')
+                os.utime(path)  # mark as recently used for eviction
+                self.hits += 1
+                return wav
+            except Exception as e:
+                print(f"Discarding unreadable cache entry {path.name}: {e}")
+                self.total_bytes -= path.stat().st_size
+                path.unlink(missing_ok=True)
+        self.misses += 1
+        return None
+
+    def put(self, key, wav):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        torch.save(wav.detach().cpu(), tmp_path)
+        try:
+            replaced = path.stat().st_size  # written meanwhile by another worker with the same key
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        self.total_bytes += path.stat().st_size - replaced
+        self._evict()
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        entries = sorted(self.cache_dir.glob('*/*.pt'), key=lambda p: p.stat().st_mtime)
+        for path in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue  # evicted by another worker
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / total if total else 0.0
+        return (f"Sentence cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), "
+                f"{self.evictions} evicted, {self.total_bytes / 1024 ** 2:.1f} MB used")
+
+
+def generate_cached(model, cache, sentence, params, ref_hash, seed=None):
+    """Return a cached waveform for ``sentence`` or generate and store it"""
+    key = cache.key(sentence, ref_hash, params, seed, model_variant(model))
+    wav = cache.get(key)
+    if wav is None:
+        if seed is not None:
+            torch.manual_seed(seed)
+        wav = model.generate(sentence, **params)
+        cache.put(key, wav)
+    return wav
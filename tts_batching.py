@@ -0,0 +1,263 @@
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+
+from tts_audio_cache import model_variant
+
+# Number of sentences generated together; 1 keeps strict one-at-a-time decoding
+BATCH_SIZE = int(os.environ.get('TTS_BATCH_SIZE', '1'))
+# Speech tokens T3 may sample per sentence, as in ChatterboxTTS.generate
+MAX_NEW_TOKENS = 1000
+# S3 speech token ids at or above this are not audio tokens
+SPEECH_VOCAB_SIZE = 6561
+
+
+def length_batches(sentences, batch_size, window=None):
+    """Group sentence indices into batches of similar text length.
+
+    Sorting happens inside a sliding window of consecutive sentences so early
+    sentences are not held back until the whole document has been generated.
+    """
+    batch_size = max(1, batch_size)
+    window = window or batch_size * 4
+    for start in range(0, len(sentences), window):
+        indices = sorted(range(start, min(start + window, len(sentences))),
+                         key=lambda i: len(sentences[i]))
+        for b in range(0, len(indices), batch_size):
+            yield indices[b:b + batch_size]
+
+
+def _set_exaggeration(model, exaggeration):
+    """Same conditioning update ChatterboxTTS.generate makes before decoding"""
+    from chatterbox.models.t3.modules.cond_enc import T3Cond
+
+    cond = model.conds.t3
+    if exaggeration != cond.emotion_adv[0, 0, 0]:
+        model.conds.t3 = T3Cond(
+            speaker_emb=cond.speaker_emb,
+            cond_prompt_speech_tokens=cond.cond_prompt_speech_tokens,
+            emotion_adv=exaggeration * torch.ones(1, 1, 1),
+        ).to(device=model.device)
+
+
+def _prompt_embeds(model, text, cfg):
+    """Conditioning, text and start-of-speech embeddings of one sentence, as T3.inference builds them"""
+    from chatterbox.tts import punc_norm
+
+    t3 = model.t3
+    tokens = model.tokenizer.text_to_tokens(punc_norm(text)).to(model.device)
+    if cfg:
+        tokens = torch.cat([tokens, tokens], dim=0)  # second row is the unconditional (CFG) one
+    tokens = F.pad(tokens, (1, 0), value=t3.hp.start_text_token)
+    tokens = F.pad(tokens, (0, 1), value=t3.hp.stop_text_token)
+    bos = torch.full_like(tokens[:, :1], t3.hp.start_speech_token)
+    embeds, _ = t3.prepare_input_embeds(t3_cond=model.conds.t3, text_tokens=tokens,
+                                        speech_tokens=bos, cfg_weight=1.0 if cfg else 0.0)
+    bos_embed = t3.speech_emb(bos) + t3.speech_pos_emb.get_fixed_embedding(0)
+    return torch.cat([embeds, bos_embed], dim=1)
+
+
+@torch.inference_mode()
+def _decode_batch(model, texts, budgets, detect=False, temperature=0.8, cfg_weight=0.5,
+                  repetition_penalty=1.2, min_p=0.05, top_p=1.0):
+    """Sample T3 speech tokens for several sentences in one padded batch.
+
+    Prompts of different lengths are left-padded and masked, with position ids
+    counted from each row's first real token, so every row sees the same
+    context as when decoded alone. A row stops at its own stop token or at its
+    token budget and, with ``detect``, when the generation guard's loop or
+    silence check fires on it; the batch ends once every row has stopped.
+    Returns a list of (speech tokens, problem) per text, where problem is None,
+    'length budget' or a ``RunawayGeneration`` from the check.
+    """
+    from transformers.generation.logits_process import (
+        MinPLogitsWarper, RepetitionPenaltyLogitsProcessor, TopPLogitsWarper)
+    from tts_guard import CHECK_EVERY, RunawayGeneration, check_runaway
+
+    t3 = model.t3
+    cfg = cfg_weight > 0.0
+    rows = 2 if cfg else 1
+    prompts = [_prompt_embeds(model, text, cfg) for text in texts]
+    length = max(p.size(1) for p in prompts)
+    embeds = prompts[0].new_zeros(len(texts) * rows, length, prompts[0].size(2))
+    mask = torch.zeros(len(texts) * rows, length, dtype=torch.long, device=embeds.device)
+    for i, prompt in enumerate(prompts):
+        embeds[i * rows:(i + 1) * rows, length - prompt.size(1):] = prompt
+        mask[i * rows:(i + 1) * rows, length - prompt.size(1):] = 1
+    positions = (mask.cumsum(-1) - 1).clamp(min=0)
+
+    processors = [MinPLogitsWarper(min_p=min_p), TopPLogitsWarper(top_p=top_p)]
+    repetition = RepetitionPenaltyLogitsProcessor(penalty=float(repetition_penalty))
+    stop = t3.hp.stop_speech_token
+    generated = torch.full((len(texts), 1), t3.hp.start_speech_token, dtype=torch.long, device=embeds.device)
+    finished = torch.zeros(len(texts), dtype=torch.bool, device=embeds.device)
+    lengths = [None] * len(texts)
+    problems = [None] * len(texts)
+    budgets = torch.tensor(budgets, device=embeds.device)
+
+    output = t3.tfmr(inputs_embeds=embeds, attention_mask=mask, position_ids=positions,
+                     use_cache=True, return_dict=True)
+    for step in range(int(budgets.max())):
+        logits = t3.speech_head(output[0][:, -1, :])
+        if cfg:
+            cond, uncond = logits[0::2], logits[1::2]
+            logits = cond + cfg_weight * (cond - uncond)
+        logits = repetition(generated, logits)
+        if temperature != 1.0:
+            logits = logits / temperature
+        for processor in processors:
+            logits = processor(generated, logits)
+        next_tokens = torch.multinomial(torch.softmax(logits, dim=-1), num_samples=1)
+        next_tokens[finished] = stop  # finished rows only pad the batch from here on
+        generated = torch.cat([generated, next_tokens], dim=1)
+
+        ended = ~finished & ((next_tokens.view(-1) == stop) | (step + 1 >= budgets))
+        for i in ended.nonzero().view(-1).tolist():
+            lengths[i] = step + 1
+        finished |= ended
+        if detect and (step + 1) % CHECK_EVERY == 0:
+            # The guard's check, as it runs on every CHECK_EVERY-th token of a single sentence
+            for i in (~finished).nonzero().view(-1).tolist():
+                runaway = check_runaway(generated[i, 1:].tolist())
+                if runaway is not None:
+                    reason, cut = runaway
+                    problems[i] = RunawayGeneration(reason, step + 1, cut)
+                    lengths[i] = step + 1
+                    finished[i] = True
+        if bool(finished.all()):
+            break
+
+        next_embed = t3.speech_emb(next_tokens) + t3.speech_pos_emb.get_fixed_embedding(step + 1)
+        if cfg:
+            next_embed = next_embed.repeat_interleave(2, dim=0)
+        mask = torch.cat([mask, mask.new_ones(mask.size(0), 1)], dim=1)
+        positions = positions[:, -1:] + 1
+        output = t3.tfmr(inputs_embeds=next_embed, attention_mask=mask, position_ids=positions,
+                         past_key_values=output.past_key_values, use_cache=True, return_dict=True)
+
+    results = []
+    for i in range(len(texts)):
+        n = lengths[i] or generated.size(1) - 1
+        tokens = generated[i, 1:n + 1]
+        if problems[i] is None and bool(tokens[-1] != stop) and n >= int(budgets[i]):
+            problems[i] = 'length budget'
+        results.append((tokens, problems[i]))
+    return results
+
+
+def _vocode(model, speech_tokens):
+    """S3Gen waveform of one sentence's speech tokens, post-processed as ChatterboxTTS.generate does"""
+    from chatterbox.models.s3tokenizer import drop_invalid_tokens
+
+    with torch.inference_mode():
+        speech_tokens = drop_invalid_tokens(speech_tokens)
+        speech_tokens = speech_tokens[speech_tokens < SPEECH_VOCAB_SIZE].to(model.device)
+        wav, _ = model.s3gen.inference(speech_tokens=speech_tokens, ref_dict=model.conds.gen)
+        wav = wav.squeeze(0).detach().cpu().numpy()
+        wav = model.watermarker.apply_watermark(wav, sample_rate=model.sr)
+    return torch.from_numpy(wav).unsqueeze(0)
+
+
+def generate_batch(model, texts, exaggeration=0.5, **params):
+    """Generate several sentences with one batched T3 decode; one waveform per text.
+
+    T3's token-by-token decoding is where generation time goes and what
+    batching speeds up; S3Gen then renders each sentence's tokens on its own,
+    since it is a single non-autoregressive pass per sentence. Uses the
+    model's current conditioning (one voice per batch). When the generation
+    guard is installed its loop and silence check runs on every row; a row
+    it stops, or one that reaches its length budget, is recorded as a guard
+    trigger and generated again through ``model.generate``, which retries it
+    as usual. Every other row is recorded in ``model.metrics`` (if attached)
+    with an equal share of the batch decode time plus its own S3Gen time.
+    """
+    from tts_guard import token_budget
+
+    if model.conds is None:
+        raise ValueError("no voice conditioning on the model")
+    guard = getattr(model, 'guard', None)
+    metrics = getattr(model, 'metrics', None)
+    _set_exaggeration(model, exaggeration)
+    budgets = [min(MAX_NEW_TOKENS, token_budget(text)) for text in texts]
+    start = time.perf_counter()
+    decoded = _decode_batch(model, texts, budgets, detect=guard is not None, **params)
+    decode_share = (time.perf_counter() - start) / len(texts)
+    wavs = []
+    for text, (tokens, problem) in zip(texts, decoded):
+        if problem is not None:
+            if guard is not None:
+                reason = getattr(problem, 'reason', problem)
+                guard.record(text, 0, reason, getattr(problem, 'position', len(tokens)))
+            print(f"Batched sentence stopped ({problem}), generating it alone: {text[:60]}...")
+            wavs.append(model.generate(text, exaggeration=exaggeration, **params))  # recorded by metrics
+            continue
+        start = time.perf_counter()
+        wav = _vocode(model, tokens)
+        if metrics is not None:
+            metrics.record_sentence(text, decode_share + time.perf_counter() - start, wav.shape[-1] / model.sr)
+        wavs.append(wav)
+    return wavs
+
+
+def _generate_batch(model, texts, seed=None, **params):
+    """Generate a list of texts, returning one waveform or exception per text"""
+    if len(texts) > 1:
+        if seed is not None:
+            torch.manual_seed(seed)
+        try:
+            return generate_batch(model, texts, **params)
+        except Exception as e:
+            print(f"Batched generation failed, retrying sentences one by one: {e}")
+
+    results = []
+    for text in texts:
+        try:
+            if seed is not None:
+                torch.manual_seed(seed)
+            results.append(model.generate(text, **params))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def generate_batched(model, sentences, batch_size=BATCH_SIZE, cache=None, ref_hash=None, seed=None, **params):
+    """Yield ``(index, wav)`` for every sentence, in the original order.
+
+    Sentences are grouped into length-sorted batches and each batch is decoded
+    together by ``generate_batch`` (a batch of one, or a batch that fails,
+    goes through per-sentence ``generate`` calls). Batched rows share one
+    random stream, so with a seed they are reproducible per batch, not per
+    sentence. A failed sentence yields its exception in place of the
+    waveform. With a ``cache`` only the misses are generated.
+    """
+    ready = {}
+    pending = []
+    variant = model_variant(model)
+    for i, sentence in enumerate(sentences):
+        if cache is not None:
+            wav = cache.get(cache.key(sentence, ref_hash, params, seed, variant))
+            if wav is not None:
+                ready[i] = wav
+                continue
+        pending.append(i)
+
+    next_index = 0
+    pending_texts = [sentences[i] for i in pending]
+    for batch in length_batches(pending_texts, batch_size):
+        indices = [pending[b] for b in batch]
+        wavs = _generate_batch(model, [sentences[i] for i in indices], seed=seed, **params)
+        for i, wav in zip(indices, wavs):
+            if cache is not None and not isinstance(wav, Exception):
+                cache.put(cache.key(sentences[i], ref_hash, params, seed, variant), wav)
+            ready[i] = wav
+
+        # Release everything that is now contiguous with what was already yielded
+        while next_index in ready:
+            yield next_index, ready.pop(next_index)
+            next_index += 1
+
+    while next_index in ready:
+        yield next_index, ready.pop(next_index)
+        next_index += 1
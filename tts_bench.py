@@ -0,0 +1,237 @@
+"""End-to-end synthesis benchmark on the fixed corpus (text_input.txt and audio_samples/).
+
+Every stage of the pipeline is timed separately: segmentation, reference
+preparation, conditioning, generation, sentence-file writing and article
+concatenation. ``--backend stub`` swaps the model for a deterministic
+generator so the harness itself can run without model weights. Results are
+saved as JSON and can be compared against an earlier run with ``--baseline``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import torch
+import torchaudio as ta
+
+from tts_cli import DEFAULT_SAMPLES_DIR, DEFAULT_TEXT_FILE, find_audio_samples
+from tts_output import StreamingWavWriter
+from tts_reference import ReferenceAudioCache
+from tts_text import clean_text_for_tts, estimate_duration
+from tts_voice_cache import hash_audio
+
+BENCH_OUTPUT_DIR = "/workspace/output/bench"
+STAGES = ['segmentation', 'model_load', 'reference_prep', 'conditioning', 'generation', 'writing', 'concatenation']
+# Relative slowdown of a stage or metric that counts as a regression against the baseline
+DEFAULT_TOLERANCE = 0.10
+
+
+class StubBackend:
+    """Deterministic stand-in for ChatterboxTTS: noise shaped like speech, as long as the text implies"""
+
+    name = 'stub'
+    sr = 24000
+
+    def load(self, device):
+        pass
+
+    def condition(self, reference_audio, exaggeration):
+        self.voice = hash_audio(reference_audio) if reference_audio is not None else 'default'
+
+    def generate(self, text, seed):
+        digest = hashlib.sha256(f"{self.voice}:{seed}:{text}".encode('utf-8')).digest()
+        rng = np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+        n = max(1, int(estimate_duration([text]) * self.sr))
+        envelope = 0.5 * (1 - np.cos(np.linspace(0, 2 * np.pi * max(1, n // self.sr), n)))
+        return torch.from_numpy((rng.standard_normal(n) * 0.1 * envelope).astype(np.float32)).unsqueeze(0)
+
+
+class ChatterboxBackend:
+    """The real model, loaded with the configured inference profile and guard"""
+
+    name = 'chatterbox'
+
+    def load(self, device):
+        from tts_models import load_model
+        from tts_voice_cache import VoiceConditioningCache
+        from tts_config import TTS_PARAMS
+
+        self.model = load_model(device)
+        self.sr = self.model.sr
+        self.params = TTS_PARAMS
+        # Memory-only cache, so every voice pays the full conditioning cost
+        self.voice_cache = VoiceConditioningCache(cache_dir=None)
+
+    def condition(self, reference_audio, exaggeration):
+        self.voice_cache.apply(self.model, reference_audio, exaggeration)
+
+    def generate(self, text, seed):
+        torch.manual_seed(seed)
+        return self.model.generate(text, **self.params)
+
+
+BACKENDS = {'stub': StubBackend, 'chatterbox': ChatterboxBackend}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_benchmark(backend, text_file, voices, device='cpu', max_sentences=None, seed=0, exaggeration=0.3):
+    """Run the corpus through ``backend`` once and return the result record"""
+    timings = dict.fromkeys(STAGES, 0.0)
+    started = time.perf_counter()
+
+    t0 = time.perf_counter()
+    with open(text_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    sentences = clean_text_for_tts(text)
+    if max_sentences:
+        sentences = sentences[:max_sentences]
+    timings['segmentation'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    backend.load(device)
+    timings['model_load'] = time.perf_counter() - t0
+
+    references = ReferenceAudioCache()  # fresh, so reference prep is measured cold
+    work_dir = tempfile.mkdtemp(prefix='bench_', dir=BENCH_OUTPUT_DIR)
+    audio_seconds = 0.0
+    generated = 0
+    try:
+        for voice in voices:
+            t0 = time.perf_counter()
+            reference_audio = references.prepare(voice) if voice else None
+            timings['reference_prep'] += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            backend.condition(reference_audio, exaggeration)
+            timings['conditioning'] += time.perf_counter() - t0
+
+            voice_dir = os.path.join(work_dir, os.path.splitext(os.path.basename(voice or 'default'))[0])
+            os.makedirs(voice_dir, exist_ok=True)
+            wavs = []
+            for i, sentence in enumerate(sentences):
+                t0 = time.perf_counter()
+                wav = backend.generate(sentence, seed)
+                timings['generation'] += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                ta.save(os.path.join(voice_dir, f'sentence_{i+1:03d}.wav'), wav, backend.sr)
+                timings['writing'] += time.perf_counter() - t0
+                wavs.append(wav)
+                audio_seconds += wav.shape[-1] / backend.sr
+                generated += 1
+
+            t0 = time.perf_counter()
+            with StreamingWavWriter(os.path.join(voice_dir, 'complete_article.wav'), backend.sr) as writer:
+                for wav in wavs:
+                    writer.append(wav)
+            timings['concatenation'] += time.perf_counter() - t0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total = time.perf_counter() - started
+    synthesis = total - timings['model_load']
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'backend': backend.name,
+        'device': device,
+        'profile': os.environ.get('TTS_PROFILE', 'default'),
+        'corpus': {
+            'text_sha256': hashlib.sha256(text.encode('utf-8')).hexdigest()[:16],
+            'sentences': len(sentences),
+            'voices': [os.path.basename(v) if v else 'default' for v in voices],
+        },
+        'stages_s': {k: round(v, 4) for k, v in timings.items()},
+        'metrics': {
+            'total_s': round(total, 3),
+            'audio_s': round(audio_seconds, 3),
+            # RTF excludes the one-off model load; below 1.0 is faster than real time
+            'rtf': round(synthesis / audio_seconds, 4) if audio_seconds else None,
+            'generation_rtf': round(timings['generation'] / audio_seconds, 4) if audio_seconds else None,
+            'sentences_per_s': round(generated / synthesis, 4) if synthesis else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        },
+    }
+
+
+def compare_to_baseline(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Print per-stage and metric deltas; return the names that regressed beyond ``tolerance``"""
+    if baseline.get('backend') != result['backend'] or baseline.get('corpus') != result['corpus']:
+        print("Baseline used a different backend or corpus; deltas are not comparable.")
+    regressions = []
+    print(f"\n{'':<18} {'baseline':>10} {'current':>10} {'change':>8}")
+    # Lower is better for everything except throughput
+    rows = [(f"stage {k}", baseline['stages_s'].get(k), v, False) for k, v in result['stages_s'].items()]
+    rows += [(k, baseline['metrics'].get(k), v, k == 'sentences_per_s') for k, v in result['metrics'].items()]
+    for name, old, new, higher_is_better in rows:
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ''
+        # Stages that take a few milliseconds are too noisy to flag; audio length is not a cost
+        noisy = name.startswith('stage') and max(old, new) < 0.05
+        if worse > tolerance and not noisy and name != 'audio_s':
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<18} {old:>10.3f} {new:>10.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def print_result(result):
+    print(f"\nBenchmark ({result['backend']}, {result['device']}, profile {result['profile']}): "
+          f"{result['corpus']['sentences']} sentences x {len(result['corpus']['voices'])} voices")
+    for stage, seconds in result['stages_s'].items():
+        print(f"  {stage:<15} {seconds:>9.3f}s")
+    m = result['metrics']
+    print(f"  audio {m['audio_s']:.1f}s in {m['total_s']:.1f}s: RTF {m['rtf']}, generation RTF {m['generation_rtf']}, "
+          f"{m['sentences_per_s']} sentences/s, peak RSS {m['peak_rss_mb']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the synthesis pipeline on the fixed corpus.")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='stub')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--text', default=DEFAULT_TEXT_FILE)
+    parser.add_argument('--samples-dir', default=DEFAULT_SAMPLES_DIR)
+    parser.add_argument('--sentences', type=int, help="limit the corpus to the first N sentences")
+    parser.add_argument('--voices', type=int, help="limit the corpus to the first N voices")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="result JSON (default: output/bench/bench_<backend>_<timestamp>.json)")
+    parser.add_argument('--baseline', help="earlier result JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    voices = find_audio_samples(args.samples_dir)[:args.voices] or [None]
+    os.makedirs(BENCH_OUTPUT_DIR, exist_ok=True)
+    result = run_benchmark(BACKENDS[args.backend](), args.text, voices, args.device, args.sentences, args.seed)
+    print_result(result)
+
+    output = args.output or os.path.join(
+        BENCH_OUTPUT_DIR, f"bench_{args.backend}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+"""Command line front end for the processing scripts.
+
+Only the standard library and the text segmenter are imported up front, so
+bad paths, empty sample directories and unreadable text fail in well under a
+second. torch, chatterbox and the model are loaded only once synthesis
+starts; ``--dry-run`` stops after printing the plan.
+"""
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+from tts_text import clean_text_for_tts, estimate_duration, limit_sentences
+
+DEFAULT_TEXT_FILE = "/workspace/text_input.txt"
+DEFAULT_SAMPLES_DIR = "/workspace/audio_samples"
+REFERENCE_PATHS = [
+    "/workspace/reference.wav",
+    "/workspace/reference.mp3",
+    "/workspace/reference.m4a",
+    "/workspace/reference_audio.wav",
+    "/workspace/voice_sample.wav",
+]
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.flac', '.m4a', '.ogg', '.aiff'}
+
+# mode: (module, entry function)
+MODES = {
+    'single': ('process_text', 'process_long_text'),
+    'enhanced': ('process_text_enhanced', 'process_long_text_enhanced'),
+    'multi': ('process_text_multi_samples', 'process_text_with_multiple_samples'),
+}
+
+
+def find_audio_samples(samples_dir=DEFAULT_SAMPLES_DIR):
+    """Sorted audio files directly inside ``samples_dir``; empty if it does not exist"""
+    if not os.path.isdir(samples_dir):
+        return []
+    return sorted(str(p) for p in Path(samples_dir).iterdir()
+                  if p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS)
+
+
+def find_reference(paths=REFERENCE_PATHS):
+    """First existing reference clip from ``paths``, or None for the default voice"""
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_sentences(text_file):
+    with open(text_file, 'r', encoding='utf-8') as f:
+        return clean_text_for_tts(f.read())
+
+
+def print_plan(mode, sentences, voices):
+    selected = limit_sentences(sentences)
+    duration = estimate_duration(selected)
+    print(f"Plan ({mode}):")
+    print(f"  sentences: {len(sentences)} found, {len(selected)} to synthesize")
+    print(f"  estimated audio: {duration:.0f}s per voice, {duration * len(voices):.0f}s total")
+    print(f"  voices: {len(voices)}")
+    for voice in voices:
+        print(f"    - {Path(voice).name if voice else 'default voice'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthesize a text file with Chatterbox TTS.")
+    parser.add_argument('mode', choices=sorted(MODES), help="single voice, enhanced (reference clip) or every sample")
+    parser.add_argument('--text', default=DEFAULT_TEXT_FILE, help="input text file")
+    parser.add_argument('--samples-dir', default=DEFAULT_SAMPLES_DIR, help="audio samples for multi mode")
+    parser.add_argument('--reference', help="reference clip for enhanced mode (default: first of the usual names)")
+    parser.add_argument('--dry-run', action='store_true', help="validate inputs and print the plan without synthesizing")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.text):
+        print(f"Text input file not found: {args.text}")
+        return 1
+    try:
+        sentences = read_sentences(args.text)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Could not read {args.text}: {e}")
+        return 1
+    if not sentences:
+        print(f"No speakable sentences in {args.text}")
+        return 1
+
+    kwargs = {'sentences': sentences}
+    if args.mode == 'multi':
+        voices = find_audio_samples(args.samples_dir)
+        if not voices:
+            print(f"No audio samples found in {args.samples_dir}/")
+            print(f"Supported formats: {', '.join(sorted(AUDIO_EXTENSIONS))}")
+            return 1
+        kwargs['audio_samples'] = voices
+    elif args.mode == 'enhanced':
+        reference = args.reference or find_reference()
+        if args.reference and not os.path.isfile(args.reference):
+            print(f"Reference audio file not found: {args.reference}")
+            return 1
+        voices = [reference]
+        kwargs['reference_path'] = reference
+    else:
+        voices = [None]
+
+    print_plan(args.mode, sentences, voices)
+    if args.dry_run:
+        return 0
+
+    # Heavy imports and the model load happen here, after every cheap check passed
+    module_name, function_name = MODES[args.mode]
+    entry = getattr(importlib.import_module(module_name), function_name)
+    entry(**kwargs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
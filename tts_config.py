@@ -0,0 +1,48 @@
+import os
+
+from tts_cli import find_audio_samples
+from tts_reference import prepare_reference
+from tts_voice_cache import VoiceConditioningCache, DEFAULT_CACHE_DIR
+
+AUDIO_SAMPLES_DIR = "/workspace/audio_samples"
+
+# Conditionals are reused across sentences, voices and runs
+VOICE_CACHE = VoiceConditioningCache(cache_dir=DEFAULT_CACHE_DIR)
+
+# Fixed seed makes reruns reproducible; it is part of the sentence cache key
+SEED = int(os.environ['TTS_SEED']) if os.environ.get('TTS_SEED') else None
+
+# Enhanced TTS parameters for more realistic speech
+TTS_PARAMS = {
+    'repetition_penalty': 1.1,  # Reduce repetitive patterns
+    'min_p': 0.02,             # Lower for more natural variation
+    'top_p': 0.95,             # Slightly reduce for consistency
+    'temperature': 0.7,        # Lower for more stable speech
+    'exaggeration': 0.3,       # Lower for more natural prosody
+    'cfg_weight': 0.7,         # Higher for better quality
+}
+
+
+def prepare_reference_audio(audio_path, target_sr=24000, max_duration=10.0):
+    """Prepare reference audio for voice cloning"""
+    if not os.path.exists(audio_path):
+        print(f"Reference audio file not found: {audio_path}")
+        return None
+
+    print(f"Processing reference audio: {audio_path}")
+
+    # Trimmed, length-capped and resampled in memory; cached by file content
+    reference_audio = prepare_reference(audio_path, target_sr=target_sr, max_duration=max_duration, top_db=20)
+
+    print(f"Duration: {len(reference_audio) / target_sr:.2f} seconds")
+
+    return reference_audio
+
+
+def get_audio_samples():
+    """Get all audio files from the audio_samples directory"""
+    if not os.path.exists(AUDIO_SAMPLES_DIR):
+        print(f"Audio samples directory not found: {AUDIO_SAMPLES_DIR}")
+        return []
+
+    return find_audio_samples(AUDIO_SAMPLES_DIR)
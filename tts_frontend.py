@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import torch
+
+FRONTEND_ENABLED = os.environ.get('TTS_TEXT_FRONTEND', '1') != '0'
+
+
+def normalize(text):
+    """The punctuation normalization ChatterboxTTS.generate applies before tokenizing"""
+    from chatterbox.tts import punc_norm
+    return punc_norm(text)
+
+
+class TextFrontend:
+    """Tokenize each sentence once, however many voices speak it, for one run.
+
+    ``model.generate`` normalizes and tokenizes its text on every call, so a
+    run with N voices does that work N times per sentence. While open, the
+    front end takes over ``model.tokenizer.text_to_tokens`` (generate still
+    runs the cheap punctuation normalization first, which gives the cache
+    key): token ids of every sentence seen (or passed to ``prepare`` up
+    front) are kept in one contiguous int32 array with an (offset, length)
+    entry per normalized text, and later calls are served from that array.
+    ``close`` gives the tokenizer back, so the model is unchanged afterwards.
+    """
+
+    def __init__(self, model):
+        self._tokenizer = model.tokenizer
+        self._text_to_tokens = model.tokenizer.text_to_tokens
+        self._tokens = np.empty(1024, dtype=np.int32)
+        self._used = 0
+        self._offsets = {}  # normalized text -> (start, length)
+        self.hits = 0
+        self.misses = 0
+        model.tokenizer.text_to_tokens = self.text_to_tokens
+
+    def _add(self, text):
+        ids = self._text_to_tokens(text).reshape(-1).numpy().astype(np.int32, copy=False)
+        if self._used + len(ids) > len(self._tokens):
+            grown = np.empty(max(2 * len(self._tokens), self._used + len(ids)), dtype=np.int32)
+            grown[:self._used] = self._tokens[:self._used]
+            self._tokens = grown
+        self._tokens[self._used:self._used + len(ids)] = ids
+        self._offsets[text] = (self._used, len(ids))
+        self._used += len(ids)
+
+    def prepare(self, sentences):
+        """Tokenize ``sentences`` ahead of generation (text already seen is skipped)"""
+        for sentence in sentences:
+            text = normalize(sentence)
+            if text not in self._offsets:
+                self._add(text)
+
+    def text_to_tokens(self, text, *args, **kwargs):
+        """Drop-in for ``tokenizer.text_to_tokens``: a (1, n) int32 tensor of token ids"""
+        if args or kwargs:
+            return self._text_to_tokens(text, *args, **kwargs)  # language options are not cached
+        entry = self._offsets.get(text)
+        if entry is None:
+            self.misses += 1
+            self._add(text)
+            entry = self._offsets[text]
+        else:
+            self.hits += 1
+        start, length = entry
+        # Later appends may reallocate the array, so the tensor gets its own copy of the ids
+        return torch.from_numpy(self._tokens[start:start + length].copy()).unsqueeze(0)
+
+    def close(self):
+        """Restore the model's own tokenizer"""
+        if self._tokenizer.text_to_tokens == self.text_to_tokens:
+            self._tokenizer.text_to_tokens = self._text_to_tokens
+
+    def report(self):
+        return (f"Text front-end: {len(self._offsets)} sentences, {self._used} tokens "
+                f"({self._used * 4 / 1024:.1f} KB), {self.hits} reused, {self.misses} tokenized on demand")
+
+
+def open_frontend(model, sentences=()):
+    """A TextFrontend on ``model`` with ``sentences`` tokenized up front; None when TTS_TEXT_FRONTEND=0"""
+    if not FRONTEND_ENABLED:
+        return None
+    frontend = TextFrontend(model)
+    frontend.prepare(sentences)
+    return frontend
@@ -0,0 +1,198 @@
+import os
+import threading
+
+import torch
+
+from tts_text import estimate_duration
+
+GUARD_ENABLED = os.environ.get('TTS_GUARD', '1') != '0'
+# Extra attempts with a fresh random stream after a runaway sentence
+GUARD_RETRIES = int(os.environ.get('TTS_GUARD_RETRIES', '1'))
+# Audio allowed per chunk: this multiple of the narration-pace estimate plus a fixed allowance
+BUDGET_FACTOR = float(os.environ.get('TTS_GUARD_BUDGET_FACTOR', '2.0'))
+BUDGET_PAD_S = float(os.environ.get('TTS_GUARD_BUDGET_PAD_S', '2.0'))
+# Decoding stops once this much audio is made of only a few distinct tokens
+SILENCE_S = float(os.environ.get('TTS_GUARD_SILENCE_S', '2.0'))
+
+SPEECH_TOKEN_RATE = 25  # S3 speech tokens per second of audio
+SILENCE_MAX_DISTINCT = 3
+# A phrase of 8-100 tokens (0.3-4 s) heard three times in a row is a loop
+LOOP_REPEATS = 3
+LOOP_MIN_PERIOD = 8
+LOOP_MAX_PERIOD = 100
+LOOP_MATCH = 0.8  # share of positions that must agree between repeats
+CHECK_EVERY = 25  # tokens between runaway checks
+
+
+class RunawayGeneration(Exception):
+    """Raised from inside decoding to stop a runaway sentence"""
+
+    def __init__(self, reason, position, cut):
+        super().__init__(f"{reason} after {position} tokens")
+        self.reason = reason
+        self.position = position
+        self.cut = cut
+
+
+def token_budget(text):
+    """Maximum speech tokens for a chunk, from its text length at narration pace"""
+    seconds = estimate_duration([text]) * BUDGET_FACTOR + BUDGET_PAD_S
+    return int(seconds * SPEECH_TOKEN_RATE)
+
+
+def find_loop(tokens):
+    """Period of a phrase repeating at the end of ``tokens``, or None"""
+    n = len(tokens)
+    for period in range(LOOP_MIN_PERIOD, min(LOOP_MAX_PERIOD, n // LOOP_REPEATS) + 1):
+        tail = tokens[n - period:]
+        for r in range(1, LOOP_REPEATS):
+            segment = tokens[n - (r + 1) * period:n - r * period]
+            if sum(a == b for a, b in zip(segment, tail)) < LOOP_MATCH * period:
+                break
+        else:
+            return period
+    return None
+
+
+def check_runaway(tokens):
+    """Return (reason, tokens worth keeping) when decoding has run away, else None"""
+    window = int(SILENCE_S * SPEECH_TOKEN_RATE)
+    if len(tokens) >= window and len(set(tokens[-window:])) <= SILENCE_MAX_DISTINCT:
+        # Keep half a second of the pause as a natural ending
+        return 'trailing silence', len(tokens) - window + SPEECH_TOKEN_RATE // 2
+    period = find_loop(tokens)
+    if period is not None:
+        return 'repetition', len(tokens) - (LOOP_REPEATS - 1) * period
+    return None
+
+
+def _rng_state():
+    cuda = torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None
+    return torch.get_rng_state(), cuda
+
+
+def _set_rng_state(state):
+    cpu, cuda = state
+    torch.set_rng_state(cpu)
+    if cuda is not None:
+        torch.cuda.set_rng_state_all(cuda)
+
+
+class GenerationGuard:
+    """Watch ChatterboxTTS decoding and stop sentences that run away.
+
+    Each ``generate`` call gets a speech-token budget derived from its text
+    (passed to T3 as ``max_new_tokens``). While decoding, every sampled token
+    is seen through a hook on T3's speech embedding; a looping phrase or a
+    long stretch of silence stops decoding early. The sentence is retried on
+    a fresh random stream, and if every attempt runs away the first one is
+    replayed from its RNG state with the runaway tail cut off. Triggers are
+    kept in ``triggers`` for the run summary.
+    """
+
+    def __init__(self, model, retries=GUARD_RETRIES):
+        self.model = model
+        self.retries = retries
+        self.triggers = []
+        self._generate = model.generate
+        self._inference = model.t3.inference
+        self._state = threading.local()
+        hp = model.t3.hp
+        self._control_tokens = {hp.start_speech_token, hp.stop_speech_token}
+
+        model.t3.inference = self._guarded_inference
+        model.t3.speech_emb.register_forward_pre_hook(self._on_token)
+        model.generate = self.generate
+
+    def _guarded_inference(self, *args, **kwargs):
+        state = self._state
+        budget = getattr(state, 'budget', None)
+        if budget is not None:
+            kwargs['max_new_tokens'] = min(kwargs.get('max_new_tokens') or budget, budget)
+        state.tokens = []
+        state.active = True
+        try:
+            return self._inference(*args, **kwargs)
+        finally:
+            state.active = False
+
+    def _on_token(self, module, args):
+        state = self._state
+        if not getattr(state, 'active', False):
+            return
+        tokens = args[0]
+        # Decoding embeds one sampled token per step; prompts and control tokens are skipped
+        if tokens.numel() != 1:
+            return
+        token = int(tokens.item())
+        if token in self._control_tokens:
+            return
+        state.tokens.append(token)
+        if state.detect and len(state.tokens) % CHECK_EVERY == 0:
+            runaway = check_runaway(state.tokens)
+            if runaway is not None:
+                reason, cut = runaway
+                raise RunawayGeneration(reason, len(state.tokens), cut)
+
+    def _attempt(self, text, budget, detect, params):
+        state = self._state
+        state.budget = budget
+        state.detect = detect
+        try:
+            wav = self._generate(text, **params)
+            # The step that reaches the budget is not embedded, hence the -1
+            return wav, len(state.tokens) >= budget - 1
+        finally:
+            state.budget = None
+            state.detect = False
+
+    def record(self, text, attempt, reason, tokens):
+        """Keep one trigger for the report; ``tokens`` is where the sentence was stopped"""
+        self.triggers.append({'text': text[:60], 'attempt': attempt, 'reason': reason,
+                              'seconds': tokens / SPEECH_TOKEN_RATE})
+        print(f"Guard: {reason} at {tokens / SPEECH_TOKEN_RATE:.1f}s (attempt {attempt + 1}) for: {text[:60]}...")
+
+    def generate(self, text, **params):
+        budget = token_budget(text)
+        over_budget = None
+        replay = None
+        for attempt in range(self.retries + 1):
+            rng = _rng_state()
+            try:
+                wav, hit_budget = self._attempt(text, budget, True, params)
+            except RunawayGeneration as e:
+                self.record(text, attempt, e.reason, e.position)
+                if replay is None:
+                    replay = (rng, e.cut)
+                continue
+            if not hit_budget:
+                return wav
+            self.record(text, attempt, 'length budget', budget)
+            if over_budget is None:
+                over_budget = wav
+
+        if over_budget is not None:
+            return over_budget
+        # Same RNG state reproduces the same tokens, so this stops just before the runaway part
+        rng, cut = replay
+        _set_rng_state(rng)
+        wav, _ = self._attempt(text, max(1, cut), False, params)
+        return wav
+
+    def report(self):
+        if not self.triggers:
+            return "Generation guard: no runaway sentences"
+        counts = {}
+        for trigger in self.triggers:
+            counts[trigger['reason']] = counts.get(trigger['reason'], 0) + 1
+        summary = ', '.join(f"{n} {reason}" for reason, n in sorted(counts.items()))
+        lines = [f"Generation guard: {len(self.triggers)} triggers ({summary})"]
+        for t in self.triggers:
+            lines.append(f"  - {t['reason']} at {t['seconds']:.1f}s, attempt {t['attempt'] + 1}: {t['text']}")
+        return '\n'.join(lines)
+
+
+def install_guard(model):
+    """Guard ``model.generate`` in place (unless TTS_GUARD=0); the guard is kept on ``model.guard``"""
+    model.guard = GenerationGuard(model) if GUARD_ENABLED else None
+    return model.guard
@@ -0,0 +1,165 @@
+"""Random access to sentences inside a complete article via its ``.index.json`` sidecar.
+
+WAV articles are memory-mapped, so ``sentence`` and ``span`` return int16
+views into the file without copying or reading the rest of it. Compressed
+articles (FLAC, Opus, MP3) are decoded for just the requested range.
+
+    reader = ArticleReader('/workspace/output/latest/female_american/complete_article.wav')
+    samples = reader.sentence(3)            # int16 view, no copy
+    reader.write_sentence(3, 'sentence_004.wav')
+"""
+import argparse
+import json
+import os
+import struct
+import wave
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+Segment = namedtuple('Segment', ['index', 'start', 'length', 'start_s', 'duration_s', 'text'])
+
+
+def index_path_for(path):
+    """The sidecar index of an article (or the index path itself)"""
+    path = Path(path)
+    if path.name.endswith('.index.json'):
+        return path
+    return path.with_suffix('.index.json')
+
+
+def wav_data_chunk(path):
+    """Return (byte offset, sample count) of a mono 16-bit PCM WAV's data chunk"""
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None or fmt[0] != 1 or fmt[1] != 1 or fmt[5] != 16:
+                    raise ValueError(f"{path} is not mono 16-bit PCM")
+                offset = f.tell()
+                present = os.path.getsize(path) - offset
+                # wave writes 0 until close and streams use 0xFFFFFFFF: both mean "until end of file"
+                size = present if size in (0, 0xFFFFFFFF) else min(size, present)
+                return offset, size // 2
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+class ArticleReader:
+    """Sentences of one complete article, located through its offset index"""
+
+    def __init__(self, path):
+        index_path = index_path_for(path)
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.path = str(index_path.parent / index['file'])
+        self.format = index['format']
+        self.sr = index['sample_rate']
+        self.frames = index['frames']
+        columns = index.get('columns', Segment._fields[:3])
+        self.segments = [Segment(**{**dict.fromkeys(Segment._fields), **dict(zip(columns, entry))})
+                         for entry in index['segments']]
+        self._by_index = {segment.index: segment for segment in self.segments}
+        self._samples = None
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    @property
+    def samples(self):
+        """The whole article as an int16 memory map (WAV only)"""
+        if self.format != 'wav':
+            raise ValueError(f"{self.path} is {self.format}; only WAV articles can be memory-mapped")
+        if self._samples is None:
+            offset, count = wav_data_chunk(self.path)
+            self._samples = np.memmap(self.path, dtype='<i2', mode='r', offset=offset, shape=(count,))
+        return self._samples
+
+    def segment(self, index):
+        """Index entry of sentence ``index`` (the sentence number used when the article was written)"""
+        try:
+            return self._by_index[index]
+        except KeyError:
+            raise KeyError(f"sentence {index} is not in {self.path}") from None
+
+    def _read(self, start, stop):
+        if self.format == 'wav':
+            return self.samples[start:stop]
+        import soundfile as sf
+        samples, _ = sf.read(self.path, start=start, stop=stop, dtype='int16')
+        return samples.reshape(-1)
+
+    def sentence(self, index):
+        """int16 samples of one sentence; a zero-copy view for WAV articles"""
+        seg = self.segment(index)
+        return self._read(seg.start, seg.start + seg.length)
+
+    def span(self, first, last):
+        """int16 samples from the start of sentence ``first`` to the end of sentence ``last``"""
+        start = self.segment(first).start
+        end = self.segment(last)
+        return self._read(start, end.start + end.length)
+
+    def at_time(self, seconds):
+        """The sentence playing at ``seconds`` into the article, or None"""
+        position = int(seconds * self.sr)
+        for seg in self.segments:
+            if seg.start <= position < seg.start + seg.length:
+                return seg
+        return None
+
+    def write_sentence(self, index, path, fmt=None):
+        """Rebuild a standalone file for one sentence; the format follows ``fmt`` or the path suffix"""
+        samples = self.sentence(index)
+        if fmt == 'wav' or (fmt is None and Path(path).suffix.lower() == '.wav'):
+            with wave.open(str(path), 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(self.sr)
+                w.writeframes(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+            return str(path)
+        from tts_output import FORMATS, encode_audio, with_format
+        if fmt is None:
+            suffix = Path(path).suffix.lower()
+            fmt = next((name for name, spec in FORMATS.items() if spec[2] == suffix), self.format)
+        path = with_format(path, fmt)
+        encode_audio(path, samples.astype(np.float32) / 32768.0, self.sr, fmt)
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or extract sentences of a complete article.")
+    parser.add_argument('article', help="complete article audio file or its .index.json")
+    parser.add_argument('--extract', type=int, nargs='+', metavar='N', help="sentence numbers (1-based) to write out")
+    parser.add_argument('--output-dir', default='.', help="where extracted sentence files go")
+    args = parser.parse_args()
+
+    reader = ArticleReader(args.article)
+    if not args.extract:
+        print(f"{reader.path}: {len(reader)} sentences, {reader.frames / reader.sr:.1f}s at {reader.sr} Hz")
+        for seg in reader:
+            text = (seg.text or '')[:60]
+            print(f"  {seg.index + 1:>4}  {seg.start / reader.sr:8.2f}s  {seg.length / reader.sr:6.2f}s  {text}")
+        return
+    os.makedirs(args.output_dir, exist_ok=True)
+    for number in args.extract:
+        path = reader.write_sentence(number - 1, os.path.join(args.output_dir, f'sentence_{number:03d}.wav'))
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
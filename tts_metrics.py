@@ -0,0 +1,194 @@
+import functools
+import json
+import os
+import resource
+import threading
+import time
+from datetime import datetime
+
+# JSONL events go to <dir>/events/, Prometheus text files to <dir>/<source>.prom
+# (point node_exporter's textfile collector at <dir>)
+METRICS_DIR = os.environ.get('TTS_METRICS_DIR', '/workspace/output/metrics')
+METRICS_ENABLED = os.environ.get('TTS_METRICS', '1') != '0'
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+# Sentence length classes (characters) used as a label, so slow lengths stand out
+LENGTH_CLASSES = ((80, 'short'), (200, 'medium'), (float('inf'), 'long'))
+
+
+def current_rss_mb():
+    """Resident memory of this process now; falls back to the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def length_class(text):
+    for limit, name in LENGTH_CLASSES:
+        if len(text) < limit:
+            return name
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class RunMetrics:
+    """Per-sentence and file-output telemetry for one process.
+
+    ``attach`` wraps ``model.generate`` so every call records its latency,
+    audio duration, real-time factor, guard retries, failures and process
+    memory. Each record is appended to a JSONL event file, and aggregate
+    counters and latency histograms (by voice and sentence length) are
+    rewritten to ``<source>.prom`` after every update. Set ``voice`` (and
+    optionally ``params``) before generating so records are labelled.
+    """
+
+    def __init__(self, source, run_id=None, metrics_dir=METRICS_DIR):
+        self.source = source
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.voice = 'default'
+        self.params = None
+        self.enabled = METRICS_ENABLED
+        self.events_path = os.path.join(metrics_dir, 'events', f'{source}_{self.run_id}.jsonl')
+        self.prom_path = os.path.join(metrics_dir, f'{source}.prom')
+        self._lock = threading.Lock()
+        self._sentences = {}   # (voice, status) -> count
+        self._seconds = {}     # voice -> (generation seconds, audio seconds)
+        self._retries = {}     # voice -> guard retries
+        self._latency = {}     # (voice, length class) -> [bucket counts..., sum, count]
+        self._writes = {}      # status -> (files, seconds)
+        self._last_rtf = {}
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.events_path), exist_ok=True)
+            self.event('run_start')
+
+    def event(self, kind, **fields):
+        """Append one JSONL event stamped with time, source and run"""
+        if not self.enabled:
+            return
+        record = {'ts': time.time(), 'event': kind, 'source': self.source, 'run': self.run_id, **fields}
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            with open(self.events_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def attach(self, model):
+        """Instrument ``model.generate``; attaching the same model twice is a no-op"""
+        if not self.enabled or getattr(model, 'metrics', None) is self:
+            return model
+        generate = model.generate
+
+        @functools.wraps(generate)
+        def measured_generate(text, *args, **kwargs):
+            guard = getattr(model, 'guard', None)
+            seen = len(guard.triggers) if guard is not None else 0
+            start = time.perf_counter()
+            try:
+                wav = generate(text, *args, **kwargs)
+            except Exception as e:
+                self.record_sentence(text, time.perf_counter() - start, 0.0, error=str(e))
+                raise
+            retries = len(guard.triggers) - seen if guard is not None else 0
+            self.record_sentence(text, time.perf_counter() - start, wav.shape[-1] / model.sr, retries=retries)
+            return wav
+
+        model.generate = measured_generate
+        model.metrics = self
+        return model
+
+    def record_sentence(self, text, latency_s, audio_s, retries=0, error=None):
+        if not self.enabled:
+            return
+        voice = self.voice
+        status = 'error' if error else 'ok'
+        rtf = latency_s / audio_s if audio_s else None
+        with self._lock:
+            self._sentences[(voice, status)] = self._sentences.get((voice, status), 0) + 1
+            gen, audio = self._seconds.get(voice, (0.0, 0.0))
+            self._seconds[voice] = (gen + latency_s, audio + audio_s)
+            self._retries[voice] = self._retries.get(voice, 0) + retries
+            hist = self._latency.setdefault((voice, length_class(text)), [0] * len(LATENCY_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency_s <= bound:
+                    hist[i] += 1
+            hist[-2] += latency_s
+            hist[-1] += 1
+            if rtf is not None:
+                self._last_rtf[voice] = rtf
+        self.event('sentence', voice=voice, chars=len(text), words=len(text.split()), text=text[:60],
+                   latency_s=round(latency_s, 4), audio_s=round(audio_s, 4),
+                   rtf=round(rtf, 4) if rtf is not None else None, retries=retries, error=error,
+                   rss_mb=round(current_rss_mb(), 1), params=self.params)
+        self.write_prometheus()
+
+    def record_write(self, path, seconds, error=None):
+        """Record one output file write (sentence file or finished article)"""
+        if not self.enabled:
+            return
+        status = 'error' if error else 'ok'
+        with self._lock:
+            files, total = self._writes.get(status, (0, 0.0))
+            self._writes[status] = (files + 1, total + seconds)
+        self.event('write', path=str(path), seconds=round(seconds, 4), error=error)
+
+    def finish(self, **summary):
+        """Write the closing event and the final Prometheus snapshot"""
+        if not self.enabled:
+            return
+        self.event('run_end', rss_mb=round(current_rss_mb(), 1), **summary)
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        """Rewrite ``<source>.prom`` atomically so a scraper never sees a partial file"""
+        if not self.enabled:
+            return
+        src = self.source
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        with self._lock:
+            metric('tts_sentences_total', 'counter', 'Sentences generated, by voice and outcome',
+                   [(_labels(source=src, voice=v, status=s), n) for (v, s), n in sorted(self._sentences.items())])
+            metric('tts_generation_seconds_total', 'counter', 'Time spent in model.generate',
+                   [(_labels(source=src, voice=v), round(g, 4)) for v, (g, _) in sorted(self._seconds.items())])
+            metric('tts_audio_seconds_total', 'counter', 'Audio generated',
+                   [(_labels(source=src, voice=v), round(a, 4)) for v, (_, a) in sorted(self._seconds.items())])
+            metric('tts_guard_retries_total', 'counter', 'Sentences restarted by the generation guard',
+                   [(_labels(source=src, voice=v), n) for v, n in sorted(self._retries.items())])
+            metric('tts_last_sentence_rtf', 'gauge', 'Real-time factor of the most recent sentence',
+                   [(_labels(source=src, voice=v), round(r, 4)) for v, r in sorted(self._last_rtf.items())])
+            samples = []
+            for (voice, length), hist in sorted(self._latency.items()):
+                for bound, count in zip(LATENCY_BUCKETS, hist):
+                    samples.append((_labels(source=src, voice=voice, length=length, le=bound), count))
+                samples.append((_labels(source=src, voice=voice, length=length, le='+Inf'), hist[-1]))
+            lines.append("# HELP tts_sentence_latency_seconds Per-sentence generation latency")
+            lines.append("# TYPE tts_sentence_latency_seconds histogram")
+            lines.extend(f"tts_sentence_latency_seconds_bucket{labels} {value}" for labels, value in samples)
+            for (voice, length), hist in sorted(self._latency.items()):
+                labels = _labels(source=src, voice=voice, length=length)
+                lines.append(f"tts_sentence_latency_seconds_sum{labels} {round(hist[-2], 4)}")
+                lines.append(f"tts_sentence_latency_seconds_count{labels} {hist[-1]}")
+            metric('tts_files_written_total', 'counter', 'Output files written, by outcome',
+                   [(_labels(source=src, status=s), f) for s, (f, _) in sorted(self._writes.items())])
+            metric('tts_write_seconds_total', 'counter', 'Time spent writing output files',
+                   [(_labels(source=src, status=s), round(t, 4)) for s, (_, t) in sorted(self._writes.items())])
+        metric('tts_process_resident_memory_bytes', 'gauge', 'Resident memory of the process',
+               [(_labels(source=src), int(current_rss_mb() * 1024 ** 2))])
+        metric('tts_metrics_updated_timestamp_seconds', 'gauge', 'When this file was last written',
+               [(_labels(source=src), round(time.time(), 3))])
+
+        os.makedirs(os.path.dirname(self.prom_path), exist_ok=True)
+        tmp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prom_path)
@@ -0,0 +1,174 @@
+import functools
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from chatterbox.tts import ChatterboxTTS
+
+from tts_guard import install_guard
+from tts_profile import PROFILE, apply_profile
+
+MODEL_DTYPE = os.environ.get('TTS_MODEL_DTYPE', 'float32')
+# How many (device, dtype) variants may stay loaded, and an optional memory cap for all of them
+MAX_RESIDENT_MODELS = int(os.environ.get('TTS_MAX_RESIDENT_MODELS', '1'))
+MODEL_MEMORY_LIMIT_MB = float(os.environ.get('TTS_MODEL_MEMORY_LIMIT_MB', '0'))
+WARM_UP_TEXT = "Warming up the speech model."
+
+DTYPES = {'float32': torch.float32, 'bfloat16': torch.bfloat16, 'float16': torch.float16}
+
+
+def resolve_device(device):
+    """Map 'auto' (or anything unrecognised) to cuda when available, else cpu"""
+    if device in ("cuda", "cpu"):
+        return device
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def load_model(device, dtype=MODEL_DTYPE, threads=None):
+    """Load ChatterboxTTS on ``device`` with the inference profile and generation guard applied.
+
+    Every entry point loads its model here. Reduced precision runs generation
+    under autocast; ``threads`` overrides the profile's torch thread count.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"unsupported dtype {dtype!r}; choose one of {', '.join(DTYPES)}")
+    model = ChatterboxTTS.from_pretrained(device=device)
+    applied = apply_profile(model, device, PROFILE, threads=threads)
+    if applied:
+        print(f"Inference profile {PROFILE}: {', '.join(applied)}")
+    if dtype != 'float32':
+        # Autocast keeps the conditioning tensors and model weights compatible
+        # without hand-converting every submodule.
+        generate = model.generate
+
+        @functools.wraps(generate)
+        def autocast_generate(*args, **kwargs):
+            with torch.autocast(device_type=device.split(':')[0], dtype=DTYPES[dtype]):
+                return generate(*args, **kwargs)
+
+        model.generate = autocast_generate
+    model.dtype = dtype  # with model.profile, part of the sentence cache key
+    install_guard(model)
+    return model
+
+
+def model_memory_mb(model):
+    """Approximate resident size of a model's parameters and buffers in MB"""
+    total = 0
+    for name in ('t3', 's3gen', 've'):
+        module = getattr(model, name, None)
+        if module is None:
+            continue
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total / 1024 ** 2
+
+
+class ModelRegistry:
+    """Loaded models keyed by (device, dtype), with readiness states and LRU eviction.
+
+    ``get`` loads a variant on first use; ``preload`` does the same in the
+    background and runs a short warm-up synthesis so the first real request
+    does not pay for lazy initialisation. When more than ``max_resident``
+    variants are loaded, or their combined size exceeds ``memory_limit_mb``,
+    the least recently used ones are released.
+    """
+
+    def __init__(self, max_resident=MAX_RESIDENT_MODELS, memory_limit_mb=MODEL_MEMORY_LIMIT_MB):
+        self.max_resident = max(1, max_resident)
+        self.memory_limit_mb = memory_limit_mb
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._states = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def _set_state(self, key, state):
+        with self._lock:
+            self._states[key] = state
+
+    def _evict(self, keep):
+        # Caller holds self._lock
+        def over_limit():
+            if len(self._models) > self.max_resident:
+                return True
+            return self.memory_limit_mb > 0 and sum(self._sizes.values()) > self.memory_limit_mb
+
+        evicted = False
+        while len(self._models) > 1 and over_limit():
+            key = next(k for k in self._models if k != keep)
+            del self._models[key]
+            self._sizes.pop(key, None)
+            self._states[key] = 'evicted'
+            evicted = True
+            print(f"Evicted model {key[0]}/{key[1]} to stay within memory limits")
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def warm_up(self, model):
+        """Run one short synthesis so kernels and lazily built modules are initialised"""
+        model.generate(WARM_UP_TEXT)
+
+    def get(self, device, dtype=MODEL_DTYPE, warm_up=False):
+        device = resolve_device(device)
+        key = (device, dtype)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    return self._models[key]
+            start = time.time()
+            try:
+                self._set_state(key, 'loading')
+                model = load_model(device, dtype)
+                if warm_up:
+                    self._set_state(key, 'warming up')
+                    self.warm_up(model)
+            except Exception as e:
+                self._set_state(key, f'failed: {e}')
+                raise
+            with self._lock:
+                self._models[key] = model
+                self._sizes[key] = model_memory_mb(model)
+                self._states[key] = f'ready ({time.time() - start:.1f}s to load)'
+                self._evict(keep=key)
+            return model
+
+    def preload(self, device, dtype=MODEL_DTYPE):
+        """Load and warm up a variant on a background thread"""
+        def run():
+            try:
+                self.get(device, dtype, warm_up=True)
+            except Exception as e:
+                print(f"Model preload failed for {device}/{dtype}: {e}")
+
+        self._set_state((resolve_device(device), dtype), 'queued')
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self, device, dtype=MODEL_DTYPE):
+        with self._lock:
+            return (resolve_device(device), dtype) in self._models
+
+    def status(self):
+        """Human-readable readiness of every variant seen so far"""
+        with self._lock:
+            if not self._states:
+                return "No model loaded yet."
+            lines = []
+            for (device, dtype), state in self._states.items():
+                size = self._sizes.get((device, dtype))
+                suffix = f", {size:.0f} MB" if size else ""
+                lines.append(f"- {device}/{dtype}: {state}{suffix}")
+            return "\n".join(lines)
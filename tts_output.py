@@ -0,0 +1,265 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torchaudio as ta
+
+# Gap inserted between sentences, or overlap blended across sentence boundaries
+SILENCE_MS = int(os.environ.get('TTS_SILENCE_MS', '0'))
+CROSSFADE_MS = int(os.environ.get('TTS_CROSSFADE_MS', '0'))
+
+# Background sentence-file writers and how many files may wait for them
+WRITER_THREADS = int(os.environ.get('TTS_WRITER_THREADS', '2'))
+WRITER_QUEUE_SIZE = int(os.environ.get('TTS_WRITER_QUEUE_SIZE', '8'))
+
+# Container/codec for written audio, and whether sentence files are also written (the index locates sentences otherwise)
+OUTPUT_FORMAT = os.environ.get('TTS_OUTPUT_FORMAT', 'wav')
+SENTENCE_FILES = os.environ.get('TTS_SENTENCE_FILES', '0') == '1'
+
+# Fields of each entry in an article's .index.json
+INDEX_COLUMNS = ['index', 'start', 'length', 'start_s', 'duration_s', 'text']
+
+# format name: (soundfile format, subtype, file suffix)
+FORMATS = {
+    'wav': ('WAV', 'PCM_16', '.wav'),
+    'flac': ('FLAC', 'PCM_16', '.flac'),
+    'opus': ('OGG', 'OPUS', '.ogg'),
+    'mp3': ('MP3', 'MPEG_LAYER_III', '.mp3'),
+}
+
+
+def to_pcm16(samples):
+    """Convert float samples in [-1, 1] to little-endian 16-bit PCM bytes"""
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2').tobytes()
+
+
+def with_format(path, fmt=OUTPUT_FORMAT):
+    """``path`` with its suffix replaced by the one for ``fmt``"""
+    return str(Path(path).with_suffix(FORMATS[fmt][2]))
+
+
+def encode_audio(path, wav, sr, fmt=OUTPUT_FORMAT):
+    """Write a waveform (tensor or array) to ``path`` in a compressed ``fmt``"""
+    if hasattr(wav, 'detach'):
+        wav = wav.detach().cpu().numpy()
+    container, subtype, _ = FORMATS[fmt]
+    sf.write(path, np.asarray(wav, dtype=np.float32).reshape(-1), sr, format=container, subtype=subtype)
+
+
+def wav_stream_header(sr):
+    """Return a mono 16-bit WAV header with open-ended sizes, for audio streamed over HTTP"""
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 0xFFFFFFFF, b'WAVE', b'fmt ', 16, 1, 1,
+                       sr, sr * 2, 2, 16, b'data', 0xFFFFFFFF)
+
+
+class StreamingWavWriter:
+    """Append sentence waveforms to one mono audio file as they are generated.
+
+    Only the crossfade tail of the previous sentence is kept in memory, so peak
+    memory does not grow with the length of the document. WAV output is 16-bit
+    PCM whose RIFF header is written with placeholder sizes and patched on
+    close; other formats are encoded by a background thread so compression
+    stays off the generation path. The file suffix follows ``fmt``. The start,
+    length and text of every appended sentence are kept in ``offsets`` and
+    can be saved with ``write_index`` (read back with ``tts_index``).
+    """
+
+    def __init__(self, path, sr, silence_ms=SILENCE_MS, crossfade_ms=CROSSFADE_MS, fmt=OUTPUT_FORMAT):
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported output format {fmt!r}; choose one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.path = with_format(path, fmt)
+        self.sr = sr
+        self.silence_samples = int(sr * silence_ms / 1000)
+        self.crossfade_samples = int(sr * crossfade_ms / 1000)
+        self.frames = 0
+        self.segments = 0
+        self.offsets = []
+        self._tail = None
+        self._encoder = None
+        if fmt == 'wav':
+            self._wave = wave.open(self.path, 'wb')
+            self._wave.setnchannels(1)
+            self._wave.setsampwidth(2)
+            self._wave.setframerate(sr)
+        else:
+            container, subtype, _ = FORMATS[fmt]
+            self._wave = sf.SoundFile(self.path, 'w', samplerate=sr, channels=1, format=container, subtype=subtype)
+            self._blocks = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+            self._encode_error = None
+            self._encoder = threading.Thread(target=self._encode, daemon=True)
+            self._encoder.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _encode(self):
+        while True:
+            block = self._blocks.get()
+            if block is None:
+                break
+            if self._encode_error is None:
+                try:
+                    self._wave.write(block)
+                except Exception as e:
+                    self._encode_error = e
+
+    def _write(self, samples):
+        if len(samples):
+            if self._encoder is None:
+                self._wave.writeframesraw(to_pcm16(samples))
+            else:
+                self._blocks.put(samples)
+            self.frames += len(samples)
+
+    def append(self, wav, index=None, text=None):
+        """Append one waveform (tensor or array, any leading shape) as sentence ``index``"""
+        if hasattr(wav, 'detach'):
+            wav = wav.detach().cpu().numpy()
+        samples = np.asarray(wav, dtype=np.float32).reshape(-1)
+
+        if self.segments and self.silence_samples and not self.crossfade_samples:
+            self._write(np.zeros(self.silence_samples, dtype=np.float32))
+
+        fade = min(self.crossfade_samples, len(samples) // 2)
+        tail_length = len(self._tail) if self._tail is not None else 0
+        overlap = min(tail_length, fade)
+        # The sentence starts where it begins to fade in over the previous tail
+        start = self.frames + tail_length - overlap
+        if self._tail is not None:
+            if overlap:
+                ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+                samples = samples.copy()
+                samples[:overlap] = self._tail[-overlap:] * (1.0 - ramp) + samples[:overlap] * ramp
+            self._write(self._tail[:len(self._tail) - overlap])
+            self._tail = None
+
+        # Hold back the end of this sentence so the next one can fade into it
+        if fade:
+            self._write(samples[:-fade])
+            self._tail = samples[-fade:]
+        else:
+            self._write(samples)
+        self.offsets.append((self.segments if index is None else index, start, len(samples), text))
+        self.segments += 1
+
+    @property
+    def duration(self):
+        return self.frames / self.sr
+
+    @property
+    def index_path(self):
+        return str(Path(self.path).with_suffix('.index.json'))
+
+    def write_index(self):
+        """Save sample offsets, timing and text of every sentence next to the audio file"""
+        index = {
+            'file': os.path.basename(self.path),
+            'format': self.fmt,
+            'sample_rate': self.sr,
+            'frames': self.frames,
+            'columns': INDEX_COLUMNS,
+            'segments': [[i, start, length, round(start / self.sr, 3), round(length / self.sr, 3), text]
+                         for i, start, length, text in self.offsets],
+        }
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+        return self.index_path
+
+    def close(self):
+        if self._wave is None:
+            return
+        if self._tail is not None:
+            self._write(self._tail)
+            self._tail = None
+        if self._encoder is not None:
+            self._blocks.put(None)
+            self._encoder.join()
+        self._wave.close()  # WAV: patches the RIFF and data chunk sizes
+        self._wave = None
+        if self._encoder is not None and self._encode_error is not None:
+            raise RuntimeError(f"encoding {self.path} failed: {self._encode_error}")
+
+
+class AsyncAudioWriter:
+    """Save and encode sentence files on background threads while the next sentence generates.
+
+    ``submit`` blocks once ``max_pending`` files are queued, so generation
+    slows down instead of buffering unbounded audio when the disk falls
+    behind. ``close`` waits for every queued file and returns the
+    ``(path, error)`` pairs of the writes that failed. Each write is reported
+    to ``metrics`` (a ``tts_metrics.RunMetrics``) when one is given. Files
+    are written in ``fmt``; the suffix of submitted paths is adjusted to match.
+    """
+
+    def __init__(self, workers=WRITER_THREADS, max_pending=WRITER_QUEUE_SIZE, metrics=None, fmt=OUTPUT_FORMAT):
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported output format {fmt!r}; choose one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.errors = []
+        self.metrics = metrics
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            path, wav, sr = item
+            start = time.perf_counter()
+            error = None
+            try:
+                if self.fmt == 'wav':
+                    ta.save(path, wav, sr)
+                else:
+                    encode_audio(path, wav, sr, self.fmt)
+                with self._lock:
+                    self.written += 1
+            except Exception as e:
+                error = str(e)
+                with self._lock:
+                    self.errors.append((path, error))
+            finally:
+                if self.metrics is not None:
+                    self.metrics.record_write(path, time.perf_counter() - start, error)
+                self._queue.task_done()
+
+    def submit(self, path, wav, sr):
+        """Queue ``wav`` to be saved at ``path``; blocks while the queue is full. Returns the final path"""
+        if self._threads is None:
+            raise RuntimeError("AsyncAudioWriter is closed")
+        path = with_format(path, self.fmt)
+        self._queue.put((path, wav.detach().cpu(), sr))
+        return path
+
+    def close(self):
+        """Flush all queued files, stop the writer threads and return failed writes"""
+        if self._threads is not None:
+            for _ in self._threads:
+                self._queue.put(None)
+            for t in self._threads:
+                t.join()
+            self._threads = None
+        return self.errors
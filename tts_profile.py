@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+# Inference profile applied to every loaded model: 'default' leaves torch untouched
+PROFILE = os.environ.get('TTS_PROFILE', 'default')
+# cpu-fast options; quantization and compilation can be switched off or on separately
+PROFILE_QUANTIZE = os.environ.get('TTS_PROFILE_QUANTIZE', '1') != '0'
+PROFILE_COMPILE = os.environ.get('TTS_PROFILE_COMPILE', '0') == '1'
+
+def available_cpus():
+    """CPUs this process may run on (respects affinity and container cpusets, unlike os.cpu_count)"""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+PROFILES = {
+    'default': {},
+    'cpu-fast': {
+        'threads': available_cpus(),
+        # Decoding is one small op after another; inter-op parallelism only adds contention
+        'interop_threads': 1,
+        'quantize': PROFILE_QUANTIZE,
+        'compile': PROFILE_COMPILE,
+    },
+}
+
+REPORT_PATH = "/workspace/output/profile_report.json"
+COMPARE_OUTPUT_DIR = "/workspace/output/profile_compare"
+
+
+def _set_threads(threads, interop_threads):
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            pass  # can only be set before the first parallel op; a second model keeps the first setting
+
+
+def apply_profile(model, device, profile=PROFILE, threads=None):
+    """Tune a freshly loaded ChatterboxTTS for ``profile`` and return a description of what changed.
+
+    ``threads`` overrides the profile's thread count, e.g. for worker
+    processes that share the machine. Quantization replaces T3's Linear
+    layers with int8 dynamic-quantized ones and only applies on CPU.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"unknown profile {profile!r}; choose one of {', '.join(PROFILES)}")
+    settings = dict(PROFILES[profile])
+    if threads:
+        settings['threads'] = threads
+    applied = []
+
+    if settings.get('threads') or settings.get('interop_threads'):
+        _set_threads(settings.get('threads'), settings.get('interop_threads'))
+        applied.append(f"threads={torch.get_num_threads()}/{torch.get_num_interop_threads()}")
+
+    if settings.get('quantize') and device == 'cpu':
+        # T3 (the Llama decoder) runs once per speech token and dominates CPU time
+        torch.ao.quantization.quantize_dynamic(model.t3, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        applied.append("int8 dynamic quantization (t3)")
+
+    if settings.get('compile'):
+        try:
+            model.t3.tfmr = torch.compile(model.t3.tfmr, dynamic=True)
+            applied.append("torch.compile (t3 backbone)")
+        except Exception as e:
+            print(f"torch.compile unavailable, continuing without it: {e}")
+
+    model.profile = profile
+    return applied
+
+
+def _speaker_embedding(model, wav):
+    import librosa
+    from chatterbox.models.s3tokenizer import S3_SR
+
+    wav_16k = librosa.resample(wav, orig_sr=model.sr, target_sr=S3_SR)
+    embed = model.ve.embeds_from_wavs([wav_16k], sample_rate=S3_SR)
+    embed = np.asarray(embed).mean(axis=0)
+    return embed / (np.linalg.norm(embed) + 1e-9)
+
+
+def compare_profiles(sentences, profiles=('default', 'cpu-fast'), device='cpu', seed=0, reference=None):
+    """Generate the same sentences under each profile and measure speed and output quality.
+
+    Quality is compared against the first profile: total duration, loudness
+    and speaker similarity (cosine of voice-encoder embeddings, measured with
+    the first profile's model). Audio is kept for listening tests.
+    """
+    import torchaudio as ta
+    from chatterbox.tts import ChatterboxTTS
+    from tts_reference import prepare_reference
+    from tts_config import TTS_PARAMS, VOICE_CACHE
+
+    results = []
+    baseline_model = None
+    baseline_embeds = None
+    for profile in profiles:
+        start = time.time()
+        model = ChatterboxTTS.from_pretrained(device=device)
+        applied = apply_profile(model, device, profile)
+        load_s = time.time() - start
+        reference_audio = prepare_reference(reference) if reference else None
+        VOICE_CACHE.apply(model, reference_audio, TTS_PARAMS['exaggeration'])
+
+        out_dir = os.path.join(COMPARE_OUTPUT_DIR, profile)
+        os.makedirs(out_dir, exist_ok=True)
+        gen_s, audio_s, rms, wavs = 0.0, 0.0, [], []
+        for i, sentence in enumerate(sentences):
+            torch.manual_seed(seed)
+            t0 = time.time()
+            wav = model.generate(sentence, **TTS_PARAMS)
+            gen_s += time.time() - t0
+            samples = wav.detach().cpu().numpy().reshape(-1)
+            audio_s += len(samples) / model.sr
+            rms.append(float(np.sqrt(np.mean(samples ** 2))))
+            wavs.append(samples)
+            ta.save(os.path.join(out_dir, f'sentence_{i+1:03d}.wav'), wav, model.sr)
+        print(f"{profile}: {gen_s:.1f}s for {audio_s:.1f}s of audio ({', '.join(applied) or 'no changes'})")
+
+        if baseline_model is None:
+            baseline_model = model
+            baseline_embeds = [_speaker_embedding(model, w) for w in wavs]
+            similarity = 1.0
+        else:
+            embeds = [_speaker_embedding(baseline_model, w) for w in wavs]
+            similarity = float(np.mean([a @ b for a, b in zip(baseline_embeds, embeds)]))
+            del model
+
+        results.append({
+            'profile': profile,
+            'applied': applied,
+            'load_s': round(load_s, 2),
+            'generate_s': round(gen_s, 2),
+            'audio_s': round(audio_s, 2),
+            'rtf': round(gen_s / audio_s, 3) if audio_s else None,
+            'rms_db': round(20 * np.log10(np.mean(rms) + 1e-9), 2),
+            'speaker_similarity': round(similarity, 4),
+        })
+
+    base = results[0]
+    for r in results:
+        r['speedup'] = round(base['generate_s'] / r['generate_s'], 2) if r['generate_s'] else None
+        r['duration_ratio'] = round(r['audio_s'] / base['audio_s'], 3) if base['audio_s'] else None
+    return results
+
+
+def print_report(results):
+    print(f"\n{'profile':<10} {'RTF':>6} {'speedup':>8} {'gen s':>8} {'audio s':>8} "
+          f"{'dur ratio':>9} {'RMS dB':>7} {'spk sim':>8}")
+    for r in results:
+        print(f"{r['profile']:<10} {r['rtf']:>6} {r['speedup']:>8} {r['generate_s']:>8} {r['audio_s']:>8} "
+              f"{r['duration_ratio']:>9} {r['rms_db']:>7} {r['speaker_similarity']:>8}")
+
+
+def main():
+    from tts_cli import DEFAULT_TEXT_FILE, read_sentences
+
+    parser = argparse.ArgumentParser(description="Compare inference profiles on the same sentences.")
+    parser.add_argument('--text', default=DEFAULT_TEXT_FILE)
+    parser.add_argument('--sentences', type=int, default=5, help="number of sentences to generate per profile")
+    parser.add_argument('--profiles', nargs='+', default=['default', 'cpu-fast'], choices=sorted(PROFILES))
+    parser.add_argument('--reference', help="reference clip to clone (default voice otherwise)")
+    parser.add_argument('--output', default=REPORT_PATH, help="where to write the JSON report")
+    args = parser.parse_args()
+
+    sentences = read_sentences(args.text)[:args.sentences]
+    results = compare_profiles(sentences, args.profiles, reference=args.reference)
+    print_report(results)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'sentences': sentences, 'results': results}, f, indent=2)
+    print(f"Report saved to {args.output}; audio in {COMPARE_OUTPUT_DIR}/")
+
+
+if __name__ == "__main__":
+    main()
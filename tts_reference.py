@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+
+import librosa
+import numpy as np
+import torch
+from chatterbox.models.s3gen import S3GEN_SR
+from chatterbox.models.s3tokenizer import S3_SR
+from chatterbox.models.t3.modules.cond_enc import T3Cond
+from chatterbox.tts import Conditionals
+
+from tts_voice_cache import hash_file
+
+# Extra audio decoded past max_duration so leading silence can be trimmed away
+LEAD_ALLOWANCE_S = 5.0
+# Resampler for reference clips. soxr_mq is faster than librosa's soxr_hq default at a
+# slightly wider transition band; the clip only feeds the speaker embedding and prompt tokens
+RESAMPLE_TYPE = os.environ.get('TTS_RESAMPLE_TYPE', 'soxr_mq')
+
+
+class ReferenceAudioCache:
+    """In-memory LRU of prepared reference clips.
+
+    Files are identified by content hash; the hash itself is remembered per
+    (path, size, mtime) so repeated lookups of an unchanged file only stat it.
+    Prepared clips are mono float32 arrays at ``target_sr`` and never touch
+    the disk.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._hashes = {}
+        self._prepared = OrderedDict()
+        self._lock = threading.Lock()
+
+    def content_hash(self, audio_path):
+        st = os.stat(audio_path)
+        stat_key = (os.path.abspath(audio_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if stat_key in self._hashes:
+                return self._hashes[stat_key]
+        digest = hash_file(audio_path)
+        with self._lock:
+            self._hashes[stat_key] = digest
+        return digest
+
+    def prepare(self, audio_path, target_sr=S3GEN_SR, max_duration=10.0, top_db=20):
+        """Return the trimmed, length-capped reference clip at ``target_sr``"""
+        key = (self.content_hash(audio_path), target_sr, max_duration, top_db)
+        with self._lock:
+            if key in self._prepared:
+                self._prepared.move_to_end(key)
+                return self._prepared[key]
+
+        # Decode only the window that can survive trimming and the duration cap
+        audio, sr = librosa.load(audio_path, sr=None, mono=True, duration=max_duration + LEAD_ALLOWANCE_S)
+        audio_trimmed, _ = librosa.effects.trim(audio, top_db=top_db)
+        audio_trimmed = audio_trimmed[:int(max_duration * sr)]
+        if sr != target_sr:
+            audio_trimmed = librosa.resample(audio_trimmed, orig_sr=sr, target_sr=target_sr, res_type=RESAMPLE_TYPE)
+        audio_trimmed = np.ascontiguousarray(audio_trimmed, dtype=np.float32)
+
+        with self._lock:
+            self._prepared[key] = audio_trimmed
+            while len(self._prepared) > self.max_entries:
+                self._prepared.popitem(last=False)
+        return audio_trimmed
+
+
+REFERENCE_CACHE = ReferenceAudioCache()
+
+
+def prepare_reference(audio_path, target_sr=S3GEN_SR, max_duration=10.0, top_db=20):
+    """Prepare a reference clip for voice cloning through the shared in-memory cache"""
+    return REFERENCE_CACHE.prepare(audio_path, target_sr, max_duration, top_db)
+
+
+def build_conditionals(model, wav, exaggeration):
+    """Compute ChatterboxTTS conditionals from a prepared 24 kHz reference array.
+
+    Mirrors ``ChatterboxTTS.prepare_conditionals`` but takes the audio from
+    memory, so no temporary WAV is written and decoded again.
+    """
+    ref_16k_wav = librosa.resample(wav, orig_sr=S3GEN_SR, target_sr=S3_SR, res_type=RESAMPLE_TYPE)
+
+    s3gen_ref_wav = wav[:model.DEC_COND_LEN]
+    s3gen_ref_dict = model.s3gen.embed_ref(s3gen_ref_wav, S3GEN_SR, device=model.device)
+
+    # Speech cond prompt tokens
+    t3_cond_prompt_tokens = None
+    if plen := model.t3.hp.speech_cond_prompt_len:
+        t3_cond_prompt_tokens, _ = model.s3gen.tokenizer.forward([ref_16k_wav[:model.ENC_COND_LEN]], max_len=plen)
+        t3_cond_prompt_tokens = torch.atleast_2d(t3_cond_prompt_tokens).to(model.device)
+
+    # Voice-encoder speaker embedding
+    ve_embed = torch.from_numpy(model.ve.embeds_from_wavs([ref_16k_wav], sample_rate=S3_SR))
+    ve_embed = ve_embed.mean(axis=0, keepdim=True).to(model.device)
+
+    t3_cond = T3Cond(
+        speaker_emb=ve_embed,
+        cond_prompt_speech_tokens=t3_cond_prompt_tokens,
+        emotion_adv=exaggeration * torch.ones(1, 1, 1),
+    ).to(device=model.device)
+    return Conditionals(t3_cond, s3gen_ref_dict)
@@ -0,0 +1,206 @@
+import os
+import queue
+import threading
+import time
+
+# Sentences in one UI job, jobs one browser session may have queued, and jobs across all sessions
+MAX_SENTENCES = int(os.environ.get('TTS_UI_MAX_SENTENCES', '50'))
+MAX_JOBS_PER_SESSION = int(os.environ.get('TTS_UI_JOBS_PER_SESSION', '1'))
+MAX_JOBS = int(os.environ.get('TTS_UI_MAX_JOBS', '16'))
+# Each second a job waits counts as this many words less work left, so long jobs are not starved
+AGING_WORDS_PER_S = float(os.environ.get('TTS_UI_AGING', '0.5'))
+# A job whose page has stopped listening for this long is dropped
+ABANDON_S = 30
+# Generation speed assumed until the first sentence has been timed
+DEFAULT_SECONDS_PER_WORD = 1.0
+
+
+class SchedulerFull(Exception):
+    """Raised when a session, or the UI as a whole, already has as many jobs as allowed"""
+
+
+class JobCancelled(Exception):
+    """Raised inside decoding when the running job is cancelled"""
+
+
+def count_words(text):
+    return max(1, len(text.split()))
+
+
+class Job:
+    """One UI request: its sentences, progress and the results waiting for its page"""
+
+    def __init__(self, job_id, session, device, sentences, reference, params, voice):
+        self.id = job_id
+        self.session = session
+        self.device = device
+        self.sentences = sentences
+        self.reference = reference
+        self.params = params
+        self.voice = voice
+        self.next = 0
+        self.words_left = sum(count_words(s) for s in sentences)
+        self.submitted = time.monotonic()
+        self.last_seen = self.submitted
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.scheduler = None
+
+    def priority(self, now):
+        """Shortest remaining work first, aged by waiting time; lower runs sooner"""
+        return self.words_left - AGING_WORDS_PER_S * (now - self.submitted)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def events(self, poll_s=1.0):
+        """Yield ('waiting', position, eta_s) while queued or running and ('sentence', index, result)
+        for every finished sentence, where result is what the scheduler's generate function returned
+        or the exception it raised. Ends once every sentence is done or the job is cancelled.
+        """
+        while True:
+            self.last_seen = time.monotonic()
+            try:
+                event = self.results.get(timeout=poll_s)
+            except queue.Empty:
+                position, eta = self.scheduler.position(self)
+                if position is None:
+                    return
+                yield 'waiting', position, eta
+                continue
+            if event[0] == 'end':
+                return
+            yield event
+
+
+class SentenceScheduler:
+    """Run UI jobs on the shared model one sentence at a time, across all sessions.
+
+    A single dispatcher thread picks the next sentence from the job with the
+    least work left (in words, minus an allowance for time spent waiting), so
+    a short request overtakes a long one at the next sentence boundary instead
+    of waiting for it to finish. ``generate(job, index)`` does the model work
+    for one sentence; since only the dispatcher calls it, voice conditioning
+    on the shared model cannot be switched under a running sentence. A
+    cancelled or abandoned job is dropped before its next sentence, and
+    ``interruptible`` also stops the sentence being decoded.
+    """
+
+    def __init__(self, generate, max_jobs=MAX_JOBS, max_jobs_per_session=MAX_JOBS_PER_SESSION):
+        self._generate = generate
+        self.max_jobs = max_jobs
+        self.max_jobs_per_session = max_jobs_per_session
+        self.seconds_per_word = DEFAULT_SECONDS_PER_WORD
+        self.running = None
+        self._jobs = []
+        self._next_id = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, session, device, sentences, reference, params, voice='default'):
+        """Queue a job; raises SchedulerFull when the session or the UI is at its limit"""
+        with self._cond:
+            # Stopped or abandoned jobs must not count, even while a sentence of another job runs
+            self._drop_finished(time.monotonic())
+            if sum(job.session == session for job in self._jobs) >= self.max_jobs_per_session:
+                raise SchedulerFull("This session already has a request in progress; stop it or wait for it to finish.")
+            if len(self._jobs) >= self.max_jobs:
+                raise SchedulerFull(f"The server is busy ({len(self._jobs)} requests queued); try again shortly.")
+            self._next_id += 1
+            job = Job(self._next_id, session, device, list(sentences[:MAX_SENTENCES]), reference, params, voice)
+            job.scheduler = self
+            self._jobs.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name='sentence-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return job
+
+    def cancel_session(self, session):
+        """Cancel every job of a browser session (stop button or closed tab)"""
+        with self._cond:
+            for job in self._jobs:
+                if job.session == session:
+                    job.cancel()
+
+    def position(self, job):
+        """(jobs ahead of ``job``, estimated seconds until it finishes), or (None, None) once it has left the queue"""
+        with self._cond:
+            if job not in self._jobs:
+                return None, None
+            now = time.monotonic()
+            ranked = sorted(self._jobs, key=lambda j: (j.priority(now), j.id))
+            position = ranked.index(job)
+            # Jobs ranked ahead have less work left and finish first; later ones wait for this one
+            words = sum(j.words_left for j in ranked[:position]) + job.words_left
+            return position, words * self.seconds_per_word
+
+    def status(self):
+        with self._cond:
+            if not self._jobs:
+                return "Queue: idle"
+            running = self.running
+            line = f"Queue: {len(self._jobs)} requests, {sum(j.words_left for j in self._jobs)} words left"
+            if running is not None:
+                line += f" (running sentence {running.next}/{len(running.sentences)} of request {running.id})"
+            return line
+
+    def _drop_finished(self, now):
+        for job in list(self._jobs):
+            if job.cancelled.is_set() or now - job.last_seen > ABANDON_S:
+                self._jobs.remove(job)
+                job.cancel()
+                job.results.put(('end',))
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    self._drop_finished(time.monotonic())
+                    if self._jobs:
+                        break
+                    self._cond.wait()
+                now = time.monotonic()
+                job = min(self._jobs, key=lambda j: (j.priority(now), j.id))
+                index = job.next
+                job.next += 1
+                self.running = job
+
+            start = time.monotonic()
+            try:
+                result = self._generate(job, index)
+            except Exception as e:
+                result = e
+            elapsed = time.monotonic() - start
+            words = count_words(job.sentences[index])
+
+            with self._cond:
+                self.running = None
+                job.words_left -= words
+                if isinstance(result, JobCancelled) or job not in self._jobs:
+                    continue  # dropped on the next pass, or already dropped by submit
+                if not isinstance(result, Exception):
+                    self.seconds_per_word = 0.8 * self.seconds_per_word + 0.2 * elapsed / words
+                job.results.put(('sentence', index, result))
+                if job.next >= len(job.sentences):
+                    self._jobs.remove(job)
+                    job.results.put(('end',))
+
+
+def interruptible(model, scheduler):
+    """Stop decoding as soon as the scheduler's running job is cancelled.
+
+    Like the generation guard, this watches T3's speech embedding, which sees
+    every sampled token, and raises from inside decoding.
+    """
+    if getattr(model, 'scheduler', None) is scheduler:
+        return model
+
+    def check_cancelled(module, args):
+        job = scheduler.running
+        if job is not None and job.cancelled.is_set():
+            raise JobCancelled(f"request {job.id} cancelled")
+
+    model.t3.speech_emb.register_forward_pre_hook(check_cancelled)
+    model.scheduler = scheduler
+    return model
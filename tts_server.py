@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import torch
+
+from tts_config import (
+    TTS_PARAMS, VOICE_CACHE, get_audio_samples, prepare_reference_audio,
+)
+from tts_batching import generate_batched
+from tts_text import clean_text_for_tts
+from tts_output import to_pcm16, wav_stream_header
+from tts_models import load_model
+from tts_metrics import RunMetrics
+
+PORT = int(os.environ.get('TTS_SERVER_PORT', '8000'))
+# Requests admitted at once (queued or streaming); further requests get 503
+MAX_QUEUED_REQUESTS = int(os.environ.get('TTS_MAX_QUEUED_REQUESTS', '32'))
+# Micro-batching: sentences per batch and how long to wait for a batch to fill
+MAX_BATCH_SIZE = int(os.environ.get('TTS_MAX_BATCH_SIZE', '4'))
+MAX_WAIT_MS = int(os.environ.get('TTS_MAX_WAIT_MS', '20'))
+DEFAULT_DEADLINE_S = float(os.environ.get('TTS_DEFAULT_DEADLINE_S', '120'))
+
+
+class SynthesisRequest:
+    """One HTTP request: its sentences, generation settings, deadline and finished audio"""
+
+    def __init__(self, sentences, voice, params, deadline):
+        self.sentences = sentences
+        self.voice = voice
+        self.params = params
+        self.deadline = deadline
+        self.cancelled = False
+        self._results = {}
+        self._cond = threading.Condition()
+
+    def group_key(self):
+        """Sentences can share a batch only when voice and parameters match"""
+        return (self.voice, tuple(sorted(self.params.items())))
+
+    def expired(self):
+        return time.monotonic() > self.deadline
+
+    def set_result(self, index, wav):
+        with self._cond:
+            self._results[index] = wav
+            self._cond.notify_all()
+
+    def wait_result(self, index):
+        """Block until sentence ``index`` is ready; None if the deadline passes first"""
+        with self._cond:
+            while index not in self._results:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0 or self.cancelled:
+                    return None
+                self._cond.wait(remaining)
+            return self._results.pop(index)
+
+
+class MicroBatcher:
+    """Feed sentences from concurrent requests to the shared model in small batches.
+
+    A single thread owns the model. It waits up to ``max_wait_ms`` for up to
+    ``max_batch_size`` sentences, takes the ones that share the oldest
+    sentence's voice and parameters, and skips sentences whose request was
+    cancelled or ran past its deadline.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_queued_requests=MAX_QUEUED_REQUESTS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._slots = threading.BoundedSemaphore(max_queued_requests)
+        self._tasks = []
+        self._cond = threading.Condition()
+        self._references = {}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def pending(self):
+        with self._cond:
+            return len(self._tasks)
+
+    def submit(self, request):
+        """Queue a request's sentences; returns False when the request queue is full"""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._cond:
+            self._tasks.extend((request, i) for i in range(len(request.sentences)))
+            self._cond.notify()
+        return True
+
+    def release(self, request):
+        """Free the request's queue slot and drop any of its sentences still waiting"""
+        request.cancelled = True
+        self._slots.release()
+
+    def _reference(self, voice):
+        if voice is None:
+            return None
+        if voice not in self._references:
+            sample_path = available_voices()[voice]
+            self._references[voice] = prepare_reference_audio(sample_path)
+        return self._references[voice]
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._tasks:
+                self._cond.wait()
+            # Give concurrent requests a short window to join this batch
+            fill_deadline = time.monotonic() + self.max_wait
+            while len(self._tasks) < self.max_batch_size:
+                remaining = fill_deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            self._tasks = [t for t in self._tasks if not t[0].cancelled and not t[0].expired()]
+            if not self._tasks:
+                return []
+            key = self._tasks[0][0].group_key()
+            batch = [t for t in self._tasks if t[0].group_key() == key][:self.max_batch_size]
+            taken = {(id(req), i) for req, i in batch}
+            self._tasks = [t for t in self._tasks if (id(t[0]), t[1]) not in taken]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            request = batch[0][0]
+            try:
+                reference_audio = self._reference(request.voice)
+                VOICE_CACHE.apply(self.model, reference_audio, request.params['exaggeration'])
+                metrics = getattr(self.model, 'metrics', None)
+                if metrics is not None:
+                    metrics.voice = request.voice or 'default'
+                    metrics.params = request.params
+                texts = [req.sentences[i] for req, i in batch]
+                results = generate_batched(self.model, texts, len(texts), **request.params)
+                for (req, i), (_, wav) in zip(batch, results):
+                    req.set_result(i, wav)
+            except Exception as e:
+                for req, i in batch:
+                    req.set_result(i, e)
+
+
+def available_voices():
+    """Map voice names (audio sample file stems) to their sample paths"""
+    return {Path(p).stem: p for p in get_audio_samples()}
+
+
+class SynthesisHandler(BaseHTTPRequestHandler):
+    """HTTP endpoints: GET /health, GET /voices, POST /synthesize (chunked WAV response)"""
+
+    protocol_version = 'HTTP/1.1'
+    batcher = None
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def do_GET(self):
+        if self.path == '/health':
+            guard = self.batcher.model.guard
+            self._send_json(200, {'status': 'ok', 'pending_sentences': self.batcher.pending(),
+                                  'guard_triggers': len(guard.triggers) if guard is not None else 0})
+        elif self.path == '/voices':
+            self._send_json(200, {'voices': sorted(available_voices())})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/synthesize':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            text = body.get('text')
+            if not isinstance(text, str) or not text.strip():
+                raise ValueError("'text' must be a non-empty string")
+            voice = body.get('voice')
+            if voice is not None and voice not in available_voices():
+                raise ValueError(f"unknown voice: {voice}")
+            params = dict(TTS_PARAMS)
+            for key, value in (body.get('params') or {}).items():
+                if key not in TTS_PARAMS:
+                    raise ValueError(f"unknown parameter: {key}")
+                params[key] = float(value)
+            deadline_s = float(body.get('deadline_s', DEFAULT_DEADLINE_S))
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        sentences = clean_text_for_tts(text)
+        if not sentences:
+            self._send_json(400, {'error': 'no speakable sentences in text'})
+            return
+
+        request = SynthesisRequest(sentences, voice, params, time.monotonic() + deadline_s)
+        if not self.batcher.submit(request):
+            self._send_json(503, {'error': 'request queue full'}, {'Retry-After': '5'})
+            return
+        try:
+            self._stream(request)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away; release() below drops its remaining sentences
+        finally:
+            self.batcher.release(request)
+
+    def _stream(self, request):
+        """Send each sentence as a chunk of one WAV stream as soon as it is generated.
+
+        Failed sentences are skipped wherever they fall; the response only
+        becomes an error when no sentence produced audio before the deadline.
+        """
+        started = False
+        failures = []
+        for i in range(len(request.sentences)):
+            wav = request.wait_result(i)
+            if wav is None:
+                if not started:
+                    self._send_json(504, {'error': 'deadline exceeded before first sentence'})
+                    return
+                self.log_message("deadline exceeded after %d/%d sentences", i, len(request.sentences))
+                break
+            if isinstance(wav, Exception):
+                self.log_message("sentence %d failed: %s", i + 1, wav)
+                failures.append(str(wav))
+                continue
+            if not started:
+                self.send_response(200)
+                self.send_header('Content-Type', 'audio/wav')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('X-Sentence-Count', str(len(request.sentences)))
+                self.end_headers()
+                self._write_chunk(wav_stream_header(self.batcher.model.sr))
+                started = True
+            self._write_chunk(to_pcm16(wav.detach().cpu().numpy().reshape(-1)))
+        if not started:
+            self._send_json(500, {'error': f'generation failed: {failures[0]}'})
+            return
+        self._write_chunk(b'')
+
+
+def main():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Using device: {device}")
+    print("Loading Chatterbox TTS model...")
+    model = load_model(device)
+    RunMetrics('server').attach(model)
+
+    SynthesisHandler.batcher = MicroBatcher(model)
+    server = ThreadingHTTPServer(('0.0.0.0', PORT), SynthesisHandler)
+    print(f"Serving synthesis on http://0.0.0.0:{PORT} "
+          f"(batch {MAX_BATCH_SIZE}, wait {MAX_WAIT_MS} ms, queue {MAX_QUEUED_REQUESTS} requests)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
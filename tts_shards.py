@@ -0,0 +1,456 @@
+"""Render long documents as shards claimed by any number of workers on a shared volume.
+
+A job splits a document's sentences (no sentence cap) into fixed-size shards.
+Workers, in any number of processes or on any number of nodes that see the
+same ``TTS_SHARDS_DIR``, claim shards with lock files: a claim is a file
+created with O_EXCL naming its holder, refreshed after every sentence, and
+taken over once it has not been refreshed for ``TTS_SHARD_LEASE_S``. Every
+refresh first checks that the claim still names this worker, so a worker
+whose claim was taken over stops instead of rendering the shard twice. A
+finished shard is a WAV plus offset index, committed by a ``.done`` marker.
+Once every shard is done, one worker merges them in order into the complete
+article, writing it privately and moving it into place only while it still
+holds the merge claim.
+
+    <job>/job.json                      sentences, voice, params, seed, shard size
+    <job>/shard_0003.lock               claim (holder, claimed at); mtime is the heartbeat
+    <job>/shard_0003.<worker>.wav       shard audio and its .index.json
+    <job>/shard_0003.done               commit marker naming the finished file
+    <job>/complete_article.wav          merged article and its .index.json
+    <job>/.merge.<worker>/              merge in progress
+
+    python tts_shards.py submit book --text book.txt --voice female_american
+    python tts_shards.py work            # run on every node; exits when no work is left
+    python tts_shards.py status
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import time
+from pathlib import Path
+
+from tts_cli import DEFAULT_SAMPLES_DIR, find_audio_samples, read_sentences
+
+SHARDS_DIR = os.environ.get('TTS_SHARDS_DIR', '/workspace/output/shards')
+SHARD_SIZE = int(os.environ.get('TTS_SHARD_SIZE', '50'))
+# A claim not refreshed for this long belongs to a dead worker and is taken over
+SHARD_LEASE_S = float(os.environ.get('TTS_SHARD_LEASE_S', '900'))
+# How often an idle worker looks again for expired claims or a job ready to merge
+POLL_S = 15
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _expired(path):
+    """True when a claim file has not been refreshed within the lease (or is gone)"""
+    try:
+        return time.time() - os.stat(path).st_mtime > SHARD_LEASE_S
+    except FileNotFoundError:
+        return True
+
+
+def _holder(path):
+    """Worker named in a claim file; None if it is gone or still being written"""
+    try:
+        return _read_json(path).get('worker')
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _create_exclusive(path, data):
+    """Create ``path`` holding ``data`` unless it already exists; True if this call created it"""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return True
+
+
+def resolve_voice(voice, samples_dir=DEFAULT_SAMPLES_DIR):
+    """Absolute path of a voice given as a path or an audio_samples file stem; None for the default voice"""
+    if not voice:
+        return None
+    if os.path.exists(voice):
+        return os.path.abspath(voice)
+    for sample_path in find_audio_samples(samples_dir):
+        if Path(sample_path).stem == voice:
+            return os.path.abspath(sample_path)
+    raise ValueError(f"voice not found: {voice}")
+
+
+class ClaimLost(Exception):
+    """Raised when a claim this worker is still using has been taken over by another worker"""
+
+
+class ShardJob:
+    """One sharded document: its definition, shard claims and results"""
+
+    def __init__(self, job_dir):
+        self.dir = Path(job_dir)
+        self.name = self.dir.name
+        self.spec = _read_json(self.dir / 'job.json')
+        self.sentences = self.spec['sentences']
+        self.shard_size = self.spec['shard_size']
+        self.shards = (len(self.sentences) + self.shard_size - 1) // self.shard_size
+
+    @classmethod
+    def create(cls, name, sentences, voice_path, params, seed=None, shard_size=SHARD_SIZE, shards_dir=SHARDS_DIR):
+        """Write a new job; resubmitting the identical job returns the existing one"""
+        job_dir = Path(shards_dir) / name
+        spec = {'name': name, 'sentences': sentences, 'voice': voice_path, 'params': params,
+                'seed': seed, 'shard_size': shard_size}
+        if (job_dir / 'job.json').exists():
+            existing = _read_json(job_dir / 'job.json')
+            existing.pop('created', None)
+            if existing != spec:
+                raise ValueError(f"job {name} already exists with different text or settings")
+            return cls(job_dir)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        _write_json(job_dir / 'job.json', dict(spec, created=time.time()))
+        return cls(job_dir)
+
+    def shard_sentences(self, shard):
+        """(first sentence index, sentences) of one shard"""
+        first = shard * self.shard_size
+        return first, self.sentences[first:first + self.shard_size]
+
+    def _path(self, shard, suffix):
+        return self.dir / f"shard_{shard:04d}{suffix}"
+
+    def is_done(self, shard):
+        return self._path(shard, '.done').exists()
+
+    def claim(self, worker):
+        """Claim the first shard that is neither done nor held by a live worker; None if there is none"""
+        for shard in range(self.shards):
+            if self.is_done(shard):
+                continue
+            if self._acquire(self._path(shard, '.lock'), worker):
+                if self.is_done(shard):  # finished between the check and the claim
+                    self.release(shard, worker)
+                    continue
+                return shard
+        return None
+
+    def _acquire(self, lock_path, worker):
+        claim = {'worker': worker, 'claimed': time.time()}
+        if _create_exclusive(lock_path, claim):
+            return True
+        if not _expired(lock_path):
+            return False
+        # Move the stale claim aside; only one of several workers noticing it wins the rename
+        aside = Path(f"{lock_path}.expired.{worker}")
+        try:
+            os.rename(lock_path, aside)
+        except FileNotFoundError:
+            return _create_exclusive(lock_path, claim)  # released meanwhile
+        # The expiry check and the rename are not atomic: another worker may have taken over
+        # (or the holder refreshed) in between, so a claim that is fresh after all goes back
+        if not _expired(aside):
+            try:
+                os.link(aside, lock_path)
+            except FileExistsError:
+                pass  # claimed again meanwhile; the displaced holder stops at its next heartbeat
+            os.unlink(aside)
+            return False
+        holder = _holder(aside)
+        os.unlink(aside)
+        print(f"[{self.name}] Taking over {lock_path.name} from {holder}")
+        return _create_exclusive(lock_path, claim)
+
+    def _hold(self, lock_path, worker):
+        """Refresh a claim; raises ClaimLost when it no longer belongs to ``worker``"""
+        holder = _holder(lock_path)
+        if holder != worker:
+            raise ClaimLost(f"{lock_path.name} is held by {holder or 'nobody'}, not {worker}")
+        _touch(lock_path)
+
+    def heartbeat(self, shard, worker):
+        self._hold(self._path(shard, '.lock'), worker)
+
+    def _release(self, lock_path, worker):
+        """Drop ``worker``'s claim; a claim another worker has taken over is left alone"""
+        if _holder(lock_path) == worker:
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def release(self, shard, worker):
+        self._release(self._path(shard, '.lock'), worker)
+
+    def shard_file(self, shard, worker):
+        return str(self._path(shard, f".{worker}.wav"))
+
+    def commit(self, shard, worker, path, skipped, duration):
+        """Mark a shard finished with the file at ``path``; False if another worker committed first"""
+        committed = _create_exclusive(self._path(shard, '.done'), {
+            'file': os.path.basename(path), 'skipped': skipped, 'duration': duration})
+        self.release(shard, worker)
+        if not committed:
+            os.unlink(path)
+            os.unlink(Path(path).with_suffix('.index.json'))
+        return committed
+
+    def status(self):
+        """Counts of done, claimed and pending shards, and whether the job is merged"""
+        done = sum(self.is_done(s) for s in range(self.shards))
+        claimed = sum(not self.is_done(s) and self._path(s, '.lock').exists() for s in range(self.shards))
+        return {'shards': self.shards, 'done': done, 'claimed': claimed,
+                'pending': self.shards - done - claimed, 'merged': (self.dir / 'merge.done').exists()}
+
+    def merge(self, worker, keep_shards=False):
+        """Stitch every shard, in order, into the complete article; None unless this worker did it"""
+        from tts_index import ArticleReader
+        from tts_output import StreamingWavWriter
+
+        if (self.dir / 'merge.done').exists() or not all(self.is_done(s) for s in range(self.shards)):
+            return None
+        lock_path = self.dir / 'merge.lock'
+        if not self._acquire(lock_path, worker):
+            return None
+        print(f"[{self.name}] Merging {self.shards} shards...")
+        # Written privately, so a worker that loses the merge claim cannot clobber the article
+        merge_dir = self.dir / f".merge.{worker}"
+        merge_dir.mkdir(exist_ok=True)
+        writer = None
+        skipped = []
+        shard_files = []
+        try:
+            for shard in range(self.shards):
+                done = _read_json(self._path(shard, '.done'))
+                skipped.extend(done['skipped'])
+                shard_files.append(self.dir / done['file'])
+                reader = ArticleReader(shard_files[-1])
+                if writer is None:
+                    # Silence and crossfades between sentences are applied here, not in the shards
+                    writer = StreamingWavWriter(merge_dir / 'complete_article.wav', reader.sr)
+                for seg in reader:
+                    writer.append(reader.sentence(seg.index).astype('float32') / 32768.0,
+                                  index=seg.index, text=seg.text)
+                self._hold(lock_path, worker)
+            writer.close()
+            writer.write_index()
+            self._hold(lock_path, worker)
+        except ClaimLost as e:
+            print(f"[{self.name}] Merge taken over by another worker ({e})")
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(merge_dir, ignore_errors=True)
+            return None
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(merge_dir, ignore_errors=True)
+            self._release(lock_path, worker)
+            if (self.dir / 'merge.done').exists():
+                return None  # merged (and its shards removed) by the worker that took over
+            raise
+        article = self.dir / os.path.basename(writer.path)
+        os.replace(writer.index_path, article.with_suffix('.index.json'))
+        os.replace(writer.path, article)
+        merge_dir.rmdir()
+        _write_json(self.dir / 'merge.done', {'file': article.name, 'duration': writer.duration,
+                                              'sentences': writer.segments, 'skipped': skipped})
+        self._release(lock_path, worker)
+        if not keep_shards:
+            for path in shard_files:
+                path.unlink()
+                path.with_suffix('.index.json').unlink()
+        print(f"[{self.name}] Complete audio saved to {article} ({writer.duration:.1f}s, "
+              f"{writer.segments}/{len(self.sentences)} sentences)")
+        return str(article)
+
+
+def list_jobs(shards_dir=SHARDS_DIR, names=None):
+    if not os.path.isdir(shards_dir):
+        return []
+    dirs = [Path(shards_dir) / n for n in names] if names else sorted(Path(shards_dir).iterdir())
+    return [ShardJob(d) for d in dirs if (d / 'job.json').exists()]
+
+
+def render_shard(model, job, shard, worker, voice_state):
+    """Generate one claimed shard into its own WAV; returns True once it is committed"""
+    import torch
+    from tts_config import VOICE_CACHE, prepare_reference_audio
+    from tts_output import StreamingWavWriter
+
+    first, sentences = job.shard_sentences(shard)
+    params = job.spec['params']
+    if voice_state.get('job') != job.name:
+        reference_audio = prepare_reference_audio(job.spec['voice']) if job.spec['voice'] else None
+        VOICE_CACHE.apply(model, reference_audio, params['exaggeration'])
+        voice_state['job'] = job.name
+        metrics = getattr(model, 'metrics', None)
+        if metrics is not None:
+            metrics.voice = Path(job.spec['voice']).stem if job.spec['voice'] else 'default'
+            metrics.params = dict(params, job=job.name)
+
+    print(f"[{job.name}] Shard {shard + 1}/{job.shards}: sentences {first + 1}-{first + len(sentences)}")
+    skipped = []
+    # Plain concatenation; the merge step adds the configured silence or crossfade
+    writer = StreamingWavWriter(job.shard_file(shard, worker), model.sr, silence_ms=0, crossfade_ms=0, fmt='wav')
+    try:
+        for offset, sentence in enumerate(sentences):
+            i = first + offset
+            try:
+                if job.spec['seed'] is not None:
+                    torch.manual_seed(job.spec['seed'])
+                wav = model.generate(sentence, **params)
+                writer.append(wav, index=i, text=sentence)
+            except Exception as e:
+                print(f"[{job.name}] Error processing sentence {i + 1}: {e}")
+                skipped.append(i)
+            job.heartbeat(shard, worker)
+    except ClaimLost as e:
+        writer.close()
+        os.unlink(writer.path)
+        print(f"[{job.name}] Dropping shard {shard + 1}: {e}")
+        return False
+    except BaseException:
+        writer.close()
+        os.unlink(writer.path)
+        job.release(shard, worker)
+        raise
+    writer.close()
+    writer.write_index()
+    return job.commit(shard, worker, writer.path, skipped, writer.duration)
+
+
+def work(jobs, device=None, wait=True, keep_shards=False):
+    """Claim and render shards of ``jobs`` until all are merged (or, without ``wait``, none is claimable)"""
+    worker = worker_name()
+    model = None
+    metrics = None
+    voice_state = {}
+    rendered = 0
+    try:
+        while True:
+            progressed = False
+            for job in jobs:
+                shard = job.claim(worker)
+                if shard is not None:
+                    if model is None:
+                        import torch
+                        from tts_metrics import RunMetrics
+                        from tts_models import load_model
+
+                        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+                        print(f"Worker {worker}: loading Chatterbox TTS model on {device}...")
+                        model = load_model(device)
+                        metrics = RunMetrics('shards', run_id=f"{time.strftime('%Y%m%d_%H%M%S')}_{worker}")
+                        metrics.attach(model)
+                    if render_shard(model, job, shard, worker, voice_state):
+                        rendered += 1
+                    progressed = True
+                    break  # look for work from the first job again
+                if job.merge(worker, keep_shards) is not None:
+                    progressed = True
+            if progressed:
+                continue
+            busy = [job for job in jobs if not job.status()['merged']]
+            if not busy or not wait:
+                break
+            time.sleep(POLL_S)
+    finally:
+        print(f"Worker {worker}: rendered {rendered} shards")
+        if model is not None and model.guard is not None:
+            print(model.guard.report())
+        if metrics is not None:
+            metrics.finish(shards=rendered)
+    return rendered
+
+
+def print_status(jobs):
+    if not jobs:
+        print(f"No sharded jobs in {SHARDS_DIR}")
+    for job in jobs:
+        s = job.status()
+        state = 'merged' if s['merged'] else f"{s['done']}/{s['shards']} shards done, {s['claimed']} in progress"
+        print(f"{job.name:<24} {len(job.sentences):>6} sentences  {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard a long document across workers on a shared volume.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    submit = sub.add_parser('submit', help="split a text file into a new sharded job")
+    submit.add_argument('name')
+    submit.add_argument('--text', required=True, help="input text file")
+    submit.add_argument('--voice', help="reference clip path or audio_samples file stem (default voice otherwise)")
+    submit.add_argument('--shard-size', type=int, default=SHARD_SIZE, help="sentences per shard")
+    worker = sub.add_parser('work', help="claim and render shards until the jobs are merged")
+    worker.add_argument('jobs', nargs='*', help="job names (default: every job)")
+    worker.add_argument('--device')
+    worker.add_argument('--no-wait', action='store_true',
+                        help="exit once nothing is claimable instead of waiting for other workers")
+    worker.add_argument('--keep-shards', action='store_true', help="keep shard files after merging")
+    status = sub.add_parser('status')
+    status.add_argument('jobs', nargs='*')
+    merge = sub.add_parser('merge', help="merge a finished job (workers do this on their own)")
+    merge.add_argument('name')
+    merge.add_argument('--keep-shards', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'submit':
+        from tts_config import SEED, TTS_PARAMS
+
+        if not os.path.isfile(args.text):
+            print(f"Text input file not found: {args.text}")
+            return 1
+        sentences = read_sentences(args.text)
+        if not sentences:
+            print(f"No speakable text in {args.text}")
+            return 1
+        try:
+            job = ShardJob.create(args.name, sentences, resolve_voice(args.voice), TTS_PARAMS, SEED, args.shard_size)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Job {job.name}: {len(sentences)} sentences in {job.shards} shards of {job.shard_size} ({job.dir})")
+    elif args.command == 'work':
+        jobs = list_jobs(names=args.jobs)
+        if not jobs:
+            print(f"No sharded jobs in {SHARDS_DIR}")
+            return 1
+        work(jobs, args.device, wait=not args.no_wait, keep_shards=args.keep_shards)
+    elif args.command == 'status':
+        print_status(list_jobs(names=args.jobs))
+    elif args.command == 'merge':
+        job = ShardJob(Path(SHARDS_DIR) / args.name)
+        if job.merge(worker_name(), args.keep_shards) is None:
+            s = job.status()
+            print(f"Job {job.name} not merged: {s['done']}/{s['shards']} shards done"
+                  + (", already merged" if s['merged'] else ", or another worker is merging it"))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
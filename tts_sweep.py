@@ -0,0 +1,305 @@
+"""Compare TTS parameter settings on a few sentences instead of rendering whole articles.
+
+Points come from a grid (``--grid temperature=0.5,0.7,0.9 cfg_weight=0.5,0.7``)
+or from random search over ranges (``--random 12 --range temperature=0.4:1.0``);
+parameters not swept keep their TTS_PARAMS value. One loaded model and the
+voice conditioning are shared by every point a worker runs, generated
+sentences go through the sentence cache (so repeated or overlapping sweeps
+only generate new settings), and ``--workers`` runs points in parallel
+processes. Each point's sentences are saved as one file for listening, and a
+table of RTF and audio statistics per setting is printed and saved as JSON.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from tts_config import SEED, TTS_PARAMS, VOICE_CACHE
+from tts_audio_cache import SentenceAudioCache, model_variant
+from tts_output import StreamingWavWriter
+from tts_workers import threads_per_worker
+
+SWEEP_OUTPUT_DIR = "/workspace/output/sweep"
+# Generation time per sentence cache key and machine setup (device, profile, torch threads),
+# so points served from the cache still report an RTF comparable with fresh ones
+TIMINGS_PATH = os.path.join(SWEEP_OUTPUT_DIR, 'timings.json')
+SILENCE_DB = -45.0
+FRAME_S = 0.05
+
+
+def parse_grid(specs):
+    """{'name': [values]} from ``name=v1,v2,...`` arguments"""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in TTS_PARAMS:
+            raise ValueError(f"unknown parameter {name!r}; choose from {', '.join(TTS_PARAMS)}")
+        grid[name] = [float(v) for v in values.split(',') if v]
+        if not grid[name]:
+            raise ValueError(f"no values given for {name}")
+    return grid
+
+
+def parse_ranges(specs):
+    """{'name': (low, high)} from ``name=low:high`` arguments"""
+    ranges = {}
+    for spec in specs:
+        name, _, bounds = spec.partition('=')
+        if name not in TTS_PARAMS:
+            raise ValueError(f"unknown parameter {name!r}; choose from {', '.join(TTS_PARAMS)}")
+        low, _, high = bounds.partition(':')
+        ranges[name] = (float(low), float(high))
+    return ranges
+
+
+def grid_points(grid, base=TTS_PARAMS):
+    names = list(grid)
+    return [dict(base, **dict(zip(names, values))) for values in itertools.product(*grid.values())]
+
+
+def random_points(ranges, count, seed=0, base=TTS_PARAMS):
+    rng = random.Random(seed)
+    return [dict(base, **{name: round(rng.uniform(low, high), 3) for name, (low, high) in ranges.items()})
+            for _ in range(count)]
+
+
+def audio_stats(samples, sr):
+    """Duration, loudness, peak, clipping and silence share of one waveform"""
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    frame = int(sr * FRAME_S)
+    frames = samples[:len(samples) // frame * frame].reshape(-1, frame) if len(samples) >= frame else samples[None]
+    frame_db = 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-9)
+    return {
+        'duration_s': len(samples) / sr,
+        'rms_db': float(20 * np.log10(np.sqrt(np.mean(samples ** 2)) + 1e-9)),
+        'peak_db': float(20 * np.log10(np.max(np.abs(samples)) + 1e-9)),
+        'clipped': float(np.mean(np.abs(samples) >= 0.999)),
+        'silence': float(np.mean(frame_db < SILENCE_DB)),
+    }
+
+
+def run_point(model, cache, sentences, params, ref_hash, seed):
+    """Generate (or fetch from the cache) every sentence at one setting.
+
+    Returns the waveforms and a (timing key, generation seconds or None when
+    cached) pair per sentence; the timing key is the cache key qualified by
+    the device, inference profile and torch thread count it was timed on.
+    """
+    variant = model_variant(model)
+    setup = f"{model.device}|{variant['profile']}|{torch.get_num_threads()}"
+    wavs, timings = [], []
+    for sentence in sentences:
+        key = cache.key(sentence, ref_hash, params, seed, variant)
+        wav = cache.get(key)
+        elapsed = None
+        if wav is None:
+            if seed is not None:
+                torch.manual_seed(seed)
+            start = time.perf_counter()
+            wav = model.generate(sentence, **params)
+            elapsed = time.perf_counter() - start
+            cache.put(key, wav)
+        wavs.append(wav)
+        timings.append((f"{setup}|{key}", elapsed))
+    return wavs, timings
+
+
+def _prepare(device, reference, exaggeration_values, threads=None):
+    """Load a model and build the voice conditioning once per exaggeration value"""
+    from tts_models import load_model
+    from tts_reference import prepare_reference
+    from tts_voice_cache import hash_audio
+
+    model = load_model(device, threads=threads)
+    reference_audio = prepare_reference(reference, max_duration=10.0, top_db=20) if reference else None
+    for exaggeration in sorted(set(exaggeration_values)):
+        VOICE_CACHE.apply(model, reference_audio, exaggeration)
+    ref_hash = hash_audio(reference_audio) if reference_audio is not None else 'default'
+    return model, reference_audio, ref_hash
+
+
+def _finish_point(point_id, params, wavs, timings, sr, out_dir):
+    """Write the point's audio and return its result record"""
+    path = os.path.join(out_dir, f'point_{point_id:03d}.wav')
+    with StreamingWavWriter(path, sr) as writer:
+        for i, wav in enumerate(wavs):
+            writer.append(wav, index=i)
+    samples = np.concatenate([wav.detach().cpu().numpy().reshape(-1) for wav in wavs])
+    return {'point': point_id, 'params': params, 'file': writer.path, 'timings': timings,
+            **audio_stats(samples, sr)}
+
+
+def _worker_main(worker_id, device, threads, reference, sentences, seed, out_dir, points, results):
+    """Run sweep points from the queue with one model and shared conditioning"""
+    torch.set_num_threads(threads)
+    try:
+        model, reference_audio, ref_hash = _prepare(device, reference, [], threads)
+    except Exception as e:
+        results.put(('failed', worker_id, str(e)))
+        return
+    cache = SentenceAudioCache()
+    while True:
+        item = points.get()
+        if item is None:
+            break
+        point_id, params = item
+        try:
+            VOICE_CACHE.apply(model, reference_audio, params['exaggeration'])
+            wavs, timings = run_point(model, cache, sentences, params, ref_hash, seed)
+            results.put(('done', worker_id, _finish_point(point_id, params, wavs, timings, model.sr, out_dir)))
+        except Exception as e:
+            results.put(('done', worker_id, {'point': point_id, 'params': params, 'error': str(e)}))
+    results.put(('exit', worker_id))
+
+
+def run_sweep(points, sentences, reference=None, device='cpu', workers=1, seed=SEED, out_dir=None):
+    """Run every point and return the result records, in point order"""
+    seed = 0 if seed is None else seed  # settings are only comparable on the same random stream
+    out_dir = out_dir or os.path.join(SWEEP_OUTPUT_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(out_dir, exist_ok=True)
+    # Points sharing an exaggeration run back to back and reuse its conditioning
+    order = sorted(range(len(points)), key=lambda i: points[i]['exaggeration'])
+    records = []
+
+    if workers <= 1:
+        model, reference_audio, ref_hash = _prepare(device, reference, [p['exaggeration'] for p in points])
+        cache = SentenceAudioCache()
+        for n, i in enumerate(order, 1):
+            VOICE_CACHE.apply(model, reference_audio, points[i]['exaggeration'])
+            wavs, timings = run_point(model, cache, sentences, points[i], ref_hash, seed)
+            records.append(_finish_point(i + 1, points[i], wavs, timings, model.sr, out_dir))
+            print(f"Point {n}/{len(points)} done")
+        print(cache.report())
+    else:
+        ctx = mp.get_context('spawn')
+        point_queue = ctx.Queue()
+        result_queue = ctx.Queue()
+        for i in order:
+            point_queue.put((i + 1, points[i]))
+        for _ in range(workers):
+            point_queue.put(None)
+        threads = threads_per_worker(workers)
+        print(f"Starting {workers} workers with {threads} torch threads each for {len(points)} points...")
+        processes = [ctx.Process(target=_worker_main, args=(w, device, threads, reference, sentences, seed,
+                                                            out_dir, point_queue, result_queue))
+                     for w in range(workers)]
+        for p in processes:
+            p.start()
+        exited = set()
+        while len(exited) < workers:
+            try:
+                message = result_queue.get(timeout=5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes):
+                    print("All workers stopped before finishing the sweep.")
+                    break
+                continue
+            kind, worker_id = message[0], message[1]
+            if kind == 'failed':
+                print(f"Worker {worker_id} could not load model: {message[2]}")
+                exited.add(worker_id)
+            elif kind == 'done':
+                records.append(message[2])
+                print(f"[worker {worker_id}] point {message[2]['point']} done ({len(records)}/{len(points)})")
+            elif kind == 'exit':
+                exited.add(worker_id)
+        for p in processes:
+            p.join(timeout=30)
+
+    return _apply_timings(sorted(records, key=lambda r: r['point']))
+
+
+def _apply_timings(records):
+    """Fill in RTF from this run's generation times and those remembered from earlier sweeps"""
+    known = {}
+    if os.path.exists(TIMINGS_PATH):
+        with open(TIMINGS_PATH, 'r', encoding='utf-8') as f:
+            known = json.load(f)
+    keys = {}
+    for record in records:
+        timings = record.pop('timings', [])
+        known.update({key: elapsed for key, elapsed in timings if elapsed is not None})
+        keys[record['point']] = [key for key, _ in timings]
+        record['cached'] = sum(elapsed is None for _, elapsed in timings)
+    for record in records:
+        if 'error' in record:
+            continue
+        seconds = [known.get(key) for key in keys[record['point']]]
+        record['rtf'] = round(sum(seconds) / record['duration_s'], 3) \
+            if None not in seconds and record['duration_s'] else None
+    os.makedirs(os.path.dirname(TIMINGS_PATH), exist_ok=True)
+    with open(TIMINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(known, f)
+    return records
+
+
+def print_table(records, swept, sort_by=None):
+    """One row per setting: swept parameters, RTF and audio statistics"""
+    rows = [r for r in records if 'error' not in r]
+    if sort_by:
+        rows.sort(key=lambda r: (r.get(sort_by) is None, r.get(sort_by) or 0))
+    header = f"{'#':>4} " + ' '.join(f"{name[:11]:>11}" for name in swept)
+    print(f"\n{header} {'RTF':>7} {'audio s':>8} {'RMS dB':>7} {'peak dB':>8} {'clip %':>7} {'silence %':>9} {'cached':>6}")
+    for r in rows:
+        rtf = f"{r['rtf']:.3f}" if r['rtf'] is not None else '-'
+        values = ' '.join(f"{r['params'][name]:>11.3f}" for name in swept)
+        print(f"{r['point']:>4} {values} {rtf:>7} {r['duration_s']:>8.1f} {r['rms_db']:>7.1f} {r['peak_db']:>8.1f} "
+              f"{100 * r['clipped']:>7.2f} {100 * r['silence']:>9.1f} {r['cached']:>6}")
+    for r in records:
+        if 'error' in r:
+            print(f"Point {r['point']} failed: {r['error']}")
+
+
+def main():
+    from tts_cli import DEFAULT_TEXT_FILE, read_sentences
+
+    parser = argparse.ArgumentParser(description="Sweep TTS parameters over a few sentences and compare the results.")
+    parser.add_argument('--grid', nargs='+', default=[], metavar='NAME=V1,V2', help="values to try per parameter")
+    parser.add_argument('--random', type=int, metavar='N', help="random search: N points drawn from --range")
+    parser.add_argument('--range', nargs='+', default=[], metavar='NAME=LOW:HIGH', dest='ranges')
+    parser.add_argument('--seed', type=int, default=0, help="random search seed")
+    parser.add_argument('--text', default=DEFAULT_TEXT_FILE)
+    parser.add_argument('--sentences', type=int, default=3, help="first N sentences of the text")
+    parser.add_argument('--reference', help="reference clip to clone (default voice otherwise)")
+    parser.add_argument('--device', default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument('--workers', type=int, default=1, help="points run in parallel processes")
+    parser.add_argument('--sort', choices=['rtf', 'rms_db', 'peak_db', 'clipped', 'silence', 'duration_s'])
+    args = parser.parse_args()
+
+    try:
+        if args.random:
+            points = random_points(parse_ranges(args.ranges), args.random, args.seed)
+            swept = [name for name in TTS_PARAMS if name in parse_ranges(args.ranges)]
+        else:
+            points = grid_points(parse_grid(args.grid))
+            swept = [name for name in TTS_PARAMS if name in parse_grid(args.grid)]
+    except ValueError as e:
+        print(e)
+        return 1
+    if args.reference and not os.path.exists(args.reference):
+        print(f"Reference audio file not found: {args.reference}")
+        return 1
+    sentences = read_sentences(args.text)[:args.sentences]
+    print(f"Sweeping {len(points)} settings of {', '.join(swept) or 'nothing (defaults only)'} "
+          f"over {len(sentences)} sentences")
+
+    out_dir = os.path.join(SWEEP_OUTPUT_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    records = run_sweep(points, sentences, args.reference, args.device, args.workers, out_dir=out_dir)
+    print_table(records, swept, args.sort)
+    report_path = os.path.join(out_dir, 'results.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'sentences': sentences, 'reference': args.reference, 'swept': swept, 'results': records}, f, indent=2)
+    print(f"Results saved to {report_path}; audio per setting in {out_dir}/")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+import os
+import re
+
+# Chunk sizing. Lengths are in characters, or in estimated tokens with TTS_CHUNK_UNIT=tokens
+CHUNK_UNIT = os.environ.get('TTS_CHUNK_UNIT', 'chars')
+CHUNK_TARGET = int(os.environ.get('TTS_CHUNK_TARGET', '250'))
+CHUNK_MAX = int(os.environ.get('TTS_CHUNK_MAX', '400'))
+CHUNK_MIN = int(os.environ.get('TTS_CHUNK_MIN', '40'))
+
+# Typical narration pace, used to estimate audio length before synthesis
+WORDS_PER_SECOND = 2.5
+
+# Sentences the processing scripts synthesize per run; 0 removes the cap (tts_shards never applies it)
+SENTENCE_LIMIT = int(os.environ.get('TTS_SENTENCE_LIMIT', '25'))
+
+# Words that end with a period without ending the sentence
+ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'ft', 'vs', 'etc', 'no', 'nos',
+    'fig', 'approx', 'dept', 'est', 'inc', 'ltd', 'co', 'corp', 'gen', 'col', 'lt', 'sgt', 'capt',
+    'rev', 'gov', 'sen', 'rep', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept',
+    'oct', 'nov', 'dec', 'e.g', 'i.e', 'a.m', 'p.m', 'u.s', 'u.k', 'ph.d', 'vol', 'ch', 'p', 'pp',
+}
+
+# Sentence-final punctuation, optionally followed by closing quotes or brackets
+_BOUNDARY = re.compile(r'[.!?]+["\'”’)\]]*(?=\s)')
+_LAST_WORD = re.compile(r'(\S+)$')
+_CLAUSE = re.compile(r'(?<=[,;:—])\s+')
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+# A paragraph with no boundary this long is flushed as one sentence and split later
+_MAX_BUFFER = 4000
+
+
+def text_length(text, unit=CHUNK_UNIT):
+    """Length of ``text`` in characters, or in word/punctuation tokens"""
+    if unit == 'tokens':
+        return len(_TOKEN.findall(text))
+    return len(text)
+
+
+def _is_boundary(prefix, punct, next_char):
+    if next_char.islower():
+        return False
+    if '.' not in punct or punct.strip('.') or len(punct.rstrip('"\'”’)]')) > 1:
+        return True  # '!', '?', ellipses and quoted endings always close the sentence
+    match = _LAST_WORD.search(prefix)
+    word = match.group(1).lstrip('"\'(“‘[') if match else ''
+    if word.lower() in ABBREVIATIONS:
+        return False
+    if len(word) == 1 and word.isupper() and word != 'I':
+        return False  # an initial, as in "J. R. R. Tolkien"
+    return True
+
+
+def _terminate(sentence):
+    sentence = sentence.strip()
+    if sentence and not re.search(r'[.!?]["\'”’)\]]*$', sentence):
+        sentence += '.'
+    return sentence
+
+
+def _split_buffer(buffer, final):
+    """Split complete sentences off the front of ``buffer``; returns (sentences, remainder)"""
+    sentences = []
+    start = 0
+    for m in _BOUNDARY.finditer(buffer):
+        rest = buffer[m.end():].lstrip()
+        if not rest:
+            break  # the next sentence's first character is needed to decide
+        if _is_boundary(buffer[start:m.start()], m.group(), rest[0]):
+            sentences.append(buffer[start:m.end()].strip())
+            start = m.end()
+    remainder = buffer[start:].lstrip()
+    if final and remainder.strip():
+        sentences.append(_terminate(remainder))
+        remainder = ''
+    return sentences, remainder
+
+
+def iter_sentences(lines):
+    """Yield sentences from an iterable of text lines without reading all of it first.
+
+    Line breaks inside a paragraph are treated as spaces. Blank lines end a
+    paragraph, so headings and datelines without punctuation become their own
+    sentences instead of being glued to the next one; a markdown heading is a
+    paragraph of its own even without blank lines around it, and loses its
+    ``#`` markers. Abbreviations, initials and decimals do not end a sentence.
+    """
+    buffer = ''
+    for line in lines:
+        line = line.rstrip('\r\n')
+        heading = re.match(r'\s*#+\s*', line)
+        if heading or not line.strip():
+            sentences, buffer = _split_buffer(buffer, final=True)
+            yield from sentences
+            if heading and line[heading.end():].strip():
+                yield _terminate(line[heading.end():])
+            continue
+        buffer = f"{buffer} {line.strip()}" if buffer else line.strip()
+        sentences, buffer = _split_buffer(buffer, final=len(buffer) > _MAX_BUFFER)
+        yield from sentences
+    sentences, _ = _split_buffer(buffer, final=True)
+    yield from sentences
+
+
+def split_long_sentence(sentence, max_length=CHUNK_MAX, unit=CHUNK_UNIT):
+    """Split a sentence longer than ``max_length`` at clause punctuation, then at spaces"""
+    if text_length(sentence, unit) <= max_length:
+        return [sentence]
+    pieces = []
+    for clause in _CLAUSE.split(sentence):
+        if text_length(clause, unit) <= max_length:
+            pieces.append(clause)
+        else:
+            pieces.extend(clause.split())
+    parts = []
+    current = ''
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if current and text_length(candidate, unit) > max_length:
+            parts.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def iter_chunks(lines, target_length=CHUNK_TARGET, max_length=CHUNK_MAX, min_length=CHUNK_MIN, unit=CHUNK_UNIT):
+    """Yield synthesis chunks packed from consecutive sentences.
+
+    Sentences are joined until a chunk reaches ``target_length``; a chunk
+    shorter than ``min_length`` keeps absorbing sentences up to
+    ``max_length``, so short fragments are merged rather than dropped and
+    the model is called fewer times. Only one chunk is held back at a time.
+    """
+    previous = None
+    current = ''
+    for sentence in iter_sentences(lines):
+        for piece in split_long_sentence(sentence, max_length, unit):
+            if not current:
+                current = piece
+                continue
+            candidate = f"{current} {piece}"
+            size = text_length(candidate, unit)
+            if size <= target_length or (text_length(current, unit) < min_length and size <= max_length):
+                current = candidate
+                continue
+            if previous is not None:
+                yield previous
+            previous, current = current, piece
+
+    if current:
+        if (previous is not None and text_length(current, unit) < min_length
+                and text_length(f"{previous} {current}", unit) <= max_length):
+            previous = f"{previous} {current}"
+        else:
+            if previous is not None:
+                yield previous
+            previous = current
+    if previous is not None:
+        yield previous
+
+
+def chunk_text(text, **kwargs):
+    """Split a whole text into synthesis chunks; see ``iter_chunks`` for the options"""
+    return list(iter_chunks(text.splitlines(), **kwargs))
+
+
+def clean_text_for_tts(text):
+    """Clean and prepare text for TTS processing"""
+    return chunk_text(text)
+
+
+def estimate_duration(sentences, words_per_second=WORDS_PER_SECOND):
+    """Rough audio length in seconds for the given sentences at narration pace"""
+    return sum(len(sentence.split()) for sentence in sentences) / words_per_second
+
+
+def limit_sentences(sentences, limit=SENTENCE_LIMIT):
+    """The first ``limit`` sentences (all of them when ``limit`` is 0), noting any that are dropped"""
+    if limit and len(sentences) > limit:
+        print(f"Synthesizing the first {limit} of {len(sentences)} sentences "
+              f"(set TTS_SENTENCE_LIMIT=0 or use tts_shards.py for the whole text)")
+        return sentences[:limit]
+    return sentences
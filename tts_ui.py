@@ -1,60 +1,119 @@
 import os
 import gradio as gr
-import torch
-import torchaudio as ta
 import tempfile
-import time
 from datetime import datetime
 from pathlib import Path
-from chatterbox.tts import ChatterboxTTS
-import librosa
 import numpy as np
+import tts_reference
+from tts_voice_cache import hash_audio
+from tts_config import VOICE_CACHE
+from tts_output import StreamingWavWriter
+from tts_text import chunk_text
+from tts_models import ModelRegistry, resolve_device
+from tts_metrics import RunMetrics
+from tts_scheduler import MAX_JOBS, MAX_SENTENCES, SchedulerFull, SentenceScheduler, interruptible
 
-MODEL_CACHE = {}
+MODEL_REGISTRY = ModelRegistry()
+METRICS = RunMetrics('ui')
+
+# Streaming plays each sentence as soon as it is ready; full file waits for the whole article
+OUTPUT_MODES = ["Stream sentences", "Full file"]
+
+# Device loaded and warmed up when the app starts, before the first click
+PRELOAD_DEVICE = os.environ.get('TTS_PRELOAD_DEVICE', 'auto')
 
 def get_model(device):
-    if 'model' not in MODEL_CACHE:
-        MODEL_CACHE['model'] = ChatterboxTTS.from_pretrained(device=device)
-    return MODEL_CACHE['model']
+    return METRICS.attach(MODEL_REGISTRY.get(device))
+
+
+def generate_sentence(job, index):
+    """Generate one sentence of a UI request on the shared model; runs on the scheduler thread"""
+    model = interruptible(get_model(job.device), SCHEDULER)
+    VOICE_CACHE.apply(model, job.reference, job.params['exaggeration'])
+    METRICS.voice = job.voice
+    METRICS.params = job.params
+    seen = len(model.guard.triggers) if model.guard is not None else 0
+    wav = model.generate(job.sentences[index], **job.params)
+    return wav, model.guard.triggers[seen:] if model.guard is not None else []
+
+
+# Sentences from all sessions share the model, shortest request first
+SCHEDULER = SentenceScheduler(generate_sentence)
+
+
+def stop_session(request: gr.Request):
+    """Cancel this browser session's request (stop button, or the tab was closed)"""
+    if request is not None:
+        SCHEDULER.cancel_session(request.session_hash)
+
+
+def model_status():
+    return "### Model status\n" + MODEL_REGISTRY.status() + "\n\n" + SCHEDULER.status()
 
 
 def prepare_reference(audio_file, target_sr=24000, max_duration=12.0):
     if not audio_file:
         return None, None
     try:
-        y, sr = librosa.load(audio_file, sr=None)
-        y_trim, _ = librosa.effects.trim(y, top_db=25)
-        max_samples = int(max_duration * sr)
-        if len(y_trim) > max_samples:
-            y_trim = y_trim[:max_samples]
-        if sr != target_sr:
-            y_trim = librosa.resample(y_trim, orig_sr=sr, target_sr=target_sr)
-        ref_path = Path(tempfile.gettempdir()) / f"ref_{int(time.time()*1000)}.wav"
-        ta.save(str(ref_path), torch.from_numpy(y_trim).unsqueeze(0), target_sr)
-        return str(ref_path), f"Reference OK. Duration: {len(y_trim)/target_sr:.2f}s"
+        # Prepared in memory and cached by file content; nothing is written to disk
+        y_trim = tts_reference.prepare_reference(audio_file, target_sr=target_sr, max_duration=max_duration, top_db=25)
+        return y_trim, f"Reference OK. Duration: {len(y_trim)/target_sr:.2f}s"
     except Exception as e:
         return None, f"Reference processing failed: {e}"
 
 
-def generate_tts(text, reference_audio, repetition_penalty, min_p, top_p, temperature, exaggeration, cfg_weight, sentence_limit, device_select):
-    device = device_select if device_select in ("cuda", "cpu") else ("cuda" if torch.cuda.is_available() else "cpu")
-    model = get_model(device)
+def purge_legacy_reference_files():
+    """Remove ref_<ms>.wav files that earlier versions left in the temp directory"""
+    for path in Path(tempfile.gettempdir()).glob('ref_*.wav'):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def to_stream_chunk(wav, sr):
+    """Convert a generated waveform to the (sr, int16 array) chunk a streaming gr.Audio plays"""
+    samples = np.clip(wav.detach().cpu().numpy().reshape(-1), -1.0, 1.0)
+    return sr, (samples * 32767).astype(np.int16)
+
+
+def generate_tts(text, reference_audio, repetition_penalty, min_p, top_p, temperature, exaggeration, cfg_weight, sentence_limit, device_select, output_mode=OUTPUT_MODES[0], request: gr.Request = None):
+    """Generate speech sentence by sentence, yielding (live chunk, full file, logs, run files).
+
+    In streaming mode every sentence is pushed to the live player as soon as it
+    is generated; in full-file mode only the finished article is returned.
+    Sentences are run by the shared scheduler; while waiting, the log shows the
+    queue position and estimated time to finish. Leaving the generator (stop
+    button or disconnect) cancels the request.
+    """
+    streaming = output_mode == OUTPUT_MODES[0]
+    device = resolve_device(device_select)
 
     if not text or len(text.strip()) < 2:
-        return None, "Provide some input text.", None
+        yield gr.update(), None, "Provide some input text.", None
+        return
+
+    if not MODEL_REGISTRY.is_ready(device):
+        yield gr.update(), None, f"Waiting for the {device} model to load...", None
+    try:
+        model = get_model(device)
+    except Exception as e:
+        yield gr.update(), None, f"Model load failed on {device}: {e}", None
+        return
 
-    # Basic sentence splitting (reuse simple logic)
-    import re
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip()+'.' for s in sentences if s.strip()]
+    # Same length-aware chunking as the batch scripts
+    sentences = chunk_text(text)
     if sentence_limit:
         sentences = sentences[:sentence_limit]
+    if not sentences:
+        yield gr.update(), None, "No speakable text in the input.", None
+        return
 
     # Reference audio
-    ref_path = None
+    ref_audio = None
     ref_status = "Using default voice (no reference provided)."
     if reference_audio is not None:
-        ref_path, ref_status = prepare_reference(reference_audio)
+        ref_audio, ref_status = prepare_reference(reference_audio)
 
     params = dict(
         repetition_penalty=repetition_penalty,
@@ -63,36 +122,67 @@ def generate_tts(text, reference_audio, repetition_penalty, min_p, top_p, temper
         temperature=temperature,
         exaggeration=exaggeration,
         cfg_weight=cfg_weight,
-        audio_prompt_path=ref_path
     )
+    # Uploaded voices are labelled by content so repeated uploads aggregate together
+    voice = f"upload_{hash_audio(ref_audio)[:8]}" if ref_audio is not None else 'default'
+    session = request.session_hash if request is not None else 'local'
+    try:
+        job = SCHEDULER.submit(session, device, sentences, ref_audio, params, voice)
+    except SchedulerFull as e:
+        yield gr.update(), None, str(e), None
+        return
 
-    all_audio = []
     sr = model.sr
-    logs = [f"Device: {device}", ref_status, f"Sentences: {len(sentences)}"]
-    for i, sent in enumerate(sentences, 1):
-        try:
-            wav = model.generate(sent, **params)
-            all_audio.append(wav)
-            logs.append(f"[OK] {i}: {sent[:60]}")
-        except Exception as e:
-            logs.append(f"[ERR] {i}: {e}")
-
-    if not all_audio:
-        return None, "No audio generated.\n" + '\n'.join(logs), '\n'.join(logs)
-
-    combined = torch.cat(all_audio, dim=-1)
     ts = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
     run_dir = Path('/workspace/output/ui_runs/run_' + ts)
     run_dir.mkdir(parents=True, exist_ok=True)
     out_path = run_dir / 'complete_article.wav'
-    ta.save(str(out_path), combined, sr)
+    writer = StreamingWavWriter(out_path, sr)
+
+    logs = [f"Device: {device}", ref_status, f"Sentences: {len(job.sentences)}", f"Mode: {output_mode}"]
+    yield gr.update(), gr.update(), '\n'.join(logs), gr.update()
+    try:
+        for event in job.events():
+            if event[0] == 'waiting':
+                _, position, eta = event
+                progress = f"Queue position {position + 1}" if position else "Generating"
+                yield gr.update(), gr.update(), '\n'.join(logs + [f"{progress}, about {eta:.0f}s to finish"]), gr.update()
+                continue
+            _, index, result = event
+            i, sent = index + 1, job.sentences[index]
+            wav = None
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                wav, triggers = result
+                writer.append(wav, index=index, text=sent)
+                logs.append(f"[OK] {i}: {sent[:60]}")
+                for t in triggers:
+                    logs.append(f"[GUARD] {i}: {t['reason']} at {t['seconds']:.1f}s (attempt {t['attempt'] + 1})")
+            except Exception as e:
+                logs.append(f"[ERR] {i}: {e}")
+                wav = None
+            if streaming:
+                chunk = to_stream_chunk(wav, sr) if wav is not None else gr.update()
+                yield chunk, gr.update(), '\n'.join(logs), gr.update()
+    finally:
+        job.cancel()
+        writer.close()
+        METRICS.event('ui_run', run_dir=str(run_dir), sentences=writer.segments, audio_s=round(writer.duration, 3))
+
+    out_path = Path(writer.path)
+    if not writer.segments:
+        out_path.unlink(missing_ok=True)
+        yield gr.update(), None, "No audio generated.\n" + '\n'.join(logs), '\n'.join(logs)
+        return
 
     # Provide logs and path listing
     listing = []
-    for p in run_dir.glob('*.wav'):
+    writer.write_index()
+    for p in sorted(run_dir.iterdir()):
         listing.append(str(p))
     logs.append(f"Saved: {out_path}")
-    return str(out_path), '\n'.join(logs), '\n'.join(listing)
+    yield gr.update(), str(out_path), '\n'.join(logs), '\n'.join(listing)
 
 with gr.Blocks(title="Chatterbox Multi-Voice TTS") as demo:
     gr.Markdown("# Chatterbox Multi-Voice TTS\nUpload a reference voice (optional) and generate speech from text. Tune parameters for experimentation.")
@@ -101,9 +191,14 @@ with gr.Blocks(title="Chatterbox Multi-Voice TTS") as demo:
         with gr.Column(scale=2):
             text_input = gr.Textbox(label="Input Text", lines=8, placeholder="Paste text to synthesize...")
             reference_audio = gr.Audio(label="Reference Voice (optional)", type="filepath")
-            sentence_limit = gr.Slider(1, 50, value=25, step=1, label="Sentence Limit")
+            sentence_limit = gr.Slider(1, MAX_SENTENCES, value=min(25, MAX_SENTENCES), step=1, label="Sentence Limit")
             device_select = gr.Radio(["auto", "cpu", "cuda"], value="auto", label="Device")
-            run_btn = gr.Button("Generate", variant="primary")
+            output_mode = gr.Radio(OUTPUT_MODES, value=OUTPUT_MODES[0], label="Output Mode")
+            with gr.Row():
+                run_btn = gr.Button("Generate", variant="primary")
+                stop_btn = gr.Button("Stop", variant="stop")
+            status_box = gr.Markdown(model_status())
+            status_btn = gr.Button("Refresh Model Status", size="sm")
 
         with gr.Column():
             gr.Markdown("### TTS Parameters")
@@ -115,16 +210,26 @@ with gr.Blocks(title="Chatterbox Multi-Voice TTS") as demo:
             cfg_weight = gr.Slider(0.0, 2.0, value=0.7, step=0.05, label="CFG Weight")
 
     with gr.Row():
+        stream_audio = gr.Audio(label="Live Playback", streaming=True, autoplay=True)
         output_audio = gr.Audio(label="Generated Audio", type="filepath")
         log_box = gr.Textbox(label="Logs", lines=14)
         file_list = gr.Textbox(label="Run Files", lines=14)
 
-    run_btn.click(
+    run_event = run_btn.click(
         fn=generate_tts,
-        inputs=[text_input, reference_audio, repetition_penalty, min_p, top_p, temperature, exaggeration, cfg_weight, sentence_limit, device_select],
-        outputs=[output_audio, log_box, file_list]
+        inputs=[text_input, reference_audio, repetition_penalty, min_p, top_p, temperature, exaggeration, cfg_weight, sentence_limit, device_select, output_mode],
+        outputs=[stream_audio, output_audio, log_box, file_list]
     )
+    run_event.then(fn=model_status, outputs=status_box)
+    stop_btn.click(fn=stop_session, cancels=[run_event])
+    demo.unload(stop_session)
+    status_btn.click(fn=model_status, outputs=status_box)
+    demo.load(fn=model_status, outputs=status_box)
 
 if __name__ == "__main__":
+    purge_legacy_reference_files()
+    MODEL_REGISTRY.preload(PRELOAD_DEVICE)
+    # Requests wait in the sentence scheduler, not in Gradio's queue, so every one gets a slot
+    demo.queue(default_concurrency_limit=MAX_JOBS)
     # Bind to 0.0.0.0 for tailnet exposure
     demo.launch(server_name="0.0.0.0", server_port=7860, show_error=True)
\ No newline at end of file
@@ -0,0 +1,124 @@
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from chatterbox.tts import Conditionals
+
+DEFAULT_CACHE_DIR = "/workspace/output/.cache/conditionals"
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_audio(wav):
+    """Return the sha256 hex digest of a prepared reference array"""
+    return hashlib.sha256(wav.tobytes()).hexdigest()
+
+
+def hash_reference(reference):
+    """Content hash of a reference given as a file path or a prepared array"""
+    if isinstance(reference, (str, os.PathLike)):
+        return hash_file(reference)
+    return hash_audio(reference)
+
+
+class VoiceConditioningCache:
+    """LRU cache of model conditionals keyed by reference content hash and exaggeration.
+
+    Building conditionals decodes the reference clip and runs the speaker and
+    speech-token encoders, so it is done once per (reference, exaggeration)
+    and the result is assigned to ``model.conds`` before generating. A
+    reference is either a file path or a prepared 24 kHz array from
+    ``tts_reference.prepare_reference``. Entries in memory are kept per model
+    device, since conditionals built for a cuda model cannot drive a cpu one.
+    Pass ``cache_dir`` to also persist entries across runs (loaded onto
+    whichever device asks); at most ``max_disk_entries`` files are kept there.
+    """
+
+    def __init__(self, max_entries=8, cache_dir=None, max_disk_entries=64):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, reference, exaggeration, device=None):
+        key = f"{hash_reference(reference)}_{float(exaggeration):.4f}"
+        return f"{key}_{device}" if device is not None else key
+
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.pt"
+
+    def _store(self, key, conds):
+        self._entries[key] = conds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = sorted(self.cache_dir.glob('*.pt'), key=lambda p: p.stat().st_mtime)
+        for path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            path.unlink(missing_ok=True)
+
+    def get(self, model, reference, exaggeration):
+        """Return conditionals for a reference, building them only on a miss"""
+        disk_key = self.key(reference, exaggeration)
+        key = f"{disk_key}_{model.device}"  # same form as key(..., device)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        if self.cache_dir and self._disk_path(disk_key).exists():
+            try:
+                conds = Conditionals.load(self._disk_path(disk_key), map_location='cpu').to(model.device)
+                os.utime(self._disk_path(disk_key))
+                self._store(key, conds)
+                self.hits += 1
+                return conds
+            except Exception as e:
+                print(f"Could not load cached conditionals {key}: {e}")
+
+        self.misses += 1
+        if isinstance(reference, (str, os.PathLike)):
+            model.prepare_conditionals(reference, exaggeration=exaggeration)
+            conds = model.conds
+        else:
+            from tts_reference import build_conditionals  # tts_reference imports this module
+            conds = build_conditionals(model, reference, exaggeration)
+        self._store(key, conds)
+
+        if self.cache_dir:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = self._disk_path(disk_key).with_suffix(f'.{os.getpid()}.tmp')
+                conds.save(tmp_path)
+                os.replace(tmp_path, self._disk_path(disk_key))
+                self._evict_disk()
+            except Exception as e:
+                print(f"Could not save conditionals {key}: {e}")
+
+        return conds
+
+    def apply(self, model, reference, exaggeration):
+        """Point ``model.conds`` at the cached conditionals for ``reference``.
+
+        With no reference the model's built-in voice (remembered on the model
+        as ``_default_conds``) is restored, so a cached voice never leaks into
+        a later default-voice request.
+        """
+        if not hasattr(model, '_default_conds'):
+            model._default_conds = model.conds
+        if reference is not None:
+            model.conds = self.get(model, reference, exaggeration)
+        else:
+            model.conds = model._default_conds
+        return model.conds
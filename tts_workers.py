@@ -0,0 +1,142 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+
+import torch
+import torchaudio as ta
+
+from tts_audio_cache import SentenceAudioCache, generate_cached
+from tts_models import load_model
+from tts_profile import available_cpus
+from tts_metrics import RunMetrics
+from tts_frontend import open_frontend
+from tts_reference import prepare_reference
+from tts_voice_cache import VoiceConditioningCache, DEFAULT_CACHE_DIR
+
+# Number of worker processes for multi-voice runs; 1 keeps the serial loop
+WORKERS = int(os.environ.get('TTS_WORKERS', '1'))
+
+
+def threads_per_worker(num_workers):
+    """Split the CPUs this process may use evenly between workers"""
+    return max(1, available_cpus() // num_workers)
+
+
+def _worker_main(worker_id, device, num_threads, params, seed, jobs, results):
+    """Load a private model and generate (voice, sentence) jobs until a sentinel arrives"""
+    torch.set_num_threads(num_threads)
+    start = time.time()
+    try:
+        model = load_model(device, threads=num_threads)
+        guard = model.guard
+        metrics = RunMetrics(f'multi_worker{worker_id}')
+        metrics.attach(model)
+        metrics.params = params
+        # Every voice speaks the same sentences, so each is tokenized once per worker
+        frontend = open_frontend(model)
+    except Exception as e:
+        results.put(('failed', worker_id, str(e)))
+        return
+    results.put(('ready', worker_id, time.time() - start))
+
+    voice_cache = VoiceConditioningCache(cache_dir=DEFAULT_CACHE_DIR)
+    sentence_cache = SentenceAudioCache()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        sample_name, sample_path, ref_hash, index, sentence, output_path = job
+        start = time.time()
+        metrics.voice = sample_name
+        try:
+            reference_audio = prepare_reference(sample_path, max_duration=10.0, top_db=20)
+            voice_cache.apply(model, reference_audio, params['exaggeration'])
+            wav = generate_cached(model, sentence_cache, sentence, params, ref_hash, seed)
+            ta.save(output_path, wav, model.sr)
+            results.put(('done', worker_id, sample_name, index, wav.shape[-1] / model.sr, time.time() - start, None))
+        except Exception as e:
+            results.put(('done', worker_id, sample_name, index, 0.0, time.time() - start, str(e)))
+    triggers = guard.triggers if guard is not None else []
+    metrics.finish(cache_hits=sentence_cache.hits, cache_misses=sentence_cache.misses,
+                   text_tokens_reused=frontend.hits if frontend is not None else 0)
+    results.put(('exit', worker_id, sentence_cache.hits, sentence_cache.misses, triggers))
+
+
+def run_worker_pool(jobs, num_workers, device, params, seed=None):
+    """Spread ``(sample_name, sample_path, ref_hash, index, sentence, output_path)`` jobs over workers.
+
+    Each worker loads its own ChatterboxTTS and pulls jobs from a shared queue,
+    so voices and sentences are balanced across processes. Returns a dict
+    mapping ``(sample_name, index)`` to None on success or an error message.
+    """
+    ctx = mp.get_context('spawn')
+    job_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    for _ in range(num_workers):
+        job_queue.put(None)
+
+    num_threads = threads_per_worker(num_workers)
+    print(f"Starting {num_workers} workers with {num_threads} torch threads each for {len(jobs)} jobs...")
+    workers = [
+        ctx.Process(target=_worker_main, args=(w, device, num_threads, params, seed, job_queue, result_queue))
+        for w in range(num_workers)
+    ]
+    for p in workers:
+        p.start()
+
+    outcomes = {}
+    stats = {w: {'sentences': 0, 'failed': 0, 'audio': 0.0, 'busy': 0.0, 'load': 0.0, 'hits': 0, 'misses': 0}
+             for w in range(num_workers)}
+    exited = set()
+    triggers = []
+    started = time.time()
+    while len(exited) < num_workers:
+        try:
+            message = result_queue.get(timeout=5)
+        except queue.Empty:
+            if not any(p.is_alive() for p in workers):
+                print("All workers stopped before finishing the job queue.")
+                break
+            continue
+
+        kind, worker_id = message[0], message[1]
+        if kind == 'ready':
+            stats[worker_id]['load'] = message[2]
+            print(f"Worker {worker_id} loaded model in {message[2]:.1f}s")
+        elif kind == 'failed':
+            print(f"Worker {worker_id} could not load model: {message[2]}")
+            exited.add(worker_id)
+        elif kind == 'done':
+            _, _, sample_name, index, audio_seconds, elapsed, error = message
+            outcomes[(sample_name, index)] = error
+            stats[worker_id]['busy'] += elapsed
+            if error:
+                stats[worker_id]['failed'] += 1
+                print(f"[worker {worker_id}] {sample_name} sentence {index+1} failed: {error}")
+            else:
+                stats[worker_id]['sentences'] += 1
+                stats[worker_id]['audio'] += audio_seconds
+                print(f"[worker {worker_id}] {sample_name} sentence {index+1} done ({len(outcomes)}/{len(jobs)})")
+        elif kind == 'exit':
+            stats[worker_id]['hits'], stats[worker_id]['misses'] = message[2], message[3]
+            triggers.extend(message[4])
+            exited.add(worker_id)
+
+    for p in workers:
+        p.join(timeout=30)
+
+    wall = time.time() - started
+    print(f"\nWorker throughput ({wall:.1f}s wall clock):")
+    for w, s in stats.items():
+        rate = s['sentences'] / s['busy'] * 60 if s['busy'] else 0.0
+        rtf = s['busy'] / s['audio'] if s['audio'] else 0.0
+        print(f"  worker {w}: {s['sentences']} sentences ({s['failed']} failed), "
+              f"{s['audio']:.1f}s audio, {rate:.1f} sentences/min, RTF {rtf:.2f}, "
+              f"load {s['load']:.1f}s, cache {s['hits']} hits/{s['misses']} misses")
+    print(f"Generation guard: {len(triggers)} triggers across workers")
+    for t in triggers:
+        print(f"  - {t['reason']} at {t['seconds']:.1f}s, attempt {t['attempt'] + 1}: {t['text']}")
+    return outcomes